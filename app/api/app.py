@@ -0,0 +1,32 @@
+from typing import Optional
+
+from fastapi import FastAPI
+
+from app.api.container import Container, build_container
+from app.api.errors import add_error_handlers
+from app.api.responses import LeanJSONResponse
+from app.api.routes import router, internal_router
+from app.settings import Settings
+
+
+def create_app(settings: Optional[Settings] = None, container: Optional[Container] = None) -> FastAPI:
+    """
+    container is built from settings unless it is passed, e.g. with in-memory repos
+    """
+    settings = settings or Settings()
+    app = FastAPI(title='auth-service', default_response_class=LeanJSONResponse)
+    app.include_router(router)
+    if settings.internal_endpoints_enabled:
+        app.include_router(internal_router)
+    add_error_handlers(app)
+
+    @app.on_event('startup')
+    async def startup():
+        app.state.container = container or build_container(settings)
+        await app.state.container.start()
+
+    @app.on_event('shutdown')
+    async def shutdown():
+        await app.state.container.stop()
+
+    return app
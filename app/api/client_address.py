@@ -0,0 +1,37 @@
+import ipaddress
+from typing import Iterable, Optional
+
+FORWARDED_FOR_HEADER = 'x-forwarded-for'
+
+
+class ClientAddressResolver:
+    """
+    Address of the client for the per-address login limit.
+
+    Behind load balancers the peer is the balancer, so X-Forwarded-For is used when the peer is one of
+    trusted_proxies (addresses or networks). The client is the rightmost address not added by a trusted proxy,
+    everything to the left of it can be forged by the client.
+    Without trusted proxies the header is ignored, as it is when uvicorn already applied --proxy-headers.
+    """
+
+    def __init__(self, trusted_proxies: Iterable[str] = ()):
+        self._trusted_networks = [ipaddress.ip_network(proxy, strict=False) for proxy in trusted_proxies]
+
+    def _is_trusted(self, address: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(ip in network for network in self._trusted_networks)
+
+    def resolve(self, peer: Optional[str], forwarded_for: Optional[str]) -> Optional[str]:
+        if peer is None or not forwarded_for or not self._is_trusted(peer):
+            return peer
+
+        addresses = [address.strip() for address in forwarded_for.split(',') if address.strip()]
+        for address in reversed(addresses):
+            if not self._is_trusted(address):
+                return address
+
+        # the whole chain is trusted proxies
+        return addresses[0] if addresses else peer
@@ -0,0 +1,224 @@
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.api.client_address import ClientAddressResolver
+from app.common_lib.errors import InternalError
+from app.common_lib.executor import PoolAsyncExecutor, ProcessPoolAsyncExecutor, bind_executor
+from app.common_lib.instrumentation import instrument
+from app.common_lib.invalidation import IInvalidationBus, LocalInvalidationBus, UnixSocketInvalidationBus
+from app.common_lib.keyring import KeyRing, key_from_pem
+from app.common_lib.loop_monitor import LoopMonitor
+from app.common_lib.mail import EmailQueue, SMTPEmailSender
+from app.common_lib.metrics import metrics
+from app.db.memory.store import EmbeddedStore
+from app.db.odm.client import get_database, close_clients
+from app.db.odm.indexes import ensure_indexes
+from app.db.repositories.cached_user import CachingUserAuthRepo
+from app.db.repositories.rate_limit import MongoRateLimiter
+from app.db.repositories.session import MongoSessionRepo
+from app.db.repositories.user import MongoUserAuthRepo
+from app.db.repositories.verification_code import MongoVerificationCodeRepo
+from app.domain.models.tokens import revocation_list, key_ring
+from app.domain.models.user import PasswordHashingPolicy, MIN_CALIBRATED_BCRYPT_ROUNDS
+from app.domain.services.introspection import TokenIntrospectionService
+from app.domain.services.login_throttler import LoginThrottler, EMAIL_LOGIN_RULE, ADDRESS_LOGIN_RULE
+from app.domain.services.session import SessionService
+from app.domain.services.session_sweeper import SessionSweeper
+from app.domain.services.user import UserService
+from app.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+# in the invalidation socket directory, the worker holding it runs the session sweeps of the node
+SWEEPER_LOCK_FILE = 'session-sweeper.lock'
+
+
+@dataclass
+class Container:
+    """
+    Process wide singletons, built once and shared by all requests
+    """
+    executor: PoolAsyncExecutor
+    email_queue: EmailQueue
+    user_service: UserService
+    session_service: SessionService
+    introspection_service: Optional[TokenIntrospectionService] = None
+    session_sweeper: Optional[SessionSweeper] = None
+    loop_monitor: Optional[LoopMonitor] = None
+    bus: IInvalidationBus = field(default_factory=LocalInvalidationBus)
+    client_address_resolver: ClientAddressResolver = field(default_factory=ClientAddressResolver)
+    # None for in-memory repos
+    db: Optional[AsyncIOMotorDatabase] = None
+    embedded_store: Optional[EmbeddedStore] = None
+    # the policy shared by the services gets the cost calibrated to this latency on start
+    password_policy: Optional[PasswordHashingPolicy] = None
+    bcrypt_target_latency: Optional[float] = None
+    shutdown_timeout: Optional[float] = None
+
+    async def _calibrate_password_policy(self):
+        calibrated = await asyncio.to_thread(
+            PasswordHashingPolicy.calibrate, self.bcrypt_target_latency, min_rounds=MIN_CALIBRATED_BCRYPT_ROUNDS
+        )
+        self.password_policy.rounds = calibrated.rounds
+        logger.info('bcrypt cost calibrated to %s rounds for %ss', calibrated.rounds, self.bcrypt_target_latency)
+
+    async def start(self):
+        if self.loop_monitor is not None:
+            self.loop_monitor.start()
+        if self.embedded_store is not None:
+            await self.embedded_store.open()
+        if self.password_policy is not None and self.bcrypt_target_latency is not None:
+            await self._calibrate_password_policy()
+        self.bus.start()
+        self.executor.start()
+        bind_executor(instrument(self.executor, 'executor'))
+        self.email_queue.start()
+        if self.db is not None:
+            await ensure_indexes(self.db)
+        if self.session_sweeper is not None:
+            self.session_sweeper.start()
+
+    async def stop(self):
+        if self.session_sweeper is not None:
+            await self.session_sweeper.stop()
+        # let queued verification emails go out
+        await self.email_queue.stop(timeout=self.shutdown_timeout)
+        bind_executor(None)
+        self.executor.shutdown()
+        self.bus.stop()
+        if self.db is not None:
+            close_clients()
+        if self.embedded_store is not None:
+            await self.embedded_store.close()
+        if self.loop_monitor is not None:
+            await self.loop_monitor.stop()
+
+
+def _read_pem(value: str) -> bytes:
+    if value.lstrip().startswith('-----BEGIN'):
+        return value.encode('ascii')
+    with open(value, 'rb') as file:
+        return file.read()
+
+
+def load_signing_keys(settings: Settings, ring: KeyRing) -> bool:
+    """
+    Loads the configured keys into the ring, False if there are none and the ring generates its own
+    """
+    if not settings.token_signing_key:
+        logger.warning(
+            'No token signing key is configured, a generated one is used. Tokens are invalidated by a restart '
+            'and are not accepted by other workers, set AUTH_TOKEN_SIGNING_KEY outside development'
+        )
+        return False
+
+    ring.load(
+        key_from_pem(_read_pem(settings.token_signing_key), settings.token_signing_key_id),
+        [key_from_pem(_read_pem(pem), kid) for kid, pem in settings.token_verification_keys.items()]
+    )
+    return True
+
+
+def build_container(settings: Settings) -> Container:
+    metrics.enabled = settings.metrics_enabled
+    has_signing_key = load_signing_keys(settings, key_ring)
+
+    # several workers on a node
+    multi_worker = bool(settings.invalidation_socket_dir)
+    if multi_worker and not has_signing_key:
+        raise InternalError('Workers have to share a signing key, AUTH_TOKEN_SIGNING_KEY is required')
+
+    if multi_worker:
+        bus = UnixSocketInvalidationBus(settings.invalidation_socket_dir)
+    else:
+        bus = LocalInvalidationBus()
+    revocation_list.attach_bus(bus)
+
+    if settings.embedded_store_dir:
+        db = None
+        embedded_store = EmbeddedStore(settings.embedded_store_dir, sync_interval=settings.embedded_store_sync_interval)
+        # the store is the only copy, a cache in front of it would only add copying
+        user_repo = instrument(embedded_store.user_repo, 'user_repo')
+        session_repo = instrument(embedded_store.session_repo, 'session_repo')
+        ver_code_repo = instrument(embedded_store.ver_code_repo, 'ver_code_repo')
+    else:
+        db = get_database(settings.mongo)
+        embedded_store = None
+        user_repo = instrument(
+            CachingUserAuthRepo(instrument(MongoUserAuthRepo(db), 'mongo_user_repo'), bus=bus), 'user_repo'
+        )
+        session_repo = instrument(
+            MongoSessionRepo(db, use_transactions=settings.mongo_use_transactions), 'session_repo'
+        )
+        ver_code_repo = instrument(MongoVerificationCodeRepo(db), 'ver_code_repo')
+
+    if multi_worker and db is not None:
+        # in-process buckets would multiply the limits by the number of workers
+        login_throttler = LoginThrottler(
+            email_limiter=MongoRateLimiter(db, EMAIL_LOGIN_RULE, prefix='login_email'),
+            address_limiter=MongoRateLimiter(db, ADDRESS_LOGIN_RULE, prefix='login_address')
+        )
+    else:
+        login_throttler = LoginThrottler()
+
+    executor = ProcessPoolAsyncExecutor(
+        max_workers=settings.executor_max_workers,
+        max_queue_size=settings.executor_max_queue_size,
+        queue_timeout=settings.executor_queue_timeout
+    )
+    # the container manages the pool itself, services get the instrumented one
+    instrumented_executor = instrument(executor, 'executor')
+    email_queue = EmailQueue(SMTPEmailSender(
+        host=settings.smtp_host,
+        port=settings.smtp_port,
+        from_address=settings.email_from_address,
+        username=settings.smtp_username,
+        password=settings.smtp_password,
+        use_tls=settings.smtp_use_tls
+    ))
+    # with the calibration the configured cost is used until the container starts
+    password_policy = PasswordHashingPolicy(rounds=settings.bcrypt_rounds)
+    bcrypt_target_latency = settings.bcrypt_target_latency if settings.bcrypt_calibrate_on_start else None
+
+    return Container(
+        executor=executor,
+        email_queue=email_queue,
+        user_service=instrument(UserService(
+            user_repo=user_repo,
+            ver_code_repo=ver_code_repo,
+            executor=instrumented_executor,
+            email_queue=email_queue,
+            password_policy=password_policy,
+            bus=bus
+        ), 'user_service'),
+        session_service=instrument(SessionService(
+            user_repo=user_repo,
+            session_repo=session_repo,
+            executor=instrumented_executor,
+            password_policy=password_policy,
+            login_throttler=login_throttler
+        ), 'session_service'),
+        introspection_service=instrument(
+            TokenIntrospectionService(session_repo, api_keys=settings.introspection_api_keys), 'introspection_service'
+        ) if settings.introspection_api_keys else None,
+        session_sweeper=SessionSweeper(
+            session_repo,
+            lock_path=os.path.join(settings.invalidation_socket_dir, SWEEPER_LOCK_FILE) if multi_worker else None
+        ) if settings.run_session_sweeper else None,
+        loop_monitor=LoopMonitor(
+            threshold=settings.loop_monitor_threshold,
+            sample_interval=settings.loop_monitor_sample_interval
+        ) if settings.loop_monitor_enabled else None,
+        bus=bus,
+        client_address_resolver=ClientAddressResolver(settings.trusted_proxies),
+        db=db,
+        embedded_store=embedded_store,
+        password_policy=password_policy,
+        bcrypt_target_latency=bcrypt_target_latency,
+        shutdown_timeout=settings.shutdown_timeout
+    )
@@ -0,0 +1,73 @@
+from typing import Dict, Type
+
+from fastapi import FastAPI, Request
+from starlette import status
+
+from app.api.responses import LeanJSONResponse
+from app.common_lib.errors import AppError
+from app.common_lib.executor import ExecutorIsOverloaded
+from app.common_lib.jws import JWSVerificationFailed, UnknownSigningKey
+from app.common_lib.mail import EmailQueueIsFull
+from app.domain.models.session import SessionIsNotActive, ReusingOfRefreshToken
+from app.domain.models.tokens import TokenVerificationFailed, WrongTokenFormat
+from app.domain.models.user import EmailIsNotVerified, WrongPassword, EmailIsAlreadyVerified
+from app.domain.models.verification_code import VerCodeCooldownIsNotOver, VerCodeIsNotCorrect, VerCodeIsExpired, \
+    VerCodeIsLocked
+from app.domain.services.introspection import IntrospectionBatchIsTooLarge, IntrospectionCallerIsNotAuthorized
+from app.domain.services.login_throttler import TooManyLoginAttempts
+from app.domain.services.session import UserWithEmailDoesntExists
+from app.domain.services.user import UserAlreadyExists
+
+# subclasses without an entry get the status of the closest mapped base class
+ERROR_STATUS_CODES: Dict[Type[AppError], int] = {
+    AppError: status.HTTP_400_BAD_REQUEST,
+    TokenVerificationFailed: status.HTTP_401_UNAUTHORIZED,
+    WrongTokenFormat: status.HTTP_401_UNAUTHORIZED,
+    JWSVerificationFailed: status.HTTP_401_UNAUTHORIZED,
+    UnknownSigningKey: status.HTTP_401_UNAUTHORIZED,
+    SessionIsNotActive: status.HTTP_401_UNAUTHORIZED,
+    ReusingOfRefreshToken: status.HTTP_401_UNAUTHORIZED,
+    # the same answer as for a wrong password, emails can't be enumerated through login
+    UserWithEmailDoesntExists: status.HTTP_401_UNAUTHORIZED,
+    WrongPassword: status.HTTP_401_UNAUTHORIZED,
+    EmailIsNotVerified: status.HTTP_403_FORBIDDEN,
+    UserAlreadyExists: status.HTTP_409_CONFLICT,
+    EmailIsAlreadyVerified: status.HTTP_409_CONFLICT,
+    VerCodeIsNotCorrect: status.HTTP_400_BAD_REQUEST,
+    VerCodeIsExpired: status.HTTP_400_BAD_REQUEST,
+    VerCodeIsLocked: status.HTTP_429_TOO_MANY_REQUESTS,
+    VerCodeCooldownIsNotOver: status.HTTP_429_TOO_MANY_REQUESTS,
+    TooManyLoginAttempts: status.HTTP_429_TOO_MANY_REQUESTS,
+    IntrospectionCallerIsNotAuthorized: status.HTTP_401_UNAUTHORIZED,
+    IntrospectionBatchIsTooLarge: status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    ExecutorIsOverloaded: status.HTTP_503_SERVICE_UNAVAILABLE,
+    EmailQueueIsFull: status.HTTP_503_SERVICE_UNAVAILABLE,
+}
+
+ERROR_MESSAGES: Dict[Type[AppError], str] = {
+    UserWithEmailDoesntExists: WrongPassword.__name__,
+}
+
+
+def get_status_code(error_cls: Type[AppError]) -> int:
+    for cls in error_cls.__mro__:
+        status_code = ERROR_STATUS_CODES.get(cls)
+        if status_code is not None:
+            return status_code
+    return status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+async def app_error_handler(request: Request, ex: AppError) -> LeanJSONResponse:
+    error_cls = type(ex)
+    response = LeanJSONResponse(
+        {'error': ERROR_MESSAGES.get(error_cls, error_cls.__name__)},
+        status_code=get_status_code(error_cls)
+    )
+    if isinstance(ex, TooManyLoginAttempts):
+        response.headers['Retry-After'] = str(max(int(ex.retry_after), 1))
+
+    return response
+
+
+def add_error_handlers(app: FastAPI):
+    app.add_exception_handler(AppError, app_error_handler)
@@ -0,0 +1,29 @@
+from typing import Any
+
+import orjson
+from starlette.responses import Response
+
+from app.domain.models.tokens import AccessToken, RefreshToken, Token
+
+
+class LeanJSONResponse(Response):
+    """
+    orjson rendered response, routes return it directly, so FastAPI doesn't revalidate
+    and reserialize the content through a response model
+    """
+    media_type = 'application/json'
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+def token_response(token: Token, status_code: int = 200) -> LeanJSONResponse:
+    return LeanJSONResponse({'token': token.get_token(), 'token_type': 'bearer'}, status_code=status_code)
+
+
+def token_pair_response(access_token: AccessToken, refresh_token: RefreshToken) -> LeanJSONResponse:
+    return LeanJSONResponse({
+        'access_token': access_token.get_token(),
+        'refresh_token': refresh_token.get_token(),
+        'token_type': 'bearer',
+    })
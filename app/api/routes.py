@@ -0,0 +1,146 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Request, HTTPException
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette import status
+from starlette.responses import Response, PlainTextResponse
+
+from app.api.client_address import FORWARDED_FOR_HEADER
+from app.api.container import Container
+from app.api.responses import LeanJSONResponse, token_response, token_pair_response
+from app.api.schemas import RegisterRequest, LoginRequest, VerifyEmailRequest, RefreshRequest, LogoutRequest, \
+    IntrospectRequest
+from app.common_lib.metrics import metrics
+from app.domain.models.revocation import to_timestamp
+from app.domain.models.tokens import AccessToken, RegistrationToken, RefreshTokenWithoutExpireValidation, \
+    WrongTokenFormat, key_ring
+from app.domain.services.session import LoginDTO
+from app.domain.services.user import RegisterDTO, VerifyEmailDTO
+
+router = APIRouter()
+# metrics and debugging, they expose internals, so they are only served when enabled in the settings
+internal_router = APIRouter()
+
+bearer = HTTPBearer(auto_error=False)
+
+
+# dependencies are async, sync ones would be run in the thread pool
+
+
+async def get_container(request: Request) -> Container:
+    return request.app.state.container
+
+
+def _get_bearer_token(credentials: Optional[HTTPAuthorizationCredentials]) -> str:
+    if credentials is None:
+        raise WrongTokenFormat('Bearer token is required')
+    return credentials.credentials
+
+
+async def get_access_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)) -> AccessToken:
+    return AccessToken.decode_and_validate(_get_bearer_token(credentials))
+
+
+async def get_registration_token(
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)
+) -> RegistrationToken:
+    return RegistrationToken.decode_and_validate(_get_bearer_token(credentials))
+
+
+@router.post('/auth/register', response_class=LeanJSONResponse, status_code=status.HTTP_201_CREATED)
+async def register(body: RegisterRequest, container: Container = Depends(get_container)):
+    token = await container.user_service.register(RegisterDTO(email=body.email, password=body.password.encode()))
+    return token_response(token, status_code=status.HTTP_201_CREATED)
+
+
+@router.post('/auth/verification-email', status_code=status.HTTP_202_ACCEPTED)
+async def send_verification_email(
+        token: RegistrationToken = Depends(get_registration_token),
+        container: Container = Depends(get_container)
+):
+    await container.user_service.send_user_verification_email(token)
+    return Response(status_code=status.HTTP_202_ACCEPTED)
+
+
+@router.post('/auth/verify', status_code=status.HTTP_204_NO_CONTENT)
+async def verify_email(
+        body: VerifyEmailRequest,
+        token: RegistrationToken = Depends(get_registration_token),
+        container: Container = Depends(get_container)
+):
+    await container.user_service.verify_email(token, VerifyEmailDTO(code=body.code))
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.post('/auth/login', response_class=LeanJSONResponse)
+async def login(body: LoginRequest, request: Request, container: Container = Depends(get_container)):
+    access_token, refresh_token = await container.session_service.login(LoginDTO(
+        email=body.email,
+        password=body.password.encode(),
+        client_address=container.client_address_resolver.resolve(
+            request.client.host if request.client else None, request.headers.get(FORWARDED_FOR_HEADER)
+        )
+    ))
+    return token_pair_response(access_token, refresh_token)
+
+
+@router.post('/auth/refresh', response_class=LeanJSONResponse)
+async def refresh(body: RefreshRequest, container: Container = Depends(get_container)):
+    refresh_token = RefreshTokenWithoutExpireValidation.decode_and_validate(body.refresh_token)
+    access_token, refresh_token = await container.session_service.refresh(refresh_token)
+    return token_pair_response(access_token, refresh_token)
+
+
+@router.post('/auth/logout', status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+        body: LogoutRequest,
+        access_token: AccessToken = Depends(get_access_token),
+        container: Container = Depends(get_container)
+):
+    refresh_token = RefreshTokenWithoutExpireValidation.decode_and_validate(body.refresh_token)
+    await container.session_service.logout_by_refresh_token(access_token, refresh_token)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.post('/auth/introspect', response_class=LeanJSONResponse)
+async def introspect(
+        body: IntrospectRequest,
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer),
+        container: Container = Depends(get_container)
+):
+    if container.introspection_service is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    # the bearer token of a resource server is one of the introspection api keys
+    container.introspection_service.check_caller(credentials.credentials if credentials is not None else None)
+    results = await container.introspection_service.introspect(body.tokens)
+    return LeanJSONResponse({'results': [
+        {
+            'active': result.active,
+            'sub': result.sub,
+            'exp': to_timestamp(result.exp) if result.exp is not None else None,
+            'family_id': result.family_id,
+            'error': result.error,
+        }
+        for result in results
+    ]})
+
+
+@router.get('/.well-known/jwks.json', response_class=LeanJSONResponse)
+async def jwks():
+    return LeanJSONResponse(key_ring.jwks())
+
+
+@internal_router.get('/metrics', response_class=PlainTextResponse)
+async def export_metrics():
+    return PlainTextResponse(metrics.export_prometheus(), media_type='text/plain; version=0.0.4')
+
+
+@internal_router.get('/debug/loop-stacks', response_class=PlainTextResponse)
+async def export_loop_stacks(container: Container = Depends(get_container)):
+    """
+    Collapsed stacks of the blocked event loop, input for flamegraph.pl or speedscope
+    """
+    if container.loop_monitor is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return PlainTextResponse(container.loop_monitor.collapsed_stacks())
@@ -0,0 +1,41 @@
+from typing import List
+
+from pydantic import BaseModel, constr, validator
+
+from app.domain.models.user import MAX_ENCODED_PASSWORD_LEN
+from app.domain.models.verification_code import CODE_LEN
+
+MIN_PASSWORD_LEN = 8
+
+
+class RegisterRequest(BaseModel):
+    email: constr(strip_whitespace=True, min_length=3, max_length=254, regex=r'^[^@\s]+@[^@\s]+$')
+    password: constr(min_length=MIN_PASSWORD_LEN)
+
+    @validator('password')
+    def check_encoded_password_len(cls, password: str) -> str:
+        if len(password.encode('utf-8')) > MAX_ENCODED_PASSWORD_LEN:
+            raise ValueError(f'password is longer than {MAX_ENCODED_PASSWORD_LEN} bytes')
+        return password
+
+
+class LoginRequest(BaseModel):
+    email: constr(strip_whitespace=True, max_length=254)
+    password: constr(max_length=MAX_ENCODED_PASSWORD_LEN * 4)
+
+
+class VerifyEmailRequest(BaseModel):
+    code: constr(min_length=CODE_LEN, max_length=CODE_LEN)
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
+class LogoutRequest(BaseModel):
+    refresh_token: str
+
+
+class IntrospectRequest(BaseModel):
+    # checked by the service, so an oversized batch gets its own error
+    tokens: List[str]
@@ -0,0 +1,17 @@
+"""
+    python -m app.calibrate
+
+Prints the bcrypt cost that hashes in about AUTH_BCRYPT_TARGET_LATENCY on this machine,
+run it once on the slowest host and set AUTH_BCRYPT_ROUNDS of every worker to it
+"""
+from app.domain.models.user import PasswordHashingPolicy, MIN_CALIBRATED_BCRYPT_ROUNDS
+from app.settings import Settings
+
+
+def main():
+    policy = PasswordHashingPolicy.calibrate(Settings().bcrypt_target_latency, min_rounds=MIN_CALIBRATED_BCRYPT_ROUNDS)
+    print(f'AUTH_BCRYPT_ROUNDS={policy.rounds}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import time
+from collections import OrderedDict
+from typing import Generic, TypeVar, Optional, Hashable, Tuple
+
+K = TypeVar('K', bound=Hashable)
+V = TypeVar('V')
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Bounded LRU cache, every entry expires at its own wall clock timestamp
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float] = None):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries: 'OrderedDict[K, Tuple[V, Optional[float]]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: K) -> bool:
+        return self.get(key, count=False) is not None
+
+    def get(self, key: K, count: bool = True) -> Optional[V]:
+        entry = self._entries.get(key)
+        if entry is None:
+            if count:
+                self.misses += 1
+            return None
+
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._entries[key]
+            if count:
+                self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        if count:
+            self.hits += 1
+        return value
+
+    def set(self, key: K, value: V, expires_at: Optional[float] = None, ttl: Optional[float] = None):
+        ttl = ttl if ttl is not None else self._ttl
+        if expires_at is None and ttl is not None:
+            expires_at = time.time() + ttl
+
+        if expires_at is not None and expires_at <= time.time():
+            return
+
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: K):
+        self._entries.pop(key, None)
+
+    def evict_expired(self) -> int:
+        now = time.time()
+        expired = [key for key, (_, expires_at) in self._entries.items() if expires_at is not None and expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+
+        return len(expired)
+
+    def clear(self):
+        self._entries.clear()
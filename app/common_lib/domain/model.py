@@ -1,10 +1,23 @@
-from typing import Optional, TypeVar, Generic
+from typing import Optional, TypeVar, Generic, Type
 
 from bson import ObjectId
 from pydantic import BaseModel
 
 ID = TypeVar("ID")
+ModelType = TypeVar("ModelType", bound='IdModel')
 
 
 class IdModel(BaseModel):
     id: Optional[ID]
+
+    @classmethod
+    def from_record(cls: Type[ModelType], **fields) -> ModelType:
+        """
+        Build a model from trusted, already typed values (repository records, domain factories)
+        without pydantic validation, validation only runs on data coming from the API
+        """
+        return cls.construct(**fields)
+
+    def clone(self: ModelType) -> ModelType:
+        # field values are immutable, a shallow copy is enough
+        return self.copy()
@@ -1,6 +1,18 @@
+import asyncio
 import functools
+import importlib
+import os
+import time
 from abc import ABC, abstractmethod
-from typing import Any, Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.common_lib.errors import AppError
+
+
+class ExecutorIsOverloaded(AppError):
+    pass
 
 
 class IAsyncExecutor(ABC):
@@ -9,14 +21,206 @@ class IAsyncExecutor(ABC):
     async def __call__(self, func: Callable) -> Any: ...
 
 
-def cpu_bound(func):
+@dataclass
+class TimingStats:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+@dataclass
+class ExecutorMetrics:
+    submitted: int = 0
+    rejected: int = 0
+    failed: int = 0
+    in_flight: int = 0
+    queue_wait: TimingStats = field(default_factory=TimingStats)
+    run_time: TimingStats = field(default_factory=TimingStats)
+
+
+def _timed_call(func: Callable) -> Tuple[Any, float, float]:
+    # time.monotonic is system-wide on the platforms we run on,
+    # so the timestamps are comparable with the ones taken in the parent process
+    started_at = time.monotonic()
+    result = func()
+    return result, started_at, time.monotonic()
+
+
+class PoolAsyncExecutor(IAsyncExecutor, ABC):
+    """
+    Runs callables in a concurrent.futures pool.
+
+    At most max_workers + max_queue_size calls are in flight, the rest wait up to
+    queue_timeout seconds for a free slot and are rejected with ExecutorIsOverloaded after that.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue_size: int = 64, queue_timeout: float = 0.0):
+        self._max_workers = max_workers or os.cpu_count() or 1
+        self._max_in_flight = self._max_workers + max_queue_size
+        self._queue_timeout = queue_timeout
+        self._pool: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.metrics = ExecutorMetrics()
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    @abstractmethod
+    def _create_pool(self) -> Executor: ...
+
+    def start(self):
+        if self._pool is None:
+            self._pool = self._create_pool()
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+    async def _acquire_slot(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_in_flight)
+
+        if self._slots.locked() and self._queue_timeout <= 0:
+            self.metrics.rejected += 1
+            raise ExecutorIsOverloaded()
+
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self._queue_timeout or None)
+        except asyncio.TimeoutError:
+            self.metrics.rejected += 1
+            raise ExecutorIsOverloaded()
+
+    async def __call__(self, func: Callable) -> Any:
+        await self._acquire_slot()
+        self.start()
+
+        loop = asyncio.get_running_loop()
+        self.metrics.submitted += 1
+        self.metrics.in_flight += 1
+        submitted_at = time.monotonic()
+        try:
+            result, started_at, finished_at = await loop.run_in_executor(
+                self._pool, functools.partial(_timed_call, func)
+            )
+        except Exception:
+            self.metrics.failed += 1
+            raise
+        finally:
+            self.metrics.in_flight -= 1
+            self._slots.release()
+
+        self.metrics.queue_wait.add(max(started_at - submitted_at, 0.0))
+        self.metrics.run_time.add(finished_at - started_at)
+
+        return result
+
+
+class ProcessPoolAsyncExecutor(PoolAsyncExecutor):
+    """
+    Production executor for cpu bound work (bcrypt etc.), func has to be picklable
+    """
+
+    def _create_pool(self) -> Executor:
+        return ProcessPoolExecutor(max_workers=self._max_workers)
+
+
+class ThreadPoolAsyncExecutor(PoolAsyncExecutor):
+    """
+    Fallback executor for code that releases the GIL or for tests, func doesn't have to be picklable
+    """
+
+    def _create_pool(self) -> Executor:
+        return ThreadPoolExecutor(max_workers=self._max_workers)
+
+
+_bound_executor: Optional[IAsyncExecutor] = None
+
+
+def bind_executor(executor: Optional[IAsyncExecutor]):
+    """
+    Set the shared executor used by awaited @cpu_bound functions
+    """
+    global _bound_executor
+    _bound_executor = executor
+
+
+def get_bound_executor() -> IAsyncExecutor:
+    global _bound_executor
+    if _bound_executor is None:
+        _bound_executor = ThreadPoolAsyncExecutor()
+    return _bound_executor
+
+
+@dataclass
+class CpuBoundStats:
+    cpu_time: TimingStats = field(default_factory=TimingStats)
+    queue_wait: TimingStats = field(default_factory=TimingStats)
+
+
+def _resolve(module: str, qualname: str) -> Any:
+    obj = importlib.import_module(module)
+    for name in qualname.split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _measured_call(func: 'CpuBoundFunction', args: tuple, kwargs: dict) -> Tuple[Any, float, float]:
+    started_at = time.monotonic()
+    cpu_started_at = time.thread_time()
+    result = func.sync(*args, **kwargs)
+    return result, started_at, time.thread_time() - cpu_started_at
+
+
+class CpuBoundFunction:
+    def __init__(self, func: Callable):
+        functools.update_wrapper(self, func)
+        self._func = func
+        self.stats = CpuBoundStats()
+
+    def __reduce__(self):
+        # pickled by reference, so the function can be shipped to a process pool
+        return _resolve, (self.__module__, self.__qualname__)
+
+    def sync(self, *args, **kwargs) -> Any:
+        return self._func(*args, **kwargs)
+
+    async def run_in(self, executor: IAsyncExecutor, *args, **kwargs) -> Any:
+        submitted_at = time.monotonic()
+        result, started_at, cpu_time = await executor(functools.partial(_measured_call, self, args, kwargs))
+
+        self.stats.queue_wait.add(max(started_at - submitted_at, 0.0))
+        self.stats.cpu_time.add(cpu_time)
+
+        return result
+
+    def __call__(self, *args, **kwargs) -> Awaitable:
+        return self.run_in(get_bound_executor(), *args, **kwargs)
+
+
+_cpu_bound_functions: List[CpuBoundFunction] = []
+
+
+def cpu_bound(func: Callable) -> CpuBoundFunction:
     """
-    Mark functions explicitly as cpu_bound
+    Make func awaitable, calls are dispatched to the bound executor, use func.sync to run it inline
     """
+    cpu_bound_func = CpuBoundFunction(func)
+    _cpu_bound_functions.append(cpu_bound_func)
+
+    return cpu_bound_func
 
-    @functools.wraps(func)
-    def wrapper_cpu_bound(*args, **kwargs):
-        func(*args, **kwargs)
-        return func(*args, **kwargs)
 
-    return wrapper_cpu_bound
+def get_cpu_bound_stats() -> Dict[str, CpuBoundStats]:
+    return {f'{func.__module__}.{func.__qualname__}': func.stats for func in _cpu_bound_functions}
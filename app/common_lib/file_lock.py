@@ -0,0 +1,17 @@
+import fcntl
+import os
+from typing import Optional, IO
+
+
+def try_lock_file(path: str) -> Optional[IO]:
+    """
+    Exclusive lock of the file, held until the returned file is closed. None if another process holds it
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    file = open(path, 'a')
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        file.close()
+        return None
+    return file
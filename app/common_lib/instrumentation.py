@@ -0,0 +1,124 @@
+import functools
+import inspect
+import time
+from typing import Any, Callable, TypeVar, Tuple
+
+from app.common_lib.errors import AppError
+from app.common_lib.executor import IAsyncExecutor
+from app.common_lib.metrics import MetricsRegistry, metrics as default_metrics
+
+T = TypeVar('T')
+
+CALL_SECONDS = 'auth_call_seconds'
+CALL_ERRORS = 'auth_call_errors_total'
+EXECUTOR_QUEUE_WAIT_SECONDS = 'auth_executor_queue_wait_seconds'
+EXECUTOR_RUN_SECONDS = 'auth_executor_run_seconds'
+EXECUTOR_ERRORS = 'auth_executor_errors_total'
+
+
+def _instrument_method(method: Callable, component: str, registry: MetricsRegistry) -> Callable:
+    name = method.__name__
+    histogram = registry.histogram(CALL_SECONDS, 'Service and repository call latency', ('component', 'method')) \
+        .labels(component, name)
+    errors = registry.counter(CALL_ERRORS, 'AppErrors raised by calls', ('component', 'method', 'error'))
+    perf_counter = time.perf_counter
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        if not registry.enabled:
+            return await method(*args, **kwargs)
+
+        started_at = perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        except AppError as ex:
+            errors.labels(component, name, type(ex).__name__).inc()
+            raise
+        finally:
+            histogram.record(perf_counter() - started_at)
+
+    return wrapper
+
+
+class InstrumentedProxy:
+    """
+    Wraps the public coroutine methods of the target, everything else is forwarded as is
+    """
+
+    def __init__(self, target: Any, component: str, registry: MetricsRegistry):
+        self._target = target
+        for name, method in inspect.getmembers(target, inspect.iscoroutinefunction):
+            if not name.startswith('_'):
+                # shadows __getattr__, so a call costs no extra lookup
+                setattr(self, name, _instrument_method(method, component, registry))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._target, name)
+
+
+class _TimedCallFailed(Exception):
+    """
+    Takes the timings of a failed call out of the worker, the wrapped executor still sees the failure
+    """
+
+    def __init__(self, error: Exception, started_at: float, finished_at: float):
+        super().__init__(error, started_at, finished_at)
+        self.error = error
+        self.started_at = started_at
+        self.finished_at = finished_at
+
+
+def _timed_call_raising(func: Callable) -> Tuple[Any, float, float]:
+    started_at = time.monotonic()
+    try:
+        result = func()
+    except Exception as ex:
+        raise _TimedCallFailed(ex, started_at, time.monotonic())
+    return result, started_at, time.monotonic()
+
+
+class InstrumentedExecutor(IAsyncExecutor):
+    def __init__(self, executor: IAsyncExecutor, registry: MetricsRegistry):
+        self._executor = executor
+        self._registry = registry
+        self._queue_wait = registry.histogram(
+            EXECUTOR_QUEUE_WAIT_SECONDS, 'Time a call waited for an executor worker'
+        ).labels()
+        self._run_time = registry.histogram(EXECUTOR_RUN_SECONDS, 'Time a call ran in an executor worker').labels()
+        self._errors = registry.counter(EXECUTOR_ERRORS, 'Errors raised by calls in an executor worker', ('error',))
+
+    def _record(self, submitted_at: float, started_at: float, finished_at: float):
+        self._queue_wait.record(max(started_at - submitted_at, 0.0))
+        self._run_time.record(finished_at - started_at)
+
+    async def __call__(self, func: Callable) -> Any:
+        if not self._registry.enabled:
+            return await self._executor(func)
+
+        submitted_at = time.monotonic()
+        try:
+            result, started_at, finished_at = await self._executor(functools.partial(_timed_call_raising, func))
+        except _TimedCallFailed as failure:
+            self._record(submitted_at, failure.started_at, failure.finished_at)
+            self._errors.labels(type(failure.error).__name__).inc()
+            raise failure.error from None
+
+        self._record(submitted_at, started_at, finished_at)
+        return result
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._executor, name)
+
+
+def instrument(target: T, component: str, registry: MetricsRegistry = default_metrics) -> T:
+    """
+    Returns target itself while metrics are disabled, so there is no overhead at all,
+    instrumented objects still check registry.enabled on every call and can be switched off at runtime
+    """
+    if not registry.enabled:
+        return target
+
+    if isinstance(target, IAsyncExecutor):
+        return InstrumentedExecutor(target, registry)
+
+    return InstrumentedProxy(target, component, registry)
@@ -0,0 +1,156 @@
+import asyncio
+import errno
+import glob
+import logging
+import os
+import socket
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict], None]
+
+# fits the default unix datagram limits, publishers split bigger payloads
+MAX_MESSAGE_SIZE = 60_000
+
+
+class IInvalidationBus(ABC):
+    """
+    Tells the other workers that in-process state derived from the db is stale.
+
+    The publisher has already applied the change to its own state, so its handlers are not called.
+    Handlers run on the event loop and must be idempotent, messages are fire and forget.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+
+    def subscribe(self, topic: str, handler: Handler):
+        self._handlers[topic].append(handler)
+
+    def _dispatch(self, topic: str, payload: dict):
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(payload)
+            except Exception:
+                logger.exception('Invalidation handler of %s failed', topic)
+
+    @abstractmethod
+    def publish(self, topic: str, payload: dict): ...
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class LocalInvalidationBus(IInvalidationBus):
+    """
+    Single worker deployment, there is nobody to notify
+    """
+
+    def publish(self, topic: str, payload: dict):
+        pass
+
+
+class UnixSocketInvalidationBus(IInvalidationBus):
+    """
+    Node local bus, every worker binds a datagram socket in directory and publishes to the sockets of the others.
+
+    Delivery takes one sendto per peer, no broker is involved. Peers are found by listing the directory
+    at most every peers_refresh_interval seconds, sockets of dead workers are removed when a send is refused.
+    """
+
+    def __init__(self, directory: str, name: Optional[str] = None, peers_refresh_interval: float = 1.0):
+        super().__init__()
+        self._directory = directory
+        self._path = os.path.join(directory, f'{name or os.getpid()}.sock')
+        self._peers_refresh_interval = peers_refresh_interval
+        self._peers: List[str] = []
+        self._peers_refreshed_at = 0.0
+        self._socket: Optional[socket.socket] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.dropped = 0
+
+    def _refresh_peers(self, now: float):
+        self._peers = [path for path in glob.glob(os.path.join(self._directory, '*.sock')) if path != self._path]
+        self._peers_refreshed_at = now
+
+    def start(self):
+        if self._socket is not None:
+            return
+
+        os.makedirs(self._directory, exist_ok=True)
+        if os.path.exists(self._path):
+            os.unlink(self._path)
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self._path)
+        self._socket.setblocking(False)
+
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(self._socket.fileno(), self._on_readable)
+
+    def stop(self):
+        if self._socket is None:
+            return
+
+        self._loop.remove_reader(self._socket.fileno())
+        self._socket.close()
+        self._socket = None
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._socket.recv(MAX_MESSAGE_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return
+
+            try:
+                message = orjson.loads(data)
+            except orjson.JSONDecodeError:
+                logger.warning('Malformed invalidation message')
+                continue
+            self._dispatch(message['topic'], message['payload'])
+
+    def _remove_peer(self, path: str):
+        self._peers.remove(path)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def publish(self, topic: str, payload: dict):
+        if self._socket is None:
+            return
+
+        data = orjson.dumps({'topic': topic, 'payload': payload})
+        if len(data) > MAX_MESSAGE_SIZE:
+            raise ValueError(f'Invalidation message of {len(data)} bytes is too big')
+
+        now = time.monotonic()
+        if now - self._peers_refreshed_at >= self._peers_refresh_interval:
+            self._refresh_peers(now)
+
+        for path in list(self._peers):
+            try:
+                self._socket.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # the worker is gone
+                self._remove_peer(path)
+            except OSError as ex:
+                if ex.errno not in (errno.EAGAIN, errno.ENOBUFS):
+                    raise
+                # the peer doesn't keep up, its state will be fixed by cache ttls
+                self.dropped += 1
+                logger.warning('Invalidation message to %s is dropped', path)
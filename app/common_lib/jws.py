@@ -0,0 +1,128 @@
+import base64
+import binascii
+import json
+import time
+from typing import Optional, TYPE_CHECKING
+
+from app.common_lib.errors import AppError
+
+if TYPE_CHECKING:
+    from app.common_lib.keyring import KeyRing, SigningKey
+
+
+class JWSVerificationFailed(AppError):
+    pass
+
+
+class JWTExpired(JWSVerificationFailed):
+    pass
+
+
+class UnknownSigningKey(AppError):
+    pass
+
+
+def b64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def b64url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def encode_header_segment(header: dict) -> str:
+    # same serialization as python-jose, so tokens are interchangeable
+    return b64url_encode(json.dumps(header, separators=(',', ':'), sort_keys=True).encode('utf-8'))
+
+
+def encode_payload_segment(claims: dict) -> str:
+    return b64url_encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+
+
+class JWSSigner:
+    def __init__(self, key_ring: 'KeyRing'):
+        self._key_ring = key_ring
+
+    def sign(self, claims: dict) -> str:
+        """
+        claims must be json serializable already, datetimes are not converted
+        """
+        key = self._key_ring.get_signing_key()
+        signing_input = f'{key.header_segment}.{encode_payload_segment(claims)}'
+
+        return f'{signing_input}.{b64url_encode(key.sign(signing_input.encode("ascii")))}'
+
+
+class JWSVerifier:
+    """
+    JWT verification for our own tokens only: kid, signature and exp, no generic claim machinery
+    """
+
+    def __init__(self, key_ring: 'KeyRing'):
+        self._key_ring = key_ring
+
+    def _get_key(self, header_segment: str) -> 'SigningKey':
+        # tokens we issued have exactly the header of one of the ring keys
+        try:
+            key = self._key_ring.get_key_by_header_segment(header_segment)
+        except UnknownSigningKey as ex:
+            raise JWSVerificationFailed(ex) from ex
+
+        if key is not None:
+            return key
+
+        try:
+            header = json.loads(b64url_decode(header_segment))
+        except (ValueError, binascii.Error) as ex:
+            raise JWSVerificationFailed('Invalid header') from ex
+
+        if not isinstance(header, dict):
+            raise JWSVerificationFailed('Invalid header')
+
+        try:
+            key = self._key_ring.get_verification_key(header.get('kid'))
+        except UnknownSigningKey as ex:
+            raise JWSVerificationFailed(ex) from ex
+
+        if header.get('alg') != key.algorithm:
+            raise JWSVerificationFailed('The specified alg value is not allowed')
+
+        return key
+
+    def verify(self, token: str, verify_exp: bool = True, now: Optional[float] = None) -> dict:
+        try:
+            signing_input, signature_segment = token.rsplit('.', 1)
+            header_segment, payload_segment = signing_input.split('.')
+        except (ValueError, AttributeError) as ex:
+            raise JWSVerificationFailed('Not enough segments') from ex
+
+        # base64url segments are ascii, anything else can't be a token of ours
+        if not signing_input.isascii():
+            raise JWSVerificationFailed('Invalid token')
+
+        key = self._get_key(header_segment)
+
+        try:
+            signature = b64url_decode(signature_segment)
+        except (ValueError, binascii.Error) as ex:
+            raise JWSVerificationFailed('Invalid signature padding') from ex
+
+        if not key.verify(signing_input.encode('ascii'), signature):
+            raise JWSVerificationFailed('Signature verification failed')
+
+        try:
+            claims = json.loads(b64url_decode(payload_segment))
+        except (ValueError, binascii.Error) as ex:
+            raise JWSVerificationFailed('Invalid payload') from ex
+
+        if not isinstance(claims, dict):
+            raise JWSVerificationFailed('Invalid payload')
+
+        if verify_exp and 'exp' in claims:
+            exp = claims['exp']
+            if not isinstance(exp, (int, float)):
+                raise JWSVerificationFailed('Expiration Time claim (exp) must be an integer.')
+            if exp < int(now if now is not None else time.time()):
+                raise JWTExpired('Signature has expired.')
+
+        return claims
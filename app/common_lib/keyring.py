@@ -0,0 +1,334 @@
+import hashlib
+import hmac
+import json
+import time
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from typing import Optional, Dict, Callable, List, Tuple, Iterable
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature, encode_dss_signature
+
+from app.common_lib.jws import b64url_encode, b64url_decode, encode_header_segment, UnknownSigningKey
+
+
+def _jwk_thumbprint(required_members: dict) -> str:
+    # RFC 7638
+    canonical = json.dumps(required_members, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    return b64url_encode(hashlib.sha256(canonical).digest())
+
+
+class SigningKey(ABC):
+    """
+    A JWS key, parsed once when it is added to the key ring
+    """
+    algorithm: str
+
+    def __init__(self, kid: Optional[str]):
+        self.kid = kid
+
+        header = {'alg': self.algorithm, 'typ': 'JWT'}
+        if kid is not None:
+            header['kid'] = kid
+        self.header_segment = encode_header_segment(header)
+
+    @property
+    @abstractmethod
+    def can_sign(self) -> bool: ...
+
+    @abstractmethod
+    def sign(self, signing_input: bytes) -> bytes: ...
+
+    @abstractmethod
+    def verify(self, signing_input: bytes, signature: bytes) -> bool: ...
+
+    def public_jwk(self) -> Optional[dict]:
+        """
+        None for symmetric keys, they are never exported
+        """
+        return None
+
+
+class HS256Key(SigningKey):
+    """
+    Shared secret key, only for rings loaded with one in code. Settings take asymmetric keys only,
+    an HMAC secret would let every verifier mint tokens, so the default setup never uses it
+    """
+    algorithm = 'HS256'
+
+    def __init__(self, secret: bytes, kid: Optional[str] = None):
+        super().__init__(kid)
+        # HMAC object with precomputed key pads, copied for every token
+        self._mac = hmac.new(secret, digestmod=hashlib.sha256)
+
+    @property
+    def can_sign(self) -> bool:
+        return True
+
+    def sign(self, signing_input: bytes) -> bytes:
+        mac = self._mac.copy()
+        mac.update(signing_input)
+        return mac.digest()
+
+    def verify(self, signing_input: bytes, signature: bytes) -> bool:
+        return hmac.compare_digest(self.sign(signing_input), signature)
+
+
+class ES256Key(SigningKey):
+    algorithm = 'ES256'
+    _COORDINATE_LEN = 32
+
+    def __init__(self, public_key: ec.EllipticCurvePublicKey,
+                 private_key: Optional[ec.EllipticCurvePrivateKey] = None, kid: Optional[str] = None):
+        self._public_key = public_key
+        self._private_key = private_key
+        self._signature_algorithm = ec.ECDSA(hashes.SHA256())
+
+        numbers = public_key.public_numbers()
+        self._jwk = {
+            'kty': 'EC',
+            'crv': 'P-256',
+            'x': b64url_encode(numbers.x.to_bytes(self._COORDINATE_LEN, 'big')),
+            'y': b64url_encode(numbers.y.to_bytes(self._COORDINATE_LEN, 'big')),
+        }
+        super().__init__(kid or _jwk_thumbprint(self._jwk))
+
+    @classmethod
+    def generate(cls) -> 'ES256Key':
+        private_key = ec.generate_private_key(ec.SECP256R1())
+        return cls(public_key=private_key.public_key(), private_key=private_key)
+
+    @classmethod
+    def from_pem(cls, pem: bytes, kid: Optional[str] = None) -> 'ES256Key':
+        private_key = serialization.load_pem_private_key(pem, password=None)
+        return cls(public_key=private_key.public_key(), private_key=private_key, kid=kid)
+
+    @classmethod
+    def from_jwk(cls, jwk: dict) -> 'ES256Key':
+        public_key = ec.EllipticCurvePublicNumbers(
+            x=int.from_bytes(b64url_decode(jwk['x']), 'big'),
+            y=int.from_bytes(b64url_decode(jwk['y']), 'big'),
+            curve=ec.SECP256R1()
+        ).public_key()
+        return cls(public_key=public_key, kid=jwk.get('kid'))
+
+    @property
+    def can_sign(self) -> bool:
+        return self._private_key is not None
+
+    def sign(self, signing_input: bytes) -> bytes:
+        # JWS wants raw r || s instead of DER
+        r, s = decode_dss_signature(self._private_key.sign(signing_input, self._signature_algorithm))
+        return r.to_bytes(self._COORDINATE_LEN, 'big') + s.to_bytes(self._COORDINATE_LEN, 'big')
+
+    def verify(self, signing_input: bytes, signature: bytes) -> bool:
+        if len(signature) != 2 * self._COORDINATE_LEN:
+            return False
+
+        r = int.from_bytes(signature[:self._COORDINATE_LEN], 'big')
+        s = int.from_bytes(signature[self._COORDINATE_LEN:], 'big')
+        try:
+            self._public_key.verify(encode_dss_signature(r, s), signing_input, self._signature_algorithm)
+        except InvalidSignature:
+            return False
+        return True
+
+    def public_jwk(self) -> Optional[dict]:
+        return {**self._jwk, 'kid': self.kid, 'alg': self.algorithm, 'use': 'sig'}
+
+
+class EdDSAKey(SigningKey):
+    algorithm = 'EdDSA'
+
+    def __init__(self, public_key: ed25519.Ed25519PublicKey,
+                 private_key: Optional[ed25519.Ed25519PrivateKey] = None, kid: Optional[str] = None):
+        self._public_key = public_key
+        self._private_key = private_key
+
+        raw_public_key = public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        self._jwk = {'kty': 'OKP', 'crv': 'Ed25519', 'x': b64url_encode(raw_public_key)}
+        super().__init__(kid or _jwk_thumbprint(self._jwk))
+
+    @classmethod
+    def generate(cls) -> 'EdDSAKey':
+        private_key = ed25519.Ed25519PrivateKey.generate()
+        return cls(public_key=private_key.public_key(), private_key=private_key)
+
+    @classmethod
+    def from_pem(cls, pem: bytes, kid: Optional[str] = None) -> 'EdDSAKey':
+        private_key = serialization.load_pem_private_key(pem, password=None)
+        return cls(public_key=private_key.public_key(), private_key=private_key, kid=kid)
+
+    @classmethod
+    def from_jwk(cls, jwk: dict) -> 'EdDSAKey':
+        public_key = ed25519.Ed25519PublicKey.from_public_bytes(b64url_decode(jwk['x']))
+        return cls(public_key=public_key, kid=jwk.get('kid'))
+
+    @property
+    def can_sign(self) -> bool:
+        return self._private_key is not None
+
+    def sign(self, signing_input: bytes) -> bytes:
+        return self._private_key.sign(signing_input)
+
+    def verify(self, signing_input: bytes, signature: bytes) -> bool:
+        try:
+            self._public_key.verify(signature, signing_input)
+        except InvalidSignature:
+            return False
+        return True
+
+    def public_jwk(self) -> Optional[dict]:
+        return {**self._jwk, 'kid': self.kid, 'alg': self.algorithm, 'use': 'sig'}
+
+
+def key_from_jwk(jwk: dict) -> SigningKey:
+    if jwk.get('kty') == 'EC' and jwk.get('crv') == 'P-256':
+        return ES256Key.from_jwk(jwk)
+    if jwk.get('kty') == 'OKP' and jwk.get('crv') == 'Ed25519':
+        return EdDSAKey.from_jwk(jwk)
+
+    raise UnknownSigningKey(f'Unsupported jwk kty={jwk.get("kty")} crv={jwk.get("crv")}')
+
+
+def key_from_pem(pem: bytes, kid: Optional[str] = None) -> SigningKey:
+    """
+    EdDSA or ES256 key from a PEM of a private key, or of a public one for a verification only key
+    """
+    try:
+        private_key = serialization.load_pem_private_key(pem, password=None)
+        public_key = private_key.public_key()
+    except ValueError:
+        private_key = None
+        public_key = serialization.load_pem_public_key(pem)
+
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        return EdDSAKey(public_key=public_key, private_key=private_key, kid=kid)
+    if isinstance(public_key, ec.EllipticCurvePublicKey) and isinstance(public_key.curve, ec.SECP256R1):
+        return ES256Key(public_key=public_key, private_key=private_key, kid=kid)
+
+    raise UnknownSigningKey(f'Unsupported pem key {type(public_key).__name__}')
+
+
+class KeyRing:
+    """
+    Active signing key plus keys that still have to verify tokens signed before rotation.
+
+    A retired key is kept for `retention` (the longest token lifetime) and dropped after that.
+    Without a configured key the first signing key is produced by key_factory on demand.
+    """
+
+    def __init__(
+            self,
+            key_factory: Optional[Callable[[], SigningKey]] = None,
+            rotation_interval: Optional[timedelta] = None,
+            retention: timedelta = timedelta(days=1)
+    ):
+        self._key_factory = key_factory
+        self._rotation_interval = rotation_interval.total_seconds() if rotation_interval else None
+        self._retention = retention.total_seconds()
+
+        self._active: Optional[SigningKey] = None
+        self._active_since = 0.0
+        # kid -> (key, retire_at)
+        self._keys: Dict[Optional[str], Tuple[SigningKey, Optional[float]]] = {}
+        self._keys_by_header: Dict[str, SigningKey] = {}
+
+    def _add(self, key: SigningKey, retire_at: Optional[float] = None):
+        self._keys[key.kid] = (key, retire_at)
+        self._keys_by_header[key.header_segment] = key
+
+    def _remove(self, kid: Optional[str]):
+        key, _ = self._keys.pop(kid)
+        self._keys_by_header.pop(key.header_segment, None)
+
+    def add_key(self, key: SigningKey, activate: bool = False):
+        if activate:
+            self._activate(key)
+        else:
+            self._add(key)
+
+    def load(self, signing_key: SigningKey, verification_keys: Iterable[SigningKey] = ()):
+        """
+        Replaces the keys with configured ones and turns the scheduled rotation off,
+        every process has to sign with the same key. A configured key is rotated by moving it to verification_keys
+        """
+        self._keys.clear()
+        self._keys_by_header.clear()
+        self._active = None
+        self._key_factory = None
+        for key in verification_keys:
+            self._add(key)
+        self._activate(signing_key)
+
+    def add_jwks(self, jwks: dict):
+        """
+        Verification only keys, e.g. for a downstream service that verifies our tokens locally
+        """
+        for jwk in jwks['keys']:
+            self._add(key_from_jwk(jwk))
+
+    def _activate(self, key: SigningKey):
+        if not key.can_sign:
+            raise UnknownSigningKey(f'Key {key.kid} has no private part')
+
+        now = time.time()
+        if self._active is not None:
+            self._add(self._active, retire_at=now + self._retention)
+
+        self._add(key)
+        self._active = key
+        self._active_since = now
+
+    def rotate(self) -> SigningKey:
+        if self._key_factory is None:
+            raise UnknownSigningKey('Key ring has no key factory')
+
+        key = self._key_factory()
+        self._activate(key)
+
+        return key
+
+    def _purge_retired(self, now: float):
+        retired = [kid for kid, (_, retire_at) in self._keys.items() if retire_at is not None and retire_at <= now]
+        for kid in retired:
+            self._remove(kid)
+
+    def get_signing_key(self) -> SigningKey:
+        if self._active is None:
+            return self.rotate()
+
+        if self._rotation_interval is not None and self._key_factory is not None:
+            now = time.time()
+            if now - self._active_since >= self._rotation_interval:
+                self.rotate()
+                self._purge_retired(now)
+
+        return self._active
+
+    def get_key_by_header_segment(self, header_segment: str) -> Optional[SigningKey]:
+        key = self._keys_by_header.get(header_segment)
+        if key is None:
+            return None
+
+        return self.get_verification_key(key.kid)
+
+    def get_verification_key(self, kid: Optional[str]) -> SigningKey:
+        entry = self._keys.get(kid)
+        if entry is None:
+            raise UnknownSigningKey(f'Unknown kid {kid}')
+
+        key, retire_at = entry
+        if retire_at is not None and retire_at <= time.time():
+            self._remove(kid)
+            raise UnknownSigningKey(f'Key {kid} is retired')
+
+        return key
+
+    def keys(self) -> List[SigningKey]:
+        return [key for key, _ in self._keys.values()]
+
+    def jwks(self) -> dict:
+        return {'keys': [jwk for jwk in (key.public_jwk() for key in self.keys()) if jwk is not None]}
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Optional
+
+from app.common_lib.metrics import MetricsRegistry, metrics as default_metrics
+
+logger = logging.getLogger(__name__)
+
+OTHER_STACKS = '[other]'
+
+
+def collapse_stack(frame: Optional[FrameType], max_depth: int = 64) -> str:
+    """
+    Root first, ';' separated, the format of flamegraph.pl and speedscope
+    """
+    names = []
+    while frame is not None and len(names) < max_depth:
+        code = frame.f_code
+        names.append(f'{code.co_filename}:{code.co_name}:{frame.f_lineno}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class LoopMonitor:
+    """
+    Event loop lag and blocking call detector.
+
+    A heartbeat task in the loop records how late it wakes up. A watchdog thread checks the last heartbeat
+    and while the loop is blocked for longer than threshold it samples the loop thread stack
+    every sample_interval. While the loop is healthy the watchdog only compares two floats,
+    so the monitor can stay on in production.
+    """
+
+    def __init__(
+            self,
+            threshold: float = 0.1,
+            heartbeat_interval: float = 0.05,
+            sample_interval: float = 0.01,
+            max_stacks: int = 1000,
+            registry: MetricsRegistry = default_metrics
+    ):
+        self._threshold = threshold
+        self._heartbeat_interval = heartbeat_interval
+        self._sample_interval = sample_interval
+        self._max_stacks = max_stacks
+
+        self._lag = registry.histogram('auth_event_loop_lag_seconds', 'Event loop wake up delay').labels()
+        self._blocked = registry.counter(
+            'auth_event_loop_blocked_total', 'Times the loop was blocked for longer than the threshold'
+        ).labels()
+
+        self._stacks: Counter = Counter()
+        self._stacks_lock = threading.Lock()
+        self._last_heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    async def _heartbeat(self):
+        interval = self._heartbeat_interval
+        while True:
+            expected_at = time.monotonic() + interval
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            self._last_heartbeat = now
+            self._lag.record(max(now - expected_at, 0.0))
+
+    def _record_stack(self, stack: str):
+        with self._stacks_lock:
+            if stack not in self._stacks and len(self._stacks) >= self._max_stacks:
+                stack = OTHER_STACKS
+            self._stacks[stack] += 1
+
+    def _watch(self):
+        blocked_since_heartbeat = None
+        while not self._stopped.wait(self._sample_interval):
+            last_heartbeat = self._last_heartbeat
+            if time.monotonic() - last_heartbeat < self._threshold + self._heartbeat_interval:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = collapse_stack(frame)
+            self._record_stack(stack)
+
+            if blocked_since_heartbeat != last_heartbeat:
+                # one report per blocking episode
+                blocked_since_heartbeat = last_heartbeat
+                self._blocked.inc()
+                logger.warning('Event loop is blocked for over %.3fs in %s', self._threshold, stack.rsplit(';', 1)[-1])
+
+    def start(self):
+        if self._heartbeat_task is not None:
+            return
+
+        self._loop_thread_id = threading.get_ident()
+        self._last_heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-monitor', daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        if self._heartbeat_task is None:
+            return
+
+        self._stopped.set()
+        self._watchdog.join()
+        self._heartbeat_task.cancel()
+        try:
+            await self._heartbeat_task
+        except asyncio.CancelledError:
+            pass
+        self._heartbeat_task = None
+        self._watchdog = None
+
+    def collapsed_stacks(self) -> str:
+        """
+        'frame;frame;frame count' lines, each count is one sample_interval of blocking
+        """
+        with self._stacks_lock:
+            items = self._stacks.most_common()
+        return ''.join(f'{stack} {count}\n' for stack, count in items)
+
+    def clear(self):
+        with self._stacks_lock:
+            self._stacks.clear()
@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import smtplib
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from typing import List, Optional, Deque
+
+from app.common_lib.errors import AppError
+from app.common_lib.executor import TimingStats
+
+logger = logging.getLogger(__name__)
+
+
+class EmailQueueIsFull(AppError):
+    pass
+
+
+@dataclass
+class OutgoingEmail:
+    to: str
+    subject: str
+    body: str
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+    last_error: Optional[str] = None
+
+
+class IEmailSender(ABC):
+
+    @abstractmethod
+    async def send(self, emails: List[OutgoingEmail]) -> List[Optional[Exception]]:
+        """
+        Send the batch, returns the error of every email in order, None for the sent ones.
+        Raises if none of them was sent, e.g. the server is down
+        """
+
+
+class IEmailQueue(ABC):
+
+    @abstractmethod
+    def enqueue(self, email: OutgoingEmail):
+        """
+        Accept the email for a later delivery without waiting on the mail server, raises EmailQueueIsFull
+        """
+
+
+class SMTPEmailSender(IEmailSender):
+    """
+    One SMTP connection per batch, smtplib is blocking, so it runs in a thread
+    """
+
+    def __init__(self, host: str, port: int, from_address: str, username: Optional[str] = None,
+                 password: Optional[str] = None, use_tls: bool = False, timeout: float = 10.0):
+        self._host = host
+        self._port = port
+        self._from_address = from_address
+        self._username = username
+        self._password = password
+        self._use_tls = use_tls
+        self._timeout = timeout
+
+    def _to_message(self, email: OutgoingEmail) -> EmailMessage:
+        message = EmailMessage()
+        message['From'] = self._from_address
+        message['To'] = email.to
+        message['Subject'] = email.subject
+        message.set_content(email.body)
+        return message
+
+    def _send(self, emails: List[OutgoingEmail]) -> List[Optional[Exception]]:
+        errors: List[Optional[Exception]] = []
+        with smtplib.SMTP(self._host, self._port, timeout=self._timeout) as smtp:
+            if self._use_tls:
+                smtp.starttls()
+            if self._username:
+                smtp.login(self._username, self._password)
+
+            connection_error: Optional[Exception] = None
+            for email in emails:
+                if connection_error is not None:
+                    errors.append(connection_error)
+                    continue
+                try:
+                    smtp.send_message(self._to_message(email))
+                except smtplib.SMTPServerDisconnected as ex:
+                    connection_error = ex
+                    errors.append(ex)
+                except smtplib.SMTPException as ex:
+                    # refused recipient or message, the connection is still usable
+                    errors.append(ex)
+                except OSError as ex:
+                    connection_error = ex
+                    errors.append(ex)
+                else:
+                    errors.append(None)
+
+        return errors
+
+    async def send(self, emails: List[OutgoingEmail]) -> List[Optional[Exception]]:
+        return await asyncio.to_thread(self._send, emails)
+
+
+@dataclass
+class EmailQueueMetrics:
+    enqueued: int = 0
+    sent: int = 0
+    batches: int = 0
+    # batches of which nothing was sent
+    failed_batches: int = 0
+    # failed attempts of single emails, failed batches included
+    failed: int = 0
+    retried: int = 0
+    dead_lettered: int = 0
+    # one sender call
+    send_latency: TimingStats = field(default_factory=TimingStats)
+    # enqueue till sent, retries included
+    delivery_latency: TimingStats = field(default_factory=TimingStats)
+
+
+class EmailQueue(IEmailQueue):
+    """
+    Bounded in-process outbox, enqueue never waits on the mail server.
+
+    A worker task sends emails in batches of up to batch_size, collected for at most batch_linger seconds.
+    Emails that failed are put back after an exponential backoff, the sent ones of the same batch are not.
+    After max_attempts they are moved to the dead letter list (bounded too, the oldest ones are dropped).
+    """
+
+    def __init__(
+            self,
+            sender: IEmailSender,
+            max_size: int = 10_000,
+            batch_size: int = 50,
+            batch_linger: float = 0.05,
+            max_attempts: int = 5,
+            base_backoff: float = 1.0,
+            max_backoff: float = 60.0,
+            dead_letter_size: int = 1000
+    ):
+        self._sender = sender
+        self._max_size = max_size
+        self._batch_size = batch_size
+        self._batch_linger = batch_linger
+        self._max_attempts = max_attempts
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._retries = set()
+        self.dead_letters: Deque[OutgoingEmail] = deque(maxlen=dead_letter_size)
+        self.metrics = EmailQueueMetrics()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._max_size)
+        return self._queue
+
+    def enqueue(self, email: OutgoingEmail):
+        try:
+            self._get_queue().put_nowait(email)
+        except asyncio.QueueFull:
+            raise EmailQueueIsFull()
+
+        self.metrics.enqueued += 1
+
+    def _dead_letter(self, email: OutgoingEmail):
+        logger.error('Email to %s is dead lettered after %s attempts: %s', email.to, email.attempts, email.last_error)
+        self.metrics.dead_lettered += 1
+        self.dead_letters.append(email)
+
+    async def _retry_later(self, email: OutgoingEmail, delay: float):
+        await asyncio.sleep(delay)
+        try:
+            self._get_queue().put_nowait(email)
+        except asyncio.QueueFull:
+            email.last_error = 'queue is full'
+            self._dead_letter(email)
+
+    def _schedule_retry(self, email: OutgoingEmail):
+        if email.attempts >= self._max_attempts:
+            self._dead_letter(email)
+            return
+
+        self.metrics.retried += 1
+        delay = min(self._base_backoff * 2 ** (email.attempts - 1), self._max_backoff)
+        task = asyncio.create_task(self._retry_later(email, delay))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _collect_batch(self) -> List[OutgoingEmail]:
+        queue = self._get_queue()
+        batch = [await queue.get()]
+
+        deadline = time.monotonic() + self._batch_linger
+        while len(batch) < self._batch_size:
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _send_batch(self, batch: List[OutgoingEmail]):
+        started_at = time.monotonic()
+        try:
+            errors = await self._sender.send(batch)
+        except Exception as ex:
+            logger.warning('Sending of %s emails failed: %r', len(batch), ex)
+            self.metrics.failed_batches += 1
+            errors = [ex] * len(batch)
+        finally:
+            self.metrics.batches += 1
+            self.metrics.send_latency.add(time.monotonic() - started_at)
+
+        finished_at = time.monotonic()
+        for email, error in zip(batch, errors):
+            if error is None:
+                self.metrics.sent += 1
+                self.metrics.delivery_latency.add(finished_at - email.enqueued_at)
+                continue
+
+            self.metrics.failed += 1
+            email.attempts += 1
+            email.last_error = repr(error)
+            self._schedule_retry(email)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            await self._send_batch(batch)
+
+    def start(self):
+        if self._worker is None:
+            self._get_queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def join(self):
+        """
+        Wait until everything enqueued so far was sent or dead lettered
+        """
+        while self.metrics.sent + self.metrics.dead_lettered < self.metrics.enqueued:
+            await asyncio.sleep(self._batch_linger)
+
+    async def stop(self, timeout: Optional[float] = None):
+        if self._worker is None:
+            return
+
+        if timeout:
+            try:
+                await asyncio.wait_for(self.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning('Email queue stopped with %s emails left', self.depth + len(self._retries))
+
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+        for task in list(self._retries):
+            task.cancel()
@@ -0,0 +1,226 @@
+import math
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple, Optional, Sequence
+
+# HDR style log-linear buckets over microseconds: values below SUB_BUCKETS are exact,
+# above that every power of two is split into SUB_BUCKETS / 2 buckets, so the relative error is below 1/16
+SUB_BUCKETS = 32
+_HALF_SUB_BUCKETS = SUB_BUCKETS // 2
+_SUB_BUCKET_BITS = SUB_BUCKETS.bit_length() - 1
+MAX_EXPONENT = 32  # ~ 1.2 hours
+BUCKETS = SUB_BUCKETS + MAX_EXPONENT * _HALF_SUB_BUCKETS
+
+# exported le bounds in seconds
+DEFAULT_EXPORT_BOUNDS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def bucket_index(micros: int) -> int:
+    if micros < SUB_BUCKETS:
+        return max(micros, 0)
+
+    exponent = micros.bit_length() - _SUB_BUCKET_BITS
+    if exponent > MAX_EXPONENT:
+        return BUCKETS - 1
+    return SUB_BUCKETS + (exponent - 1) * _HALF_SUB_BUCKETS + (micros >> exponent) - _HALF_SUB_BUCKETS
+
+
+def bucket_upper_bound(index: int) -> int:
+    """
+    Largest value in microseconds that falls into the bucket
+    """
+    if index < SUB_BUCKETS:
+        return index
+
+    exponent = (index - SUB_BUCKETS) // _HALF_SUB_BUCKETS + 1
+    sub_bucket = (index - SUB_BUCKETS) % _HALF_SUB_BUCKETS + _HALF_SUB_BUCKETS
+    return ((sub_bucket + 1) << exponent) - 1
+
+
+class _HistogramShard:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """
+    Latency histogram, every thread records into its own shard, so record takes no lock.
+    Shards are merged when the histogram is read.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[_HistogramShard] = []
+        self._shards_lock = threading.Lock()
+
+    def _new_shard(self) -> _HistogramShard:
+        shard = self._local.shard = _HistogramShard()
+        with self._shards_lock:
+            self._shards.append(shard)
+        return shard
+
+    def record(self, seconds: float):
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+
+        shard.counts[bucket_index(int(seconds * 1_000_000))] += 1
+        shard.sum += seconds
+        shard.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        counts = [0] * BUCKETS
+        total = 0.0
+        count = 0
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for index, bucket_count in enumerate(shard.counts):
+                if bucket_count:
+                    counts[index] += bucket_count
+            total += shard.sum
+            count += shard.count
+        return counts, total, count
+
+    @property
+    def count(self) -> int:
+        return sum(shard.count for shard in self._shards)
+
+    def percentile(self, q: float) -> float:
+        counts, _, count = self.snapshot()
+        if not count:
+            return 0.0
+
+        rank = max(math.ceil(q / 100 * count), 1)
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bucket_upper_bound(index) / 1_000_000
+        return bucket_upper_bound(BUCKETS - 1) / 1_000_000
+
+
+class Counter:
+    """
+    Incremented from the event loop thread only, so a plain int is enough
+    """
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+
+class _Family(ABC):
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _create_child(self) -> object: ...
+
+    @abstractmethod
+    def export(self) -> List[str]: ...
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._create_child())
+        return child
+
+    def children(self) -> List[Tuple[Tuple[str, ...], object]]:
+        with self._lock:
+            return sorted(self._children.items())
+
+    def _format_labels(self, values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.label_names, values))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class HistogramFamily(_Family):
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str],
+                 export_bounds: Sequence[float] = DEFAULT_EXPORT_BOUNDS):
+        super().__init__(name, documentation, label_names)
+        # le bound -> last bucket that fits under it
+        self._export_bounds = [
+            (bound, max(bucket_index(int(bound * 1_000_000) + 1) - 1, 0)) for bound in export_bounds
+        ]
+
+    def _create_child(self) -> Histogram:
+        return Histogram()
+
+    def export(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for values, histogram in self.children():
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            start = 0
+            for bound, last_index in self._export_bounds:
+                cumulative += sum(counts[start:last_index + 1])
+                start = last_index + 1
+                lines.append(f'{self.name}_bucket{self._format_labels(values, ("le", repr(bound)))} {cumulative}')
+            lines.append(f'{self.name}_bucket{self._format_labels(values, ("le", "+Inf"))} {count}')
+            lines.append(f'{self.name}_sum{self._format_labels(values)} {total}')
+            lines.append(f'{self.name}_count{self._format_labels(values)} {count}')
+        return lines
+
+
+class CounterFamily(_Family):
+    def _create_child(self) -> Counter:
+        return Counter()
+
+    def export(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for values, counter in self.children():
+            lines.append(f'{self.name}{self._format_labels(values)} {counter.value}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = False):
+        # read by the instrumented wrappers on every call
+        self.enabled = enabled
+        self._families: Dict[str, _Family] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, factory) -> _Family:
+        family = self._families.get(name)
+        if family is None:
+            with self._lock:
+                family = self._families.setdefault(name, factory())
+        return family
+
+    def histogram(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> HistogramFamily:
+        return self._get_or_create(name, lambda: HistogramFamily(name, documentation, label_names))
+
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> CounterFamily:
+        return self._get_or_create(name, lambda: CounterFamily(name, documentation, label_names))
+
+    def export_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            families = sorted(self._families.items())
+        for _, family in families:
+            lines += family.export()
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,98 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+@dataclass(frozen=True)
+class TokenBucketRule:
+    capacity: float
+    refill_per_second: float
+
+    @property
+    def seconds_to_full(self) -> float:
+        return self.capacity / self.refill_per_second
+
+
+class IRateLimiter(ABC):
+
+    @abstractmethod
+    async def acquire(self, key: str, cost: float = 1.0) -> float:
+        """
+        Take cost tokens from the key bucket.
+        Returns 0.0 if they were taken, otherwise seconds until the bucket has enough of them.
+        """
+
+
+class _Shard:
+    __slots__ = ('buckets', 'lock')
+
+    def __init__(self):
+        # key -> [tokens, updated_at], least recently used first
+        self.buckets: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+
+class InMemoryRateLimiter(IRateLimiter):
+    """
+    Token buckets of one process, split into shards by key hash.
+
+    Every check is O(1): the touched bucket is moved to the end of its shard,
+    so idle buckets collect at the front and are evicted from there a few at a time,
+    and the least recently used bucket is dropped once a shard reaches its share of max_buckets.
+    """
+
+    _EVICT_PER_CALL = 2
+
+    def __init__(self, rule: TokenBucketRule, shards: int = 16, max_buckets: int = 100_000):
+        self._rule = rule
+        self._shards: List[_Shard] = [_Shard() for _ in range(shards)]
+        self._max_buckets_per_shard = max(max_buckets // shards, 1)
+
+    def _evict(self, shard: _Shard, now: float):
+        buckets = shard.buckets
+        # a bucket idle for seconds_to_full is full again, forgetting it changes nothing
+        for _ in range(self._EVICT_PER_CALL):
+            if not buckets:
+                return
+            _, (_, updated_at) = next(iter(buckets.items()))
+            if now - updated_at < self._rule.seconds_to_full:
+                break
+            buckets.popitem(last=False)
+
+        while len(buckets) >= self._max_buckets_per_shard:
+            buckets.popitem(last=False)
+
+    def try_acquire(self, key: str, cost: float = 1.0, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        rule = self._rule
+        shard = self._shards[hash(key) % len(self._shards)]
+
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                self._evict(shard, now)
+                bucket = shard.buckets[key] = [rule.capacity, now]
+            else:
+                shard.buckets.move_to_end(key)
+                bucket[0] = min(rule.capacity, bucket[0] + (now - bucket[1]) * rule.refill_per_second)
+                bucket[1] = now
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+
+            return (cost - bucket[0]) / rule.refill_per_second
+
+    async def acquire(self, key: str, cost: float = 1.0) -> float:
+        return self.try_acquire(key, cost)
+
+    def __len__(self) -> int:
+        return sum(len(shard.buckets) for shard in self._shards)
+
+    def clear(self):
+        for shard in self._shards:
+            with shard.lock:
+                shard.buckets.clear()
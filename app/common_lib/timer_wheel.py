@@ -0,0 +1,108 @@
+import math
+from typing import Dict, Generic, Hashable, List, Tuple, TypeVar
+
+K = TypeVar('K', bound=Hashable)
+
+
+class TimerWheel(Generic[K]):
+    """
+    Hierarchical timer wheel of expiry deadlines, schedule, cancel and expiry of a key are amortized O(1).
+
+    Level 0 has a slot per tick of resolution seconds, every next level has slots_per_level times wider slots,
+    a slot of an upper level is moved down when the wheel reaches it. Deadlines past the last level
+    are parked in its farthest slot and placed again on every cascade.
+    Cancelled and rescheduled entries are left in their slots and skipped, so cancel is a dict pop.
+    """
+
+    def __init__(self, now: float, resolution: float = 1.0, slots_per_level: int = 64, levels: int = 4):
+        if slots_per_level & (slots_per_level - 1):
+            raise ValueError('slots_per_level has to be a power of two')
+
+        self._resolution = resolution
+        self._bits = slots_per_level.bit_length() - 1
+        self._mask = slots_per_level - 1
+        self._max_delta = (1 << (self._bits * levels)) - 1
+        self._tick = int(now / resolution)
+        self._wheels: List[List[List[Tuple[float, K]]]] = [
+            [[] for _ in range(slots_per_level)] for _ in range(levels)
+        ]
+        self._deadlines: Dict[K, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._deadlines
+
+    def _deadline_tick(self, deadline: float) -> int:
+        # rounded up, a key never expires before its deadline
+        return math.ceil(deadline / self._resolution)
+
+    def _place(self, key: K, deadline: float, min_delta: int = 1):
+        # the slot of the current tick is processed right after a cascade, and is already done otherwise
+        delta = min(max(self._deadline_tick(deadline) - self._tick, min_delta), self._max_delta)
+        tick = self._tick + delta
+
+        level = 0
+        while delta >> (self._bits * (level + 1)):
+            level += 1
+        self._wheels[level][(tick >> (self._bits * level)) & self._mask].append((deadline, key))
+
+    def schedule(self, key: K, deadline: float):
+        """
+        Set or move the deadline of the key
+        """
+        self._deadlines[key] = deadline
+        self._place(key, deadline)
+
+    def cancel(self, key: K):
+        self._deadlines.pop(key, None)
+
+    def _cascade(self):
+        level = 1
+        while level < len(self._wheels) and not self._tick & ((1 << (self._bits * level)) - 1):
+            level += 1
+
+        # top down, so entries moved from an upper level land in a lower slot that is cascaded after them
+        for level in range(level - 1, 0, -1):
+            slots = self._wheels[level]
+            index = (self._tick >> (self._bits * level)) & self._mask
+            entries, slots[index] = slots[index], []
+            for deadline, key in entries:
+                if self._deadlines.get(key) == deadline:
+                    self._place(key, deadline, min_delta=0)
+
+    def advance(self, now: float) -> List[K]:
+        """
+        Move the wheel to now and return the keys whose deadlines have passed, they are removed from the wheel
+        """
+        target = int(now / self._resolution)
+        if not self._deadlines:
+            # nothing but skipped entries is left in the slots
+            self._tick = max(self._tick, target)
+            return []
+
+        expired = []
+        slots = self._wheels[0]
+        while self._tick < target:
+            self._tick += 1
+            self._cascade()
+
+            index = self._tick & self._mask
+            entries, slots[index] = slots[index], []
+            for deadline, key in entries:
+                if self._deadlines.get(key) != deadline:
+                    continue
+                if self._deadline_tick(deadline) <= self._tick:
+                    del self._deadlines[key]
+                    expired.append(key)
+                else:
+                    self._place(key, deadline)
+
+        return expired
+
+    def clear(self):
+        self._deadlines.clear()
+        for wheel in self._wheels:
+            for slot in wheel:
+                slot.clear()
@@ -0,0 +1,133 @@
+"""
+Binary encoding of the embedded store records, shared by the log and the snapshots.
+
+Sessions and verification codes are fixed size, so snapshots keep them as flat arrays that are decoded
+straight from the mapped file with struct.iter_unpack. Datetimes are naive, stored as microseconds.
+"""
+import struct
+import uuid
+from datetime import datetime, timedelta
+from typing import NamedTuple, Tuple
+
+from bson import ObjectId
+
+from app.common_lib.errors import InternalError
+from app.db.memory.journal import SessionStatusChange, SessionDeletion
+from app.db.memory.session import SessionRecord
+from app.db.memory.user import UserRecord
+from app.db.memory.verification_code import VerificationCodeRecord
+from app.domain.models.session import SessionStatus
+from app.domain.models.verification_code import CODE_LEN
+
+EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+STATUSES = tuple(SessionStatus)
+_STATUS_INDEXES = {status: index for index, status in enumerate(STATUSES)}
+
+SESSION = struct.Struct('<12s12s16s32sqB')
+SESSION_STATUS_CHANGE = struct.Struct('<12sB')
+SESSION_DELETION = struct.Struct('<12s')
+VERIFICATION_CODE = struct.Struct(f'<12s{CODE_LEN}sqqI')
+# followed by the email and the password hash
+USER_HEADER = struct.Struct('<12s??H')
+
+# first byte of a log record
+OP_SESSION = 1
+OP_SESSION_STATUS_CHANGE = 2
+OP_SESSION_DELETION = 3
+OP_VERIFICATION_CODE = 4
+OP_USER = 5
+
+
+class CorruptedRecord(InternalError):
+    pass
+
+
+def to_micros(value: datetime) -> int:
+    return (value - EPOCH) // _MICROSECOND
+
+
+def from_micros(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=value)
+
+
+def encode_session(record: SessionRecord) -> bytes:
+    if len(record.refresh_token_digest) != 32:
+        raise ValueError('Refresh token digest has to be a sha256 digest')
+    return SESSION.pack(
+        record.id.binary, record.user_id.binary, record.family_id.bytes, record.refresh_token_digest,
+        to_micros(record.expiration_time), _STATUS_INDEXES[record.status]
+    )
+
+
+def decode_session(fields: Tuple[bytes, bytes, bytes, bytes, int, int]) -> SessionRecord:
+    _id, user_id, family_id, digest, expiration_time, status = fields
+    return SessionRecord(
+        ObjectId(_id), ObjectId(user_id), uuid.UUID(bytes=family_id), digest, from_micros(expiration_time),
+        STATUSES[status]
+    )
+
+
+def encode_verification_code(record: VerificationCodeRecord) -> bytes:
+    return VERIFICATION_CODE.pack(
+        record.id.binary, record.code.encode('ascii'), to_micros(record.issue_date), to_micros(record.exp_date),
+        record.attempts
+    )
+
+
+def decode_verification_code(fields: Tuple[bytes, bytes, int, int, int]) -> VerificationCodeRecord:
+    _id, code, issue_date, exp_date, attempts = fields
+    return VerificationCodeRecord(
+        ObjectId(_id), code.decode('ascii'), from_micros(issue_date), from_micros(exp_date), attempts
+    )
+
+
+def encode_user(record: UserRecord) -> bytes:
+    email = record.email.encode('utf-8')
+    return USER_HEADER.pack(record.id.binary, record.is_admin, record.is_email_verified, len(email)) \
+        + email + record.hashed_password
+
+
+def decode_user(data: bytes) -> UserRecord:
+    _id, is_admin, is_email_verified, email_len = USER_HEADER.unpack_from(data)
+    email_end = USER_HEADER.size + email_len
+    return UserRecord(
+        ObjectId(_id), bytes(data[USER_HEADER.size:email_end]).decode('utf-8'), bytes(data[email_end:]),
+        is_admin, is_email_verified
+    )
+
+
+def encode_log_record(record: NamedTuple) -> bytes:
+    if isinstance(record, SessionRecord):
+        return bytes((OP_SESSION,)) + encode_session(record)
+    if isinstance(record, SessionStatusChange):
+        return bytes((OP_SESSION_STATUS_CHANGE,)) + SESSION_STATUS_CHANGE.pack(
+            record.id.binary, _STATUS_INDEXES[record.status]
+        )
+    if isinstance(record, SessionDeletion):
+        return bytes((OP_SESSION_DELETION,)) + SESSION_DELETION.pack(record.id.binary)
+    if isinstance(record, VerificationCodeRecord):
+        return bytes((OP_VERIFICATION_CODE,)) + encode_verification_code(record)
+    if isinstance(record, UserRecord):
+        return bytes((OP_USER,)) + encode_user(record)
+    raise TypeError(f'{type(record).__name__} is not a log record')
+
+
+def decode_log_record(data: bytes) -> NamedTuple:
+    op, body = data[0], memoryview(data)[1:]
+    try:
+        if op == OP_SESSION:
+            return decode_session(SESSION.unpack(body))
+        if op == OP_SESSION_STATUS_CHANGE:
+            _id, status = SESSION_STATUS_CHANGE.unpack(body)
+            return SessionStatusChange(ObjectId(_id), STATUSES[status])
+        if op == OP_SESSION_DELETION:
+            return SessionDeletion(ObjectId(SESSION_DELETION.unpack(body)[0]))
+        if op == OP_VERIFICATION_CODE:
+            return decode_verification_code(VERIFICATION_CODE.unpack(body))
+        if op == OP_USER:
+            return decode_user(body)
+    except (struct.error, IndexError, UnicodeDecodeError) as ex:
+        raise CorruptedRecord(f'Malformed record of op {op}') from ex
+    raise CorruptedRecord(f'Unknown op {op}')
@@ -0,0 +1,56 @@
+from abc import ABC, abstractmethod
+from typing import NamedTuple, Optional
+
+from bson import ObjectId
+
+from app.domain.models.session import SessionStatus
+
+
+class SessionStatusChange(NamedTuple):
+    id: ObjectId
+    status: SessionStatus
+
+
+class SessionDeletion(NamedTuple):
+    id: ObjectId
+
+
+class IJournal(ABC):
+    """
+    Durable log of the changes of the embedded repos.
+
+    Records are full states or deletions, never increments, so replaying a record twice is harmless.
+    """
+
+    @abstractmethod
+    def append(self, record: NamedTuple):
+        """
+        Called right after the change is applied in memory, in the same event loop step
+        """
+
+    @abstractmethod
+    async def commit(self):
+        """
+        Wait until everything appended so far is durable
+        """
+
+
+class JournaledRepo:
+    """
+    Repos apply a change, append it and await commit before they return,
+    so a caller never sees success for a change that can be lost
+    """
+
+    def __init__(self):
+        self._journal: Optional[IJournal] = None
+
+    def attach_journal(self, journal: IJournal):
+        self._journal = journal
+
+    def _append(self, record: NamedTuple):
+        if self._journal is not None:
+            self._journal.append(record)
+
+    async def _commit(self):
+        if self._journal is not None:
+            await self._journal.commit()
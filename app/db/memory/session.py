@@ -0,0 +1,258 @@
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional, Iterable, AsyncIterator, List, Any, Dict, Set, NamedTuple, Callable
+
+from bson import ObjectId
+
+from app.common_lib.timer_wheel import TimerWheel
+from app.db.memory.journal import JournaledRepo, SessionStatusChange, SessionDeletion
+from app.domain.models.session import Session, SessionStatus, SessionIsNotActive, ReusingOfRefreshToken
+from app.domain.models.tokens import RefreshToken
+from app.domain.repos.session import ISessionRepo, SessionSweepCandidate
+
+
+class SessionRecord(NamedTuple):
+    """
+    Stored state of a session, records are never changed in place, a write stores a new one
+    """
+    id: ObjectId
+    user_id: ObjectId
+    family_id: uuid.UUID
+    refresh_token_digest: bytes
+    expiration_time: datetime
+    status: SessionStatus
+
+    @classmethod
+    def from_session(cls, session: Session) -> 'SessionRecord':
+        return cls(
+            session.id, session.user_id, session.family_id, session.refresh_token_digest,
+            session.expiration_time, session.status
+        )
+
+    def to_session(self) -> Session:
+        return Session.from_record(**self._asdict())
+
+
+class InMemorySessionRepo(ISessionRepo, JournaledRepo):
+    """
+    Embedded session store with the semantics of the mongo repo.
+
+    Sessions are indexed by id, refresh token digest, user and family. Expired sessions are dropped
+    by a timer wheel at expiration_time, like by the TTL index, at the start of every call.
+    Reads build a new Session from an immutable record, so callers can change it without copying the store.
+    Every call changes the store without awaits, so it is atomic on the event loop,
+    with a journal it awaits the commit after the change.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time, resolution: float = 1.0):
+        super().__init__()
+        self._clock = clock
+        self._sessions: Dict[ObjectId, SessionRecord] = {}
+        self._by_digest: Dict[bytes, ObjectId] = {}
+        self._by_user: Dict[ObjectId, Set[ObjectId]] = defaultdict(set)
+        self._by_family: Dict[uuid.UUID, Set[ObjectId]] = defaultdict(set)
+        # not ACTIVE, the sweep candidates besides the expired sessions the timer wheel drops itself
+        self._inactive: Set[ObjectId] = set()
+        self._expiries: TimerWheel[ObjectId] = TimerWheel(clock(), resolution=resolution)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def records(self) -> List[SessionRecord]:
+        """
+        Point in time copy of the store, the records themselves are shared
+        """
+        return list(self._sessions.values())
+
+    def apply_put(self, record: SessionRecord):
+        previous = self._sessions.get(record.id)
+        if previous is not None:
+            if previous.refresh_token_digest != record.refresh_token_digest:
+                del self._by_digest[previous.refresh_token_digest]
+            if previous.user_id != record.user_id:
+                self._discard_from_index(self._by_user, previous.user_id, record.id)
+            if previous.family_id != record.family_id:
+                self._discard_from_index(self._by_family, previous.family_id, record.id)
+
+        self._sessions[record.id] = record
+        self._by_digest[record.refresh_token_digest] = record.id
+        self._by_user[record.user_id].add(record.id)
+        self._by_family[record.family_id].add(record.id)
+        if record.status is SessionStatus.ACTIVE:
+            self._inactive.discard(record.id)
+        else:
+            self._inactive.add(record.id)
+        if previous is None or previous.expiration_time != record.expiration_time:
+            self._expiries.schedule(record.id, record.expiration_time.timestamp())
+
+    @staticmethod
+    def _discard_from_index(index: Dict[Any, Set[ObjectId]], key: Any, _id: ObjectId):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(_id)
+            if not ids:
+                del index[key]
+
+    def apply_status_change(self, change: SessionStatusChange):
+        record = self._sessions.get(change.id)
+        if record is not None:
+            self.apply_put(record._replace(status=change.status))
+
+    def apply_delete(self, _id: ObjectId) -> bool:
+        record = self._sessions.pop(_id, None)
+        if record is None:
+            return False
+
+        del self._by_digest[record.refresh_token_digest]
+        self._discard_from_index(self._by_user, record.user_id, _id)
+        self._discard_from_index(self._by_family, record.family_id, _id)
+        self._inactive.discard(_id)
+        self._expiries.cancel(_id)
+        return True
+
+    def _evict_expired(self):
+        # not journaled, expired sessions of a recovered store are evicted again
+        for _id in self._expiries.advance(self._clock()):
+            self.apply_delete(_id)
+
+    def _put(self, record: SessionRecord):
+        self.apply_put(record)
+        self._append(record)
+
+    def _change_status(self, record: SessionRecord, status: SessionStatus):
+        self.apply_put(record._replace(status=status))
+        self._append(SessionStatusChange(record.id, status))
+
+    def _set_status(
+            self,
+            ids: Iterable[ObjectId],
+            status: SessionStatus,
+            only_from: Optional[SessionStatus] = None
+    ) -> int:
+        changed = 0
+        for _id in list(ids):
+            record = self._sessions[_id]
+            if record.status is status or (only_from is not None and record.status is not only_from):
+                continue
+            self._change_status(record, status)
+            changed += 1
+        return changed
+
+    async def insert(self, session: Session) -> Session:
+        self._evict_expired()
+        if session.id is None:
+            session.id = ObjectId()
+        self._put(SessionRecord.from_session(session))
+        await self._commit()
+
+        return session
+
+    async def update(self, session: Session):
+        self._evict_expired()
+        if session.id in self._sessions:
+            self._put(SessionRecord.from_session(session))
+            await self._commit()
+
+    async def find_session_by_id(self, _id: str, user_id: str) -> Optional[Session]:
+        self._evict_expired()
+        record = self._sessions.get(ObjectId(_id))
+        if record is None or record.user_id != ObjectId(user_id):
+            return None
+        return record.to_session()
+
+    async def find_session_by_token_digest(self, digest: bytes) -> Optional[Session]:
+        self._evict_expired()
+        _id = self._by_digest.get(digest)
+        return self._sessions[_id].to_session() if _id is not None else None
+
+    async def invalidate_session_family(self, session: Session):
+        await self.invalidate_session_families([session.family_id])
+
+    async def invalidate_session_families(
+            self,
+            family_ids: Iterable[uuid.UUID],
+            status: SessionStatus = SessionStatus.COMPROMISED
+    ) -> int:
+        self._evict_expired()
+        changed = sum(self._set_status(self._by_family.get(family_id, ()), status) for family_id in family_ids)
+        await self._commit()
+
+        return changed
+
+    async def invalidate_users_sessions(self, user_ids: Iterable[str]) -> int:
+        self._evict_expired()
+        changed = sum(
+            self._set_status(self._by_user.get(ObjectId(user_id), ()), SessionStatus.LOGOUT, SessionStatus.ACTIVE)
+            for user_id in user_ids
+        )
+        await self._commit()
+
+        return changed
+
+    async def rotate_session(self, token_digest: bytes, refresh_token: RefreshToken) -> Session:
+        self._evict_expired()
+        _id = self._by_digest.get(token_digest)
+        record = self._sessions[_id] if _id is not None else None
+
+        if record is None or (record.status is SessionStatus.ACTIVE and record.expiration_time <= datetime.now()):
+            raise SessionIsNotActive()
+        if record.status is SessionStatus.REFRESHED:
+            self._set_status(self._by_family[record.family_id], SessionStatus.COMPROMISED)
+            await self._commit()
+            raise ReusingOfRefreshToken()
+        if record.status is not SessionStatus.ACTIVE:
+            raise SessionIsNotActive()
+
+        self._change_status(record, SessionStatus.REFRESHED)
+        new_session = Session.create_from_refreshed(
+            refreshed_session=self._sessions[record.id].to_session(), refresh_token=refresh_token
+        )
+        new_session.id = ObjectId()
+        self._put(SessionRecord.from_session(new_session))
+        await self._commit()
+
+        return new_session
+
+    async def find_family_statuses(self, family_ids: Iterable[uuid.UUID]) -> Dict[uuid.UUID, SessionStatus]:
+        self._evict_expired()
+        now = datetime.now()
+        statuses = {}
+        for family_id in family_ids:
+            ids = self._by_family.get(family_id)
+            if ids:
+                # ObjectIds of one process increase, the largest one is the newest session
+                record = self._sessions[max(ids)]
+                # the timer wheel evicts up to one tick late
+                if record.status is not SessionStatus.ACTIVE or record.expiration_time > now:
+                    statuses[family_id] = record.status
+
+        return statuses
+
+    async def iter_sweep_candidates(self, now: datetime, batch_size: int) -> AsyncIterator[List[SessionSweepCandidate]]:
+        # expired sessions are already gone, only the inactive ones are left to sweep
+        self._evict_expired()
+        # newest first within a family, the second sort is stable and keeps that order
+        records = sorted((self._sessions[_id] for _id in self._inactive), key=lambda record: record.id, reverse=True)
+        records.sort(key=lambda record: record.family_id.bytes)
+
+        for start in range(0, len(records), batch_size):
+            yield [
+                SessionSweepCandidate(
+                    id=record.id, family_id=record.family_id, status=record.status,
+                    expiration_time=record.expiration_time
+                )
+                for record in records[start:start + batch_size]
+            ]
+
+    async def delete_sessions(self, ids: List[Any], archive: bool = False) -> int:
+        # there is no archive in embedded mode, archived sessions are only needed for incident forensics
+        deleted = 0
+        for _id in ids:
+            if self.apply_delete(_id):
+                self._append(SessionDeletion(_id))
+                deleted += 1
+        await self._commit()
+
+        return deleted
@@ -0,0 +1,153 @@
+import mmap
+import os
+import struct
+import zlib
+from typing import List, Iterator, Optional, Callable, Sequence, Any
+
+from app.common_lib.errors import InternalError
+from app.db.memory.codec import SESSION, VERIFICATION_CODE, encode_session, encode_verification_code, encode_user, \
+    decode_session, decode_verification_code, decode_user
+from app.db.memory.session import SessionRecord
+from app.db.memory.user import UserRecord
+from app.db.memory.verification_code import VerificationCodeRecord
+
+MAGIC = b'AUTHSNAP'
+VERSION = 1
+# version, generation, number of sessions, verification codes and users
+HEADER = struct.Struct('<HQQQQ')
+USER_LENGTH = struct.Struct('<I')
+FOOTER = struct.Struct('<I')
+
+# records encoded and written at once
+WRITE_CHUNK_SIZE = 65_536
+
+
+class SnapshotIsCorrupted(InternalError):
+    pass
+
+
+def _write_chunked(file, records: Sequence[Any], encode: Callable[[Any], bytes], crc: int) -> int:
+    for start in range(0, len(records), WRITE_CHUNK_SIZE):
+        data = b''.join(encode(record) for record in records[start:start + WRITE_CHUNK_SIZE])
+        file.write(data)
+        crc = zlib.crc32(data, crc)
+    return crc
+
+
+def _encode_user_entry(record: UserRecord) -> bytes:
+    data = encode_user(record)
+    return USER_LENGTH.pack(len(data)) + data
+
+
+def write_snapshot(
+        path: str,
+        generation: int,
+        sessions: Sequence[SessionRecord],
+        ver_codes: Sequence[VerificationCodeRecord],
+        users: Sequence[UserRecord]
+):
+    """
+    Header, flat arrays of sessions and codes, length-prefixed users and a crc32 of all of it.
+    Written to a temporary file and renamed, so a crash never leaves a partial snapshot under path
+    """
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as file:
+        head = MAGIC + HEADER.pack(VERSION, generation, len(sessions), len(ver_codes), len(users))
+        file.write(head)
+        crc = zlib.crc32(head)
+        crc = _write_chunked(file, sessions, encode_session, crc)
+        crc = _write_chunked(file, ver_codes, encode_verification_code, crc)
+        crc = _write_chunked(file, users, _encode_user_entry, crc)
+        file.write(FOOTER.pack(crc))
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(tmp_path, path)
+    _fsync_directory(os.path.dirname(path))
+
+
+def _fsync_directory(directory: str):
+    fd = os.open(directory or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SnapshotReader:
+    """
+    Reads a snapshot through a read-only memory map, records are decoded lazily straight from the page cache
+    without reading the file into a buffer first
+    """
+
+    def __init__(self, path: str, verify_checksum: bool = True):
+        self._file = open(path, 'rb')
+        self._mmap: Optional[mmap.mmap] = None
+        self._views: List[memoryview] = []
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._parse(verify_checksum)
+        except BaseException:
+            self.close()
+            raise
+
+    def _view(self, start: int, end: int) -> memoryview:
+        view = memoryview(self._mmap)[start:end]
+        self._views.append(view)
+        return view
+
+    def _parse(self, verify_checksum: bool):
+        size = len(self._mmap)
+        head_size = len(MAGIC) + HEADER.size
+        if size < head_size + FOOTER.size or self._mmap[:len(MAGIC)] != MAGIC:
+            raise SnapshotIsCorrupted('Not a snapshot')
+
+        version, self.generation, self.sessions_count, self.ver_codes_count, self.users_count = \
+            HEADER.unpack_from(self._mmap, len(MAGIC))
+        if version != VERSION:
+            raise SnapshotIsCorrupted(f'Unsupported snapshot version {version}')
+
+        body_end = size - FOOTER.size
+        if verify_checksum:
+            body = self._view(0, body_end)
+            if zlib.crc32(body) != FOOTER.unpack_from(self._mmap, body_end)[0]:
+                raise SnapshotIsCorrupted('Checksum mismatch')
+
+        self._sessions_start = head_size
+        self._ver_codes_start = self._sessions_start + self.sessions_count * SESSION.size
+        self._users_start = self._ver_codes_start + self.ver_codes_count * VERIFICATION_CODE.size
+        self._users_end = body_end
+        if self._users_start > body_end:
+            raise SnapshotIsCorrupted('Snapshot is truncated')
+
+    def sessions(self) -> Iterator[SessionRecord]:
+        for fields in SESSION.iter_unpack(self._view(self._sessions_start, self._ver_codes_start)):
+            yield decode_session(fields)
+
+    def ver_codes(self) -> Iterator[VerificationCodeRecord]:
+        for fields in VERIFICATION_CODE.iter_unpack(self._view(self._ver_codes_start, self._users_start)):
+            yield decode_verification_code(fields)
+
+    def users(self) -> Iterator[UserRecord]:
+        view = self._view(self._users_start, self._users_end)
+        offset = 0
+        for _ in range(self.users_count):
+            length, = USER_LENGTH.unpack_from(view, offset)
+            offset += USER_LENGTH.size
+            yield decode_user(view[offset:offset + length])
+            offset += length
+
+    def close(self):
+        for view in self._views:
+            view.release()
+        self._views = []
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self) -> 'SnapshotReader':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, NamedTuple, Callable, Dict, List, IO
+
+from app.common_lib.errors import InternalError
+from app.common_lib.file_lock import try_lock_file
+
+from app.db.memory.codec import encode_log_record, decode_log_record
+from app.db.memory.journal import IJournal, SessionStatusChange, SessionDeletion
+from app.db.memory.session import InMemorySessionRepo, SessionRecord
+from app.db.memory.snapshot import SnapshotReader, write_snapshot
+from app.db.memory.user import InMemoryUserAuthRepo, UserRecord
+from app.db.memory.verification_code import InMemoryVerificationCodeRepo, VerificationCodeRecord
+from app.db.memory.wal import WriteAheadLog, read_frames
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = 'snapshot-{:016d}.snap'
+LOG_FILE = 'wal-{:016d}.log'
+LOCK_FILE = 'LOCK'
+_FILE_PATTERN = re.compile(r'^(snapshot|wal)-(\d{16})\.(snap|log)$')
+
+CHECKPOINT_LOG_SIZE = 64 * 1024 * 1024
+CHECKPOINT_CHECK_INTERVAL_SECONDS = 10.0
+
+
+class StoreIsLocked(InternalError):
+    pass
+
+
+@dataclass
+class RecoveryStats:
+    snapshot_generation: Optional[int] = None
+    snapshot_records: int = 0
+    snapshot_seconds: float = 0.0
+    log_files: int = 0
+    log_records: int = 0
+    log_seconds: float = 0.0
+    truncated_bytes: int = 0
+
+
+class EmbeddedStore(IJournal):
+    """
+    Single node storage of users, sessions and verification codes without mongo.
+
+    The state lives in the in-memory repos, every change is appended to a write ahead log before the repo call
+    returns. Generation g consists of snapshot-g, the state when wal-g was started, and wal-g itself.
+    A checkpoint starts the next generation and writes its snapshot, after that the older files are removed.
+    Recovery loads the newest snapshot and replays the logs of its generation and the later ones,
+    then writes the snapshot of the generation it starts.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            sync_interval: float = 0.002,
+            fsync: bool = True,
+            checkpoint_log_size: int = CHECKPOINT_LOG_SIZE,
+            checkpoint_check_interval: float = CHECKPOINT_CHECK_INTERVAL_SECONDS,
+            clock: Callable[[], float] = time.time
+    ):
+        self._directory = directory
+        self._sync_interval = sync_interval
+        self._fsync = fsync
+        self._checkpoint_log_size = checkpoint_log_size
+        self._checkpoint_check_interval = checkpoint_check_interval
+
+        self.user_repo = InMemoryUserAuthRepo()
+        self.session_repo = InMemorySessionRepo(clock=clock)
+        self.ver_code_repo = InMemoryVerificationCodeRepo(clock=clock)
+
+        self._generation = 0
+        self._lock_file: Optional[IO] = None
+        self._wal: Optional[WriteAheadLog] = None
+        self._checkpoint_lock = asyncio.Lock()
+        self._checkpointer: Optional[asyncio.Task] = None
+        self.recovery_stats: Optional[RecoveryStats] = None
+
+    @property
+    def wal(self) -> Optional[WriteAheadLog]:
+        return self._wal
+
+    def _path(self, template: str, generation: int) -> str:
+        return os.path.join(self._directory, template.format(generation))
+
+    def _list_generations(self) -> Dict[str, List[int]]:
+        generations = {'snapshot': [], 'wal': []}
+        for name in os.listdir(self._directory):
+            match = _FILE_PATTERN.match(name)
+            if match is not None:
+                generations[match.group(1)].append(int(match.group(2)))
+            elif name.endswith('.tmp'):
+                # a snapshot interrupted by a crash
+                os.unlink(os.path.join(self._directory, name))
+        return {kind: sorted(values) for kind, values in generations.items()}
+
+    def append(self, record: NamedTuple):
+        self._wal.append(encode_log_record(record))
+
+    async def commit(self):
+        await self._wal.commit()
+
+    def _apply(self, record: NamedTuple):
+        if isinstance(record, SessionRecord):
+            self.session_repo.apply_put(record)
+        elif isinstance(record, SessionStatusChange):
+            self.session_repo.apply_status_change(record)
+        elif isinstance(record, SessionDeletion):
+            self.session_repo.apply_delete(record.id)
+        elif isinstance(record, VerificationCodeRecord):
+            self.ver_code_repo.apply_put(record)
+        elif isinstance(record, UserRecord):
+            self.user_repo.apply_put(record)
+
+    def _load_snapshot(self, generation: int, stats: RecoveryStats):
+        started_at = time.perf_counter()
+        with SnapshotReader(self._path(SNAPSHOT_FILE, generation)) as reader:
+            for record in reader.users():
+                self.user_repo.apply_put(record)
+            for record in reader.ver_codes():
+                self.ver_code_repo.apply_put(record)
+            for record in reader.sessions():
+                self.session_repo.apply_put(record)
+            stats.snapshot_records = reader.users_count + reader.ver_codes_count + reader.sessions_count
+
+        stats.snapshot_generation = generation
+        stats.snapshot_seconds = time.perf_counter() - started_at
+
+    def _replay_log(self, generation: int, stats: RecoveryStats):
+        path = self._path(LOG_FILE, generation)
+        with open(path, 'rb') as file:
+            data = file.read()
+
+        payloads, end = read_frames(data)
+        for payload in payloads:
+            self._apply(decode_log_record(payload))
+
+        if end < len(data):
+            logger.warning('Dropping %s bytes of a torn record at the end of %s', len(data) - end, path)
+            os.truncate(path, end)
+            stats.truncated_bytes += len(data) - end
+
+        stats.log_files += 1
+        stats.log_records += len(payloads)
+
+    def _lock(self):
+        # two processes recovering and appending to the same generation would corrupt the files
+        self._lock_file = try_lock_file(os.path.join(self._directory, LOCK_FILE))
+        if self._lock_file is None:
+            raise StoreIsLocked(f'{self._directory} is used by another store')
+
+    def _unlock(self):
+        if self._lock_file is not None:
+            # closing the file releases the lock
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _recover(self) -> RecoveryStats:
+        generations = self._list_generations()
+        stats = RecoveryStats()
+
+        snapshot_generation = generations['snapshot'][-1] if generations['snapshot'] else 0
+        if generations['snapshot']:
+            self._load_snapshot(snapshot_generation, stats)
+
+        started_at = time.perf_counter()
+        for generation in generations['wal']:
+            if generation >= snapshot_generation:
+                self._replay_log(generation, stats)
+        stats.log_seconds = time.perf_counter() - started_at
+
+        # every start gets its own log, so a torn tail is never followed by new records
+        self._generation = max(generations['snapshot'] + generations['wal'] + [0]) + 1
+
+        if stats.log_files:
+            # the snapshot of the new generation replaces the replayed logs, otherwise every restart would leave
+            # one more log for the next recovery until a checkpoint
+            self._write_snapshot(
+                self._generation, self.session_repo.records(), self.ver_code_repo.records(), self.user_repo.records()
+            )
+            self._remove_older_generations(self._generation)
+
+        return stats
+
+    async def open(self):
+        self._lock()
+        try:
+            # nothing else touches the repos until the recovery is over
+            self.recovery_stats = await asyncio.to_thread(self._recover)
+        except BaseException:
+            self._unlock()
+            raise
+        logger.info('Embedded store recovered: %s', self.recovery_stats)
+
+        self._wal = WriteAheadLog(self._path(LOG_FILE, self._generation), self._sync_interval, self._fsync)
+        await self._wal.open()
+        for repo in (self.user_repo, self.session_repo, self.ver_code_repo):
+            repo.attach_journal(self)
+
+        self._checkpointer = asyncio.create_task(self._run_checkpoints())
+
+    def _remove_older_generations(self, generation: int):
+        generations = self._list_generations()
+        for template, kind in ((SNAPSHOT_FILE, 'snapshot'), (LOG_FILE, 'wal')):
+            for old_generation in generations[kind]:
+                if old_generation < generation:
+                    os.unlink(self._path(template, old_generation))
+
+    def _write_snapshot(
+            self, generation: int, sessions: List[SessionRecord], ver_codes: List[VerificationCodeRecord],
+            users: List[UserRecord]
+    ):
+        # expired records are dropped here, off the loop
+        now = datetime.now()
+        sessions = [record for record in sessions if record.expiration_time > now]
+        ver_codes = [record for record in ver_codes if record.exp_date > now]
+        write_snapshot(self._path(SNAPSHOT_FILE, generation), generation, sessions, ver_codes, users)
+
+    async def checkpoint(self):
+        async with self._checkpoint_lock:
+            generation = self._generation + 1
+            await self._wal.rotate(self._path(LOG_FILE, generation))
+            self._generation = generation
+
+            # taken in one loop step right after the rotation, records appended meanwhile are in both,
+            # replaying them over the snapshot is harmless. The records are immutable, so the lists are enough
+            sessions = self.session_repo.records()
+            ver_codes = self.ver_code_repo.records()
+            users = self.user_repo.records()
+
+            await asyncio.to_thread(self._write_snapshot, generation, sessions, ver_codes, users)
+            await asyncio.to_thread(self._remove_older_generations, generation)
+
+    async def _run_checkpoints(self):
+        while True:
+            await asyncio.sleep(self._checkpoint_check_interval)
+            if self._wal.size < self._checkpoint_log_size:
+                continue
+            try:
+                # close waits for a started checkpoint instead of interrupting it
+                await asyncio.shield(self.checkpoint())
+            except Exception:
+                logger.exception('Checkpoint failed')
+
+    async def close(self):
+        if self._checkpointer is not None:
+            self._checkpointer.cancel()
+            try:
+                await self._checkpointer
+            except asyncio.CancelledError:
+                pass
+            self._checkpointer = None
+
+        async with self._checkpoint_lock:
+            pass
+        if self._wal is not None:
+            await self._wal.close()
+            self._wal = None
+        self._unlock()
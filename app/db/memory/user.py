@@ -0,0 +1,77 @@
+from typing import Optional, Dict, NamedTuple, List
+
+from bson import ObjectId
+
+from app.db.memory.journal import JournaledRepo
+from app.domain.models.user import UserAuth
+from app.domain.repos.user import IUserAuthRepo, UserEmailIsTaken
+
+
+class UserRecord(NamedTuple):
+    id: ObjectId
+    email: str
+    hashed_password: bytes
+    is_admin: bool
+    is_email_verified: bool
+
+    @classmethod
+    def from_user(cls, user: UserAuth) -> 'UserRecord':
+        return cls(user.id, user.email, user.hashed_password, user.is_admin, user.is_email_verified)
+
+    def to_user(self) -> UserAuth:
+        return UserAuth.from_record(**self._asdict())
+
+
+class InMemoryUserAuthRepo(IUserAuthRepo, JournaledRepo):
+    """
+    Embedded user store indexed by id and email, reads build a new UserAuth from an immutable record
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._users: Dict[ObjectId, UserRecord] = {}
+        self._by_email: Dict[str, ObjectId] = {}
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def records(self) -> List[UserRecord]:
+        return list(self._users.values())
+
+    def apply_put(self, record: UserRecord):
+        previous = self._users.get(record.id)
+        if previous is not None and previous.email != record.email:
+            del self._by_email[previous.email]
+        self._users[record.id] = record
+        self._by_email[record.email] = record.id
+
+    def _put(self, record: UserRecord):
+        self.apply_put(record)
+        self._append(record)
+
+    async def does_user_exists(self, email: str) -> bool:
+        return email in self._by_email
+
+    async def find_by_id(self, _id: str) -> Optional[UserAuth]:
+        record = self._users.get(ObjectId(_id))
+        return record.to_user() if record is not None else None
+
+    async def find_by_email(self, email: str) -> Optional[UserAuth]:
+        _id = self._by_email.get(email)
+        return self._users[_id].to_user() if _id is not None else None
+
+    async def insert(self, user: UserAuth) -> UserAuth:
+        # the unique email index of the mongo repo
+        if user.email in self._by_email:
+            raise UserEmailIsTaken()
+
+        user.id = ObjectId()
+        self._put(UserRecord.from_user(user))
+        await self._commit()
+
+        return user
+
+    async def update(self, user: UserAuth):
+        if user.id in self._users:
+            self._put(UserRecord.from_user(user))
+            await self._commit()
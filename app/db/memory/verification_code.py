@@ -0,0 +1,97 @@
+import time
+from datetime import datetime
+from typing import Dict, Optional, Callable, NamedTuple, List
+
+from bson import ObjectId
+
+from app.common_lib.timer_wheel import TimerWheel
+from app.db.memory.journal import JournaledRepo
+from app.domain.models.verification_code import VerificationCode
+from app.domain.repos.verification_code import IVerificationCodeRepo
+
+
+class VerificationCodeRecord(NamedTuple):
+    id: ObjectId
+    code: str
+    issue_date: datetime
+    exp_date: datetime
+    attempts: int
+
+    @classmethod
+    def from_ver_code(cls, ver_code: VerificationCode) -> 'VerificationCodeRecord':
+        return cls(ver_code.id, ver_code.code, ver_code.issue_date, ver_code.exp_date, ver_code.attempts)
+
+    def to_ver_code(self) -> VerificationCode:
+        return VerificationCode.from_record(**self._asdict())
+
+
+class InMemoryVerificationCodeRepo(IVerificationCodeRepo, JournaledRepo):
+    """
+    Embedded counterpart of the mongo repo, codes are dropped by a timer wheel at exp_date like by the TTL index.
+
+    Expired codes are evicted at the start of every call, so there is no background task.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time, resolution: float = 1.0):
+        super().__init__()
+        self._clock = clock
+        self._codes: Dict[ObjectId, VerificationCodeRecord] = {}
+        self._expiries: TimerWheel[ObjectId] = TimerWheel(clock(), resolution=resolution)
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def records(self) -> List[VerificationCodeRecord]:
+        return list(self._codes.values())
+
+    def _evict_expired(self):
+        for user_id in self._expiries.advance(self._clock()):
+            del self._codes[user_id]
+
+    def apply_put(self, record: VerificationCodeRecord):
+        previous = self._codes.get(record.id)
+        self._codes[record.id] = record
+        if previous is None or previous.exp_date != record.exp_date:
+            self._expiries.schedule(record.id, record.exp_date.timestamp())
+
+    def _put(self, record: VerificationCodeRecord):
+        self.apply_put(record)
+        self._append(record)
+
+    async def find_by_user_id(self, user_id: str) -> Optional[VerificationCode]:
+        self._evict_expired()
+        record = self._codes.get(ObjectId(user_id))
+        return record.to_ver_code() if record is not None else None
+
+    async def insert(self, ver_code: VerificationCode):
+        self._evict_expired()
+        self._put(VerificationCodeRecord.from_ver_code(ver_code))
+        await self._commit()
+
+    async def update(self, ver_code: VerificationCode):
+        self._evict_expired()
+        if ver_code.id in self._codes:
+            self._put(VerificationCodeRecord.from_ver_code(ver_code))
+            await self._commit()
+
+    async def upsert_for_resend(self, ver_code: VerificationCode) -> bool:
+        self._evict_expired()
+        previous = self._codes.get(ver_code.id)
+        if previous is not None:
+            ver_code.check_can_replace(previous.to_ver_code())
+        self._put(VerificationCodeRecord.from_ver_code(ver_code))
+        await self._commit()
+
+        return previous is not None
+
+    async def register_attempt(self, user_id: str) -> Optional[VerificationCode]:
+        self._evict_expired()
+        record = self._codes.get(ObjectId(user_id))
+        if record is None:
+            return None
+
+        record = record._replace(attempts=record.attempts + 1)
+        self._put(record)
+        await self._commit()
+
+        return record.to_ver_code()
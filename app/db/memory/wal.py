@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional, Deque, Tuple, BinaryIO
+
+from app.common_lib.errors import InternalError
+from app.common_lib.executor import TimingStats
+
+logger = logging.getLogger(__name__)
+
+# payload length and crc32 of the payload
+FRAME_HEADER = struct.Struct('<II')
+
+
+class LogWriteFailed(InternalError):
+    pass
+
+
+def frame(payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_frames(data: bytes) -> Tuple[List[bytes], int]:
+    """
+    Payloads of the complete records and the offset after the last one,
+    reading stops at a torn or corrupted record, which can only be the unsynced tail of a crash
+    """
+    payloads = []
+    offset = 0
+    view = memoryview(data)
+    while offset + FRAME_HEADER.size <= len(data):
+        length, crc = FRAME_HEADER.unpack_from(data, offset)
+        start = offset + FRAME_HEADER.size
+        payload = view[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        payloads.append(bytes(payload))
+        offset = start + length
+
+    return payloads, offset
+
+
+@dataclass
+class LogMetrics:
+    records: int = 0
+    bytes: int = 0
+    # one write + fsync of a group of records
+    sync_latency: TimingStats = field(default_factory=TimingStats)
+    # records made durable by one sync
+    group_size: TimingStats = field(default_factory=TimingStats)
+
+
+class WriteAheadLog:
+    """
+    Append-only log with group commit.
+
+    append only buffers a framed record, a flusher task writes everything buffered with one write and one fsync
+    and wakes up all the commits waiting for it. Waiting sync_interval before a flush collects bigger groups
+    under load at the cost of commit latency. File io runs in a dedicated thread, in order.
+    After a failed write the log is broken, every later commit raises LogWriteFailed.
+    """
+
+    def __init__(self, path: str, sync_interval: float = 0.002, fsync: bool = True):
+        self._path = path
+        self._sync_interval = sync_interval
+        self._fsync = fsync
+
+        self._file: Optional[BinaryIO] = None
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix='wal')
+        self._buffer: List[bytes] = []
+        self._appended = 0
+        self._durable = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        self._has_data: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._error: Optional[BaseException] = None
+        # bytes in the current file, buffered ones included
+        self.size = 0
+        self.metrics = LogMetrics()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    async def _run_io(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._io, func, *args)
+
+    async def open(self):
+        self._has_data = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._file = await self._run_io(open, self._path, 'ab')
+        self.size = self._file.tell()
+        self._flusher = asyncio.create_task(self._run())
+
+    def append(self, payload: bytes):
+        data = frame(payload)
+        self._buffer.append(data)
+        self._appended += 1
+        self.size += len(data)
+        self._has_data.set()
+
+    async def commit(self):
+        if self._error is not None:
+            raise LogWriteFailed() from self._error
+        if self._durable >= self._appended:
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append((self._appended, waiter))
+        await waiter
+
+    def _write(self, file: BinaryIO, data: bytes):
+        file.write(data)
+        file.flush()
+        if self._fsync:
+            os.fsync(file.fileno())
+
+    def _wake_up_waiters(self):
+        while self._waiters and self._waiters[0][0] <= self._durable:
+            _, waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _fail(self, error: BaseException):
+        logger.error('Write ahead log %s is broken: %r', self._path, error)
+        self._error = error
+        while self._waiters:
+            _, waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(LogWriteFailed())
+
+    async def _flush_locked(self):
+        self._has_data.clear()
+        if not self._buffer or self._error is not None:
+            return
+
+        data = b''.join(self._buffer)
+        records = len(self._buffer)
+        self._buffer = []
+        flushed_up_to = self._appended
+
+        started_at = time.monotonic()
+        try:
+            await self._run_io(self._write, self._file, data)
+        except Exception as ex:
+            self._fail(ex)
+            return
+
+        self.metrics.sync_latency.add(time.monotonic() - started_at)
+        self.metrics.group_size.add(records)
+        self.metrics.records += records
+        self.metrics.bytes += len(data)
+        self._durable = flushed_up_to
+        self._wake_up_waiters()
+
+    async def flush(self):
+        async with self._flush_lock:
+            await self._flush_locked()
+
+    async def _run(self):
+        while True:
+            await self._has_data.wait()
+            if self._sync_interval:
+                await asyncio.sleep(self._sync_interval)
+            # a cancelled flush would lose the group it has taken from the buffer
+            await asyncio.shield(self.flush())
+
+    async def rotate(self, path: str):
+        """
+        Continue in a new file, everything appended before the call is synced to the old one
+        """
+        async with self._flush_lock:
+            await self._flush_locked()
+            new_file = await self._run_io(open, path, 'ab')
+            old_file, self._file = self._file, new_file
+            self._path = path
+            self.size = new_file.tell() + sum(len(data) for data in self._buffer)
+        await self._run_io(old_file.close)
+
+    async def close(self):
+        if self._flusher is None:
+            return
+
+        self._flusher.cancel()
+        try:
+            await self._flusher
+        except asyncio.CancelledError:
+            pass
+        self._flusher = None
+
+        await self.flush()
+        await self._run_io(self._file.close)
+        self._io.shutdown()
@@ -0,0 +1,73 @@
+"""
+Replace the refresh_token jwt of stored sessions with refresh_token_digest
+
+    python -m app.db.migrations.refresh_token_digest --uri mongodb://localhost:27017 --database auth
+"""
+import argparse
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from app.db.odm.client import MongoSettings, get_database, close_clients
+from app.db.odm.indexes import SESSIONS_COLLECTION, ensure_indexes
+from app.domain.models.session import get_refresh_token_digest
+
+OLD_INDEX_NAME = 'refresh_token_unique'
+
+
+async def migrate_refresh_tokens_to_digest(db: AsyncIOMotorDatabase, batch_size: int = 1000) -> int:
+    collection = db[SESSIONS_COLLECTION]
+
+    # the old unique index would reject new sessions without refresh_token
+    try:
+        await collection.drop_index(OLD_INDEX_NAME)
+    except OperationFailure:
+        pass
+
+    await ensure_indexes(db)
+
+    migrated = 0
+    cursor = collection.find(
+        {'refresh_token': {'$exists': True}}, projection={'_id': 1, 'refresh_token': 1}, batch_size=batch_size
+    )
+    batch = []
+    async for document in cursor:
+        batch.append(UpdateOne(
+            {'_id': document['_id']},
+            {
+                '$set': {'refresh_token_digest': get_refresh_token_digest(document['refresh_token'])},
+                '$unset': {'refresh_token': ''}
+            }
+        ))
+        if len(batch) >= batch_size:
+            await collection.bulk_write(batch, ordered=False)
+            migrated += len(batch)
+            batch = []
+
+    if batch:
+        await collection.bulk_write(batch, ordered=False)
+        migrated += len(batch)
+
+    return migrated
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uri', default=MongoSettings.uri)
+    parser.add_argument('--database', default=MongoSettings.database)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    db = get_database(MongoSettings(uri=args.uri, database=args.database))
+    try:
+        migrated = await migrate_refresh_tokens_to_digest(db, batch_size=args.batch_size)
+    finally:
+        close_clients()
+
+    print(f'migrated {migrated} sessions')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
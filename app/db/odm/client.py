@@ -0,0 +1,53 @@
+from dataclasses import dataclass
+from typing import Optional, Dict, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+
+
+@dataclass(frozen=True)
+class MongoSettings:
+    uri: str = 'mongodb://localhost:27017'
+    database: str = 'auth'
+    max_pool_size: int = 100
+    min_pool_size: int = 0
+    max_idle_time_ms: Optional[int] = None
+    wait_queue_timeout_ms: Optional[int] = None
+    server_selection_timeout_ms: int = 5000
+
+
+_clients: Dict[Tuple, AsyncIOMotorClient] = {}
+
+
+def get_client(settings: MongoSettings) -> AsyncIOMotorClient:
+    """
+    One client (and so one connection pool) per uri and pool settings, shared by all repositories
+    """
+    key = (
+        settings.uri, settings.max_pool_size, settings.min_pool_size,
+        settings.max_idle_time_ms, settings.wait_queue_timeout_ms
+    )
+    client = _clients.get(key)
+    if client is None:
+        client = AsyncIOMotorClient(
+            settings.uri,
+            maxPoolSize=settings.max_pool_size,
+            minPoolSize=settings.min_pool_size,
+            maxIdleTimeMS=settings.max_idle_time_ms,
+            waitQueueTimeoutMS=settings.wait_queue_timeout_ms,
+            serverSelectionTimeoutMS=settings.server_selection_timeout_ms,
+            uuidRepresentation='standard',
+            tz_aware=False
+        )
+        _clients[key] = client
+
+    return client
+
+
+def get_database(settings: MongoSettings) -> AsyncIOMotorDatabase:
+    return get_client(settings)[settings.database]
+
+
+def close_clients():
+    for client in _clients.values():
+        client.close()
+    _clients.clear()
@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import IndexModel, ASCENDING, DESCENDING
+
+USERS_COLLECTION = 'users'
+SESSIONS_COLLECTION = 'sessions'
+SESSIONS_ARCHIVE_COLLECTION = 'sessions_archive'
+VERIFICATION_CODES_COLLECTION = 'verification_codes'
+RATE_LIMITS_COLLECTION = 'rate_limits'
+
+# every lookup of the repo interfaces has to be served by one of these
+INDEXES: Dict[str, List[IndexModel]] = {
+    USERS_COLLECTION: [
+        IndexModel([('email', ASCENDING)], name='email_unique', unique=True),
+    ],
+    SESSIONS_COLLECTION: [
+        # sparse, so it can be built while old sessions are migrated from refresh_token
+        IndexModel([('refresh_token_digest', ASCENDING)], name='refresh_token_digest_unique', unique=True, sparse=True),
+        IndexModel([('user_id', ASCENDING), ('_id', ASCENDING)], name='user_id_id'),
+        # family_id lookups and the sweeper scan ordered by family, newest first
+        IndexModel([('family_id', ASCENDING), ('_id', DESCENDING)], name='family_id_id'),
+        IndexModel([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0),
+    ],
+    VERIFICATION_CODES_COLLECTION: [
+        IndexModel([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0),
+    ],
+    RATE_LIMITS_COLLECTION: [
+        IndexModel([('expires_at', ASCENDING)], name='expires_at_ttl', expireAfterSeconds=0),
+    ],
+}
+
+# replaced indexes, dropped by ensure_indexes
+OBSOLETE_INDEXES: Dict[str, List[str]] = {
+    # the ttl monitor read the naive local expiration_time as utc
+    SESSIONS_COLLECTION: ['expiration_time_ttl'],
+    VERIFICATION_CODES_COLLECTION: ['exp_date_ttl'],
+}
+
+
+def to_utc(value: datetime) -> datetime:
+    """
+    TTL indexes compare dates with utc, while the models keep naive local time
+    """
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase):
+    for collection_name, indexes in INDEXES.items():
+        if indexes:
+            await db[collection_name].create_indexes(indexes)
+
+    for collection_name, index_names in OBSOLETE_INDEXES.items():
+        existing = await db[collection_name].index_information()
+        for index_name in index_names:
+            if index_name in existing:
+                await db[collection_name].drop_index(index_name)
@@ -0,0 +1,127 @@
+from typing import Optional, Dict
+
+from app.common_lib.cache import TTLCache
+from app.common_lib.invalidation import IInvalidationBus
+from app.domain.models.user import UserAuth
+from app.domain.repos.user import IUserAuthRepo
+
+USER_CACHE_SIZE = 10_000
+USER_CACHE_TTL_SECONDS = 60.0
+MISSING_USER_CACHE_TTL_SECONDS = 5.0
+
+USER_CHANGED_TOPIC = 'user_changed'
+
+
+class CachingUserAuthRepo(IUserAuthRepo):
+    """
+    Read-through cache in front of any IUserAuthRepo, entries are dropped on insert/update through it.
+
+    Callers get copies, so mutating a returned user doesn't change the cached one.
+    With a bus, the caches of the other workers are invalidated too.
+    A read overlapping an invalidation doesn't cache its result, it may be older than the write.
+    """
+
+    def __init__(
+            self,
+            repo: IUserAuthRepo,
+            max_size: int = USER_CACHE_SIZE,
+            ttl: float = USER_CACHE_TTL_SECONDS,
+            missing_ttl: float = MISSING_USER_CACHE_TTL_SECONDS,
+            bus: Optional[IInvalidationBus] = None
+    ):
+        self._repo = repo
+        self._missing_ttl = missing_ttl
+        self._by_id: TTLCache[str, UserAuth] = TTLCache(max_size=max_size, ttl=ttl)
+        self._by_email: TTLCache[str, UserAuth] = TTLCache(max_size=max_size, ttl=ttl)
+        # email -> does user exist, negative entries live for missing_ttl only
+        self._email_exists: TTLCache[str, bool] = TTLCache(max_size=max_size, ttl=ttl)
+        # incremented by every invalidation
+        self._epoch = 0
+
+        self._bus = bus
+        if bus is not None:
+            bus.subscribe(USER_CHANGED_TOPIC, lambda payload: self.invalidate(payload['user_id'], payload['email']))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {'hits': cache.hits, 'misses': cache.misses, 'size': len(cache)}
+            for name, cache in (('by_id', self._by_id), ('by_email', self._by_email), ('exists', self._email_exists))
+        }
+
+    def _cache_user(self, user: UserAuth):
+        self._by_id.set(str(user.id), user)
+        self._by_email.set(user.email, user)
+        self._email_exists.set(user.email, True)
+
+    def invalidate(self, user_id: Optional[str] = None, email: Optional[str] = None):
+        self._epoch += 1
+        if user_id is not None:
+            cached_user = self._by_id.get(user_id, count=False)
+            if cached_user is not None:
+                self._by_email.invalidate(cached_user.email)
+                self._email_exists.invalidate(cached_user.email)
+            self._by_id.invalidate(user_id)
+
+        if email is not None:
+            self._by_email.invalidate(email)
+            self._email_exists.invalidate(email)
+
+    async def does_user_exists(self, email: str) -> bool:
+        exists = self._email_exists.get(email)
+        if exists is not None:
+            return exists
+
+        epoch = self._epoch
+        exists = await self._repo.does_user_exists(email)
+        if epoch == self._epoch:
+            self._email_exists.set(email, exists, ttl=None if exists else self._missing_ttl)
+
+        return exists
+
+    async def find_by_id(self, _id: str) -> Optional[UserAuth]:
+        user = self._by_id.get(str(_id))
+        if user is None:
+            epoch = self._epoch
+            user = await self._repo.find_by_id(_id)
+            if user is None:
+                return None
+            if epoch == self._epoch:
+                self._cache_user(user)
+
+        return user.clone()
+
+    async def find_by_email(self, email: str) -> Optional[UserAuth]:
+        user = self._by_email.get(email)
+        if user is None:
+            epoch = self._epoch
+            user = await self._repo.find_by_email(email)
+            if user is None:
+                return None
+            if epoch == self._epoch:
+                self._cache_user(user)
+
+        return user.clone()
+
+    def _publish(self, user_id: Optional[str], email: str):
+        if self._bus is not None:
+            self._bus.publish(USER_CHANGED_TOPIC, {'user_id': user_id, 'email': email})
+
+    async def insert(self, user: UserAuth) -> UserAuth:
+        # before, so reads during the write don't cache, and after, for entries cached by reads that started earlier
+        self.invalidate(email=user.email)
+        try:
+            user = await self._repo.insert(user)
+        finally:
+            self.invalidate(email=user.email)
+        # negative does_user_exists entries of the other workers
+        self._publish(None, user.email)
+
+        return user
+
+    async def update(self, user: UserAuth):
+        self.invalidate(user_id=str(user.id), email=user.email)
+        try:
+            await self._repo.update(user)
+        finally:
+            self.invalidate(user_id=str(user.id), email=user.email)
+        self._publish(str(user.id), user.email)
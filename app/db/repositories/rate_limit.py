@@ -0,0 +1,45 @@
+import math
+import time
+from datetime import datetime
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from app.common_lib.rate_limit import IRateLimiter, TokenBucketRule
+from app.db.odm.indexes import RATE_LIMITS_COLLECTION
+
+
+class MongoRateLimiter(IRateLimiter):
+    """
+    Limiter shared by all workers of the service.
+
+    A token bucket can't be updated atomically with a plain update, so the rule is approximated
+    with fixed windows: at most rule.capacity tokens per rule.seconds_to_full, one counter document per window.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, rule: TokenBucketRule, prefix: str):
+        self._collection = db[RATE_LIMITS_COLLECTION]
+        self._rule = rule
+        self._prefix = prefix
+        self._window = rule.seconds_to_full
+
+    async def acquire(self, key: str, cost: float = 1.0) -> float:
+        now = time.time()
+        window = math.floor(now / self._window)
+        window_end = (window + 1) * self._window
+
+        document = await self._collection.find_one_and_update(
+            {'_id': f'{self._prefix}:{key}:{window}'},
+            {
+                '$inc': {'used': cost},
+                # naive utc, the ttl monitor reads naive dates as utc
+                '$setOnInsert': {'expires_at': datetime.utcfromtimestamp(window_end)}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+        if document['used'] <= self._rule.capacity:
+            return 0.0
+
+        return window_end - now
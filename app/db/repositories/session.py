@@ -0,0 +1,230 @@
+import uuid
+from datetime import datetime
+from typing import Optional, Iterable, AsyncIterator, List, Any, Union, Dict
+
+from bson import ObjectId, Binary
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorClientSession
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from app.db.odm.indexes import SESSIONS_COLLECTION, SESSIONS_ARCHIVE_COLLECTION, to_utc
+from app.domain.models.session import Session, SessionStatus, SessionIsNotActive, ReusingOfRefreshToken
+from app.domain.models.tokens import RefreshToken
+from app.domain.repos.session import ISessionRepo, SessionSweepCandidate
+
+SESSION_PROJECTION = {
+    '_id': 1, 'user_id': 1, 'family_id': 1, 'refresh_token_digest': 1, 'expiration_time': 1, 'status': 1
+}
+
+DUPLICATE_KEY_ERROR = 11000
+
+SWEEP_CANDIDATE_PROJECTION = {'_id': 1, 'family_id': 1, 'status': 1, 'expiration_time': 1}
+
+
+def _to_uuid(value: Union[uuid.UUID, Binary]) -> uuid.UUID:
+    return value if isinstance(value, uuid.UUID) else value.as_uuid()
+
+
+class MongoSessionRepo(ISessionRepo):
+    def __init__(self, db: AsyncIOMotorDatabase, use_transactions: bool = False):
+        """
+        use_transactions runs refresh rotation in a transaction, it requires a replica set.
+        Without it the status switch is reverted when the successor insert fails
+        """
+        self._collection = db[SESSIONS_COLLECTION]
+        self._archive_collection = db[SESSIONS_ARCHIVE_COLLECTION]
+        self._use_transactions = use_transactions
+
+    @staticmethod
+    def _to_document(session: Session) -> dict:
+        document = session.dict(exclude={'id'})
+        document['status'] = session.status.value
+        # explicit binary subtype 4, doesn't depend on the client uuidRepresentation
+        document['family_id'] = Binary.from_uuid(session.family_id)
+        # only for the ttl index, queries compare expiration_time with local time like the models do
+        document['expires_at'] = to_utc(session.expiration_time)
+        if session.id is not None:
+            document['_id'] = session.id
+        return document
+
+    @staticmethod
+    def _from_document(document: Optional[dict]) -> Optional[Session]:
+        if document is None:
+            return None
+        return Session.from_record(
+            id=document['_id'],
+            user_id=document['user_id'],
+            family_id=_to_uuid(document['family_id']),
+            refresh_token_digest=document['refresh_token_digest'],
+            expiration_time=document['expiration_time'],
+            status=SessionStatus(document['status'])
+        )
+
+    async def insert(self, session: Session) -> Session:
+        result = await self._collection.insert_one(self._to_document(session))
+        session.id = result.inserted_id
+
+        return session
+
+    async def update(self, session: Session):
+        await self._collection.replace_one({'_id': session.id}, self._to_document(session))
+
+    async def find_session_by_id(self, _id: str, user_id: str) -> Optional[Session]:
+        document = await self._collection.find_one(
+            {'user_id': ObjectId(user_id), '_id': ObjectId(_id)}, projection=SESSION_PROJECTION
+        )
+        return self._from_document(document)
+
+    async def find_session_by_token_digest(self, digest: bytes) -> Optional[Session]:
+        document = await self._collection.find_one({'refresh_token_digest': digest}, projection=SESSION_PROJECTION)
+        return self._from_document(document)
+
+    async def invalidate_session_family(self, session: Session):
+        await self.invalidate_session_families([session.family_id])
+
+    async def invalidate_session_families(
+            self,
+            family_ids: Iterable[uuid.UUID],
+            status: SessionStatus = SessionStatus.COMPROMISED
+    ) -> int:
+        result = await self._collection.update_many(
+            {'family_id': {'$in': [Binary.from_uuid(family_id) for family_id in family_ids]}},
+            {'$set': {'status': status.value}}
+        )
+        return result.modified_count
+
+    async def invalidate_users_sessions(self, user_ids: Iterable[str]) -> int:
+        result = await self._collection.update_many(
+            {'user_id': {'$in': [ObjectId(user_id) for user_id in user_ids]}, 'status': SessionStatus.ACTIVE.value},
+            {'$set': {'status': SessionStatus.LOGOUT.value}}
+        )
+        return result.modified_count
+
+    async def _refresh_and_insert_successor(
+            self,
+            token_digest: bytes,
+            refresh_token: RefreshToken,
+            db_session: Optional[AsyncIOMotorClientSession] = None
+    ) -> Optional[Session]:
+        # the status switch is a single atomic update, so only one of concurrent refreshes wins
+        document = await self._collection.find_one_and_update(
+            {
+                'refresh_token_digest': token_digest,
+                'status': SessionStatus.ACTIVE.value,
+                'expiration_time': {'$gt': datetime.now()}
+            },
+            {'$set': {'status': SessionStatus.REFRESHED.value}},
+            projection=SESSION_PROJECTION,
+            return_document=ReturnDocument.AFTER,
+            session=db_session
+        )
+        if document is None:
+            return None
+
+        new_session = Session.create_from_refreshed(
+            refreshed_session=self._from_document(document), refresh_token=refresh_token
+        )
+        try:
+            result = await self._collection.insert_one(self._to_document(new_session), session=db_session)
+        except Exception:
+            if db_session is None:
+                # a REFRESHED session without a successor would turn the client's retry into a token reuse
+                # that compromises the family, a transaction is rolled back by the driver instead
+                await self._collection.update_one(
+                    {'_id': document['_id'], 'status': SessionStatus.REFRESHED.value},
+                    {'$set': {'status': SessionStatus.ACTIVE.value}}
+                )
+            raise
+        new_session.id = result.inserted_id
+
+        return new_session
+
+    async def _raise_rotation_error(self, token_digest: bytes):
+        document = await self._collection.find_one(
+            {'refresh_token_digest': token_digest}, projection={'_id': 0, 'status': 1, 'family_id': 1}
+        )
+        if document is None or document['status'] != SessionStatus.REFRESHED.value:
+            raise SessionIsNotActive()
+
+        await self._collection.update_many(
+            {'family_id': document['family_id']},
+            {'$set': {'status': SessionStatus.COMPROMISED.value}}
+        )
+        raise ReusingOfRefreshToken()
+
+    async def rotate_session(self, token_digest: bytes, refresh_token: RefreshToken) -> Session:
+        if self._use_transactions:
+            async with await self._collection.database.client.start_session() as db_session:
+                async with db_session.start_transaction():
+                    new_session = await self._refresh_and_insert_successor(token_digest, refresh_token, db_session)
+        else:
+            new_session = await self._refresh_and_insert_successor(token_digest, refresh_token)
+
+        if new_session is None:
+            # outside of the transaction, the family invalidation must not be rolled back
+            await self._raise_rotation_error(token_digest)
+
+        return new_session
+
+    async def find_family_statuses(self, family_ids: Iterable[uuid.UUID]) -> Dict[uuid.UUID, SessionStatus]:
+        # the sort follows the (family_id, _id) index, so the group reads one document per family
+        cursor = self._collection.aggregate([
+            {'$match': {'family_id': {'$in': [Binary.from_uuid(family_id) for family_id in family_ids]}}},
+            {'$sort': {'family_id': 1, '_id': -1}},
+            {'$group': {
+                '_id': '$family_id',
+                'status': {'$first': '$status'},
+                'expiration_time': {'$first': '$expiration_time'}
+            }},
+        ])
+
+        now = datetime.now()
+        statuses = {}
+        async for document in cursor:
+            status = SessionStatus(document['status'])
+            if status is SessionStatus.ACTIVE and document['expiration_time'] <= now:
+                continue
+            statuses[_to_uuid(document['_id'])] = status
+
+        return statuses
+
+    async def iter_sweep_candidates(self, now: datetime, batch_size: int) -> AsyncIterator[List[SessionSweepCandidate]]:
+        # served by the (family_id, _id) index, no in-memory sort
+        cursor = self._collection.find(
+            {'$or': [{'status': {'$ne': SessionStatus.ACTIVE.value}}, {'expiration_time': {'$lte': now}}]},
+            projection=SWEEP_CANDIDATE_PROJECTION,
+            sort=[('family_id', 1), ('_id', -1)],
+            batch_size=batch_size
+        )
+
+        batch = []
+        async for document in cursor:
+            batch.append(SessionSweepCandidate(
+                id=document['_id'],
+                family_id=_to_uuid(document['family_id']),
+                status=SessionStatus(document['status']),
+                expiration_time=document['expiration_time']
+            ))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    async def delete_sessions(self, ids: List[Any], archive: bool = False) -> int:
+        if not ids:
+            return 0
+
+        if archive:
+            documents = await self._collection.find({'_id': {'$in': ids}}).to_list(length=None)
+            if documents:
+                try:
+                    await self._archive_collection.insert_many(documents, ordered=False)
+                except BulkWriteError as ex:
+                    # already archived by an interrupted sweep
+                    if any(error['code'] != DUPLICATE_KEY_ERROR for error in ex.details['writeErrors']):
+                        raise
+
+        result = await self._collection.delete_many({'_id': {'$in': ids}})
+        return result.deleted_count
@@ -0,0 +1,55 @@
+from typing import Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+
+from app.db.odm.indexes import USERS_COLLECTION
+from app.domain.models.user import UserAuth
+from app.domain.repos.user import IUserAuthRepo, UserEmailIsTaken
+
+USER_PROJECTION = {'_id': 1, 'email': 1, 'hashed_password': 1, 'is_admin': 1, 'is_email_verified': 1}
+
+
+class MongoUserAuthRepo(IUserAuthRepo):
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self._collection = db[USERS_COLLECTION]
+
+    @staticmethod
+    def _to_document(user: UserAuth) -> dict:
+        document = user.dict(exclude={'id'})
+        if user.id is not None:
+            document['_id'] = user.id
+        return document
+
+    @staticmethod
+    def _from_document(document: Optional[dict]) -> Optional[UserAuth]:
+        if document is None:
+            return None
+        return UserAuth.from_record(id=document.pop('_id'), **document)
+
+    async def does_user_exists(self, email: str) -> bool:
+        # covered by the email index
+        document = await self._collection.find_one({'email': email}, projection={'_id': 0, 'email': 1})
+        return document is not None
+
+    async def find_by_id(self, _id: str) -> Optional[UserAuth]:
+        document = await self._collection.find_one({'_id': ObjectId(_id)}, projection=USER_PROJECTION)
+        return self._from_document(document)
+
+    async def find_by_email(self, email: str) -> Optional[UserAuth]:
+        document = await self._collection.find_one({'email': email}, projection=USER_PROJECTION)
+        return self._from_document(document)
+
+    async def insert(self, user: UserAuth) -> UserAuth:
+        try:
+            # the unique email index
+            result = await self._collection.insert_one(self._to_document(user))
+        except DuplicateKeyError:
+            raise UserEmailIsTaken()
+        user.id = result.inserted_id
+
+        return user
+
+    async def update(self, user: UserAuth):
+        await self._collection.replace_one({'_id': user.id}, self._to_document(user))
@@ -0,0 +1,67 @@
+from typing import Optional
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.db.odm.indexes import VERIFICATION_CODES_COLLECTION, to_utc
+from app.domain.models.verification_code import VerificationCode, VerCodeCooldownIsNotOver
+from app.domain.repos.verification_code import IVerificationCodeRepo
+
+VERIFICATION_CODE_PROJECTION = {'_id': 1, 'code': 1, 'issue_date': 1, 'exp_date': 1, 'attempts': 1}
+
+
+class MongoVerificationCodeRepo(IVerificationCodeRepo):
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self._collection = db[VERIFICATION_CODES_COLLECTION]
+
+    @staticmethod
+    def _to_document(ver_code: VerificationCode) -> dict:
+        document = ver_code.dict(exclude={'id'})
+        document['_id'] = ver_code.id
+        # only for the ttl index, the model compares exp_date with local time
+        document['expires_at'] = to_utc(ver_code.exp_date)
+        return document
+
+    @staticmethod
+    def _from_document(document: Optional[dict]) -> Optional[VerificationCode]:
+        if document is None:
+            return None
+        return VerificationCode.from_record(id=document.pop('_id'), **document)
+
+    async def find_by_user_id(self, user_id: str) -> Optional[VerificationCode]:
+        document = await self._collection.find_one(
+            {'_id': ObjectId(user_id)}, projection=VERIFICATION_CODE_PROJECTION
+        )
+        return self._from_document(document)
+
+    async def insert(self, ver_code: VerificationCode):
+        await self._collection.insert_one(self._to_document(ver_code))
+
+    async def update(self, ver_code: VerificationCode):
+        await self._collection.replace_one({'_id': ver_code.id}, self._to_document(ver_code))
+
+    async def upsert_for_resend(self, ver_code: VerificationCode) -> bool:
+        document = self._to_document(ver_code)
+        del document['_id']
+        try:
+            # a code within the cooldown doesn't match, so the upsert tries to insert a second document with its _id
+            result = await self._collection.update_one(
+                {'_id': ver_code.id, 'issue_date': {'$lte': ver_code.replaceable_issue_date}},
+                {'$set': document},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            raise VerCodeCooldownIsNotOver()
+
+        return result.upserted_id is None
+
+    async def register_attempt(self, user_id: str) -> Optional[VerificationCode]:
+        document = await self._collection.find_one_and_update(
+            {'_id': ObjectId(user_id)},
+            {'$inc': {'attempts': 1}},
+            projection=VERIFICATION_CODE_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        return self._from_document(document)
@@ -0,0 +1,104 @@
+import time
+from calendar import timegm
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Iterable, Any, Optional, Tuple, List
+
+from app.common_lib.invalidation import IInvalidationBus
+
+MAX_REVOCATION_ENTRIES = 1_000_000
+
+REVOKED_FAMILIES_TOPIC = 'revoked_families'
+REVOKED_USERS_TOPIC = 'revoked_users'
+# ids per invalidation message
+PUBLISH_CHUNK_SIZE = 500
+
+
+def to_timestamp(value: datetime) -> float:
+    # same convention as the jwt time claims: naive datetimes are taken as UTC
+    return timegm(value.utctimetuple()) + value.microsecond / 1_000_000
+
+
+class RevocationList:
+    """
+    In-process list of revoked session families and users, checked on every access token validation.
+
+    An entry only has to outlive the access tokens issued before it, so it is dropped after ttl.
+    Revoking a user rejects only tokens issued before the revocation, later logins are not affected.
+    """
+
+    def __init__(self, ttl: timedelta, max_entries: int = MAX_REVOCATION_ENTRIES):
+        self._ttl = ttl.total_seconds()
+        self._max_entries = max_entries
+        # family id -> expires_at
+        self._families: 'OrderedDict[str, float]' = OrderedDict()
+        # user id -> (revoked_at, expires_at)
+        self._users: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        self._bus: Optional[IInvalidationBus] = None
+
+    def attach_bus(self, bus: IInvalidationBus):
+        """
+        Share revocations with the other workers
+        """
+        self._bus = bus
+        bus.subscribe(REVOKED_FAMILIES_TOPIC, lambda payload: self._revoke_families(payload['ids']))
+        bus.subscribe(REVOKED_USERS_TOPIC, lambda payload: self._revoke_users(payload['ids'], payload['revoked_at']))
+
+    def _publish(self, topic: str, ids: List[str], **payload):
+        if self._bus is None:
+            return
+        for i in range(0, len(ids), PUBLISH_CHUNK_SIZE):
+            self._bus.publish(topic, {'ids': ids[i:i + PUBLISH_CHUNK_SIZE], **payload})
+
+    def __len__(self) -> int:
+        return len(self._families) + len(self._users)
+
+    def _evict(self, entries: OrderedDict, now: float, get_expires_at):
+        # entries are added with the same ttl, so the oldest ones are in front
+        while entries:
+            key, value = next(iter(entries.items()))
+            if get_expires_at(value) > now and len(entries) <= self._max_entries:
+                break
+            entries.popitem(last=False)
+
+    def _revoke_families(self, family_ids: List[str]):
+        now = time.time()
+        for family_id in family_ids:
+            self._families[family_id] = now + self._ttl
+            self._families.move_to_end(family_id)
+
+        self._evict(self._families, now, lambda expires_at: expires_at)
+
+    def revoke_families(self, family_ids: Iterable[Any]):
+        family_ids = [str(family_id) for family_id in family_ids]
+        self._revoke_families(family_ids)
+        self._publish(REVOKED_FAMILIES_TOPIC, family_ids)
+
+    def _revoke_users(self, user_ids: List[str], revoked_at: float):
+        now = time.time()
+        for user_id in user_ids:
+            self._users[user_id] = (revoked_at, now + self._ttl)
+            self._users.move_to_end(user_id)
+
+        self._evict(self._users, now, lambda entry: entry[1])
+
+    def revoke_users(self, user_ids: Iterable[Any], revoked_at: Optional[datetime] = None):
+        user_ids = [str(user_id) for user_id in user_ids]
+        revoked_at_timestamp = to_timestamp(revoked_at or datetime.now())
+        self._revoke_users(user_ids, revoked_at_timestamp)
+        self._publish(REVOKED_USERS_TOPIC, user_ids, revoked_at=revoked_at_timestamp)
+
+    def is_revoked(self, sub: str, family_id: Optional[str], issued_at: Optional[datetime]) -> bool:
+        if family_id is not None and family_id in self._families:
+            return True
+
+        user_entry = self._users.get(sub)
+        if user_entry is None:
+            return False
+
+        # tokens without iat can't prove they were issued after the revocation
+        return issued_at is None or to_timestamp(issued_at) <= user_entry[0]
+
+    def clear(self):
+        self._families.clear()
+        self._users.clear()
@@ -1,3 +1,4 @@
+import hashlib
 import uuid
 from datetime import datetime
 from enum import Enum
@@ -19,6 +20,11 @@ class ReusingOfRefreshToken(AppError):
     pass
 
 
+def get_refresh_token_digest(refresh_token: str) -> bytes:
+    # sessions are stored and indexed by a fixed size digest instead of the whole jwt
+    return hashlib.sha256(refresh_token.encode('ascii')).digest()
+
+
 class SessionStatus(Enum):
     ACTIVE = 'ACTIVE'
     LOGOUT = 'LOGOUT'
@@ -29,17 +35,19 @@ class SessionStatus(Enum):
 class Session(IdModel, Generic[ID]):
     user_id: ID
     family_id: uuid.UUID = Field(default_factory=uuid.uuid4)
-    refresh_token: str
+    refresh_token_digest: bytes
     expiration_time: datetime
     status: SessionStatus
 
     @classmethod
     def create(cls, user: UserAuth, refresh_token: RefreshToken) -> 'Session':
-        session = cls(
+        family = {'family_id': uuid.UUID(refresh_token.family_id)} if refresh_token.family_id else {}
+        session = cls.from_record(
             user_id=user.id,
-            refresh_token=refresh_token.get_token(),
+            refresh_token_digest=get_refresh_token_digest(refresh_token.get_token()),
             expiration_time=refresh_token.exp,
-            status=SessionStatus.ACTIVE
+            status=SessionStatus.ACTIVE,
+            **family
         )
 
         return session
@@ -71,10 +79,10 @@ class Session(IdModel, Generic[ID]):
     def create_from_refreshed(cls, refreshed_session: 'Session', refresh_token: RefreshToken) -> 'Session':
         assert refreshed_session.status is SessionStatus.REFRESHED
 
-        new_session = cls(
+        new_session = cls.from_record(
             user_id=refreshed_session.user_id,
             family_id=refreshed_session.family_id,
-            refresh_token=refresh_token.get_token(),
+            refresh_token_digest=get_refresh_token_digest(refresh_token.get_token()),
             expiration_time=refresh_token.exp,
             status=SessionStatus.ACTIVE
         )
@@ -1,24 +1,29 @@
 from abc import ABC
-from datetime import datetime, timedelta
+import uuid
+from calendar import timegm
+from datetime import datetime, timedelta, timezone
 from enum import Enum
-from typing import TypeVar, Type, Any, Optional
+from typing import TypeVar, Type, Any, Optional, Dict, Callable, Tuple, Iterable, List
 
 from bson import ObjectId
-from jose import jwt, jws
-from jose.exceptions import ExpiredSignatureError, JWTClaimsError, JWTError, JWSError
 from pydantic import ValidationError, Field, PrivateAttr
 from pydantic.main import BaseModel
 
+from app.common_lib.cache import TTLCache
 from app.common_lib.errors import AppError
+from app.common_lib.jws import JWSSigner, JWSVerifier, JWSVerificationFailed
+from app.common_lib.keyring import KeyRing, EdDSAKey
+from app.domain.models.revocation import RevocationList, to_timestamp
 from app.domain.models.user import UserAuth
 
-ALGORITHM = 'HS256'
-SECRET = '123'
-
 REGISTRATION_TOKEN_EXPIRE_MINUTES = 10
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 REFRESH_TOKEN_EXPIRE_MINUTES = 24 * 60 * 60
 
+VERIFIED_TOKENS_CACHE_SIZE = 100_000
+
+SIGNING_KEY_ROTATION_DAYS = 7
+
 
 class TokenVerificationFailed(AppError):
     pass
@@ -28,8 +33,59 @@ class WrongTokenFormat(AppError):
     pass
 
 
+class TokenIsRevoked(TokenVerificationFailed):
+    pass
+
+
 TokenType = TypeVar('TokenType', bound='Token')
 
+# the configured keys are loaded by build_container, without them a key is generated on first use and rotated.
+# Retired keys are kept until every token signed with them has expired
+key_ring = KeyRing(
+    key_factory=EdDSAKey.generate,
+    rotation_interval=timedelta(days=SIGNING_KEY_ROTATION_DAYS),
+    retention=timedelta(minutes=max(ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_MINUTES))
+)
+_signer = JWSSigner(key_ring)
+_verifier = JWSVerifier(key_ring)
+
+# (token class, token string) -> verified token, entries expire at the token's exp
+verified_tokens_cache: TTLCache[Tuple[type, str], 'Token'] = TTLCache(max_size=VERIFIED_TOKENS_CACHE_SIZE)
+
+revocation_list = RevocationList(ttl=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+
+def _to_jwt_claims(claims: dict) -> dict:
+    for time_claim in ('exp', 'nbf'):
+        value = claims.get(time_claim)
+        if isinstance(value, datetime):
+            claims[time_claim] = timegm(value.utctimetuple())
+
+    # sub-second iat, so revocation can tell apart tokens issued right before and after it
+    if isinstance(claims.get('iat'), datetime):
+        claims['iat'] = to_timestamp(claims['iat'])
+
+    return claims
+
+
+def _convert_timestamp(value: Any) -> Any:
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    return value
+
+
+def _get_claim_converter(field_type: Any) -> Optional[Callable[[Any], Any]]:
+    if field_type is datetime:
+        return _convert_timestamp
+
+    if isinstance(field_type, type) and issubclass(field_type, BaseModel):
+        return lambda value: field_type.construct(**value) if isinstance(value, dict) else value
+
+    return None
+
+
+_claim_converters: Dict[type, Dict[str, Optional[Callable[[Any], Any]]]] = {}
+
 
 class TokenKind(Enum):
     REGISTRATION = 'REGISTRATION'
@@ -48,7 +104,7 @@ class Token(BaseModel, ABC):
         self._token_cache = token
 
     def _generate_token(self) -> str:
-        return jwt.encode(claims=self.dict(), key=SECRET, algorithm=ALGORITHM)
+        return _signer.sign(_to_jwt_claims(self.dict()))
 
     def __init__(self, _token_cache: Optional[str] = None, **data: Any):
         super().__init__(**data)
@@ -62,10 +118,10 @@ class Token(BaseModel, ABC):
         return self._token_cache
 
     @classmethod
-    def _decode_and_validate(cls: Type[TokenType], token: str, validation_options: dict = None) -> TokenType:
+    def _decode_and_validate(cls: Type[TokenType], token: str, verify_exp: bool = True) -> TokenType:
         try:
-            claims = jwt.decode(token, SECRET, algorithms=ALGORITHM, options=validation_options)
-        except (JWTError, JWTClaimsError, ExpiredSignatureError) as ex:
+            claims = _verifier.verify(token, verify_exp=verify_exp)
+        except JWSVerificationFailed as ex:
             raise TokenVerificationFailed(ex) from ex
 
         try:
@@ -77,7 +133,60 @@ class Token(BaseModel, ABC):
 
     @classmethod
     def decode_and_validate(cls: Type[TokenType], token: str) -> TokenType:
-        return cls._decode_and_validate(token=token, validation_options=None)
+        return cls._decode_and_validate(token=token)
+
+    @classmethod
+    def _get_claim_converters(cls) -> Dict[str, Optional[Callable[[Any], Any]]]:
+        converters = _claim_converters.get(cls)
+        if converters is None:
+            converters = {name: _get_claim_converter(field.type_) for name, field in cls.__fields__.items()}
+            _claim_converters[cls] = converters
+
+        return converters
+
+    @classmethod
+    def _construct_from_verified_claims(cls: Type[TokenType], token: str, claims: dict) -> TokenType:
+        token_kind = cls.__fields__['token_kind'].default
+        if claims.get('token_kind') != token_kind:
+            raise WrongTokenFormat(f'token_kind must be {token_kind}')
+
+        values = {}
+        for name, converter in cls._get_claim_converters().items():
+            if name in claims:
+                value = claims[name]
+                values[name] = converter(value) if converter else value
+            elif cls.__fields__[name].required:
+                raise WrongTokenFormat(f'{name} is required')
+
+        token_obj = cls.construct(**values)
+        token_obj._set_token_cache(token)
+
+        return token_obj
+
+    @classmethod
+    def _fast_decode_and_validate(cls: Type[TokenType], token: str, verify_exp: bool = True,
+                                  use_cache: bool = True) -> TokenType:
+        """
+        Claims of our own tokens are trusted after the signature check,
+        so the model is constructed without pydantic validation
+        """
+        cache_key = (cls, token)
+        if use_cache:
+            token_obj = verified_tokens_cache.get(cache_key)
+            if token_obj is not None:
+                return token_obj
+
+        try:
+            claims = _verifier.verify(token, verify_exp=verify_exp)
+        except JWSVerificationFailed as ex:
+            raise TokenVerificationFailed(ex) from ex
+
+        token_obj = cls._construct_from_verified_claims(token, claims)
+
+        if use_cache:
+            verified_tokens_cache.set(cache_key, token_obj, expires_at=claims.get('exp'))
+
+        return token_obj
 
 
 class RegistrationToken(Token):
@@ -101,23 +210,40 @@ class AccessToken(Token):
     token_kind: str = Field(default=TokenKind.ACCESS.value, const=True)
     sub: str
     exp: datetime
+    iat: Optional[datetime] = None
+    family_id: Optional[str] = None
     data: AccessTokenData
 
     @classmethod
     def create(cls, user: UserAuth) -> 'AccessToken':
         data = AccessTokenData()
+        now = datetime.now()
 
         return cls(
             sub=str(user.id),
-            exp=datetime.now() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+            exp=now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+            iat=now,
             data=data
         )
 
+    def check_is_not_revoked(self):
+        if revocation_list.is_revoked(sub=self.sub, family_id=self.family_id, issued_at=self.iat):
+            raise TokenIsRevoked()
+
+    @classmethod
+    def decode_and_validate(cls, token: str) -> 'AccessToken':
+        token_obj = cls._fast_decode_and_validate(token=token)
+        # checked on cache hits too, revocation doesn't evict verified tokens
+        token_obj.check_is_not_revoked()
+
+        return token_obj
+
 
 class RefreshToken(Token):
     token_kind: str = Field(default=TokenKind.REFRESH.value, const=True)
     sub: str
     exp: datetime
+    family_id: Optional[str] = None
 
     @classmethod
     def create(cls, user: UserAuth) -> 'RefreshToken':
@@ -126,8 +252,83 @@ class RefreshToken(Token):
             exp=datetime.now() + timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
         )
 
+    @classmethod
+    def decode_and_validate(cls: Type[TokenType], token: str) -> TokenType:
+        return cls._fast_decode_and_validate(token=token)
+
 
 class RefreshTokenWithoutExpireValidation(RefreshToken):
     @classmethod
     def decode_and_validate(cls: Type[TokenType], token: str) -> TokenType:
-        return cls._decode_and_validate(token=token, validation_options={'verify_exp': False})
+        return cls._fast_decode_and_validate(token=token, verify_exp=False)
+
+
+class TokenMinter:
+    """
+    Issues access/refresh token pairs without per token pydantic serialization,
+    the header segment and the signing key are prepared once per key
+    """
+
+    def __init__(self, signer: Optional[JWSSigner] = None):
+        self._signer = signer or _signer
+        self._access_data = AccessTokenData()
+        self._access_data_claims = self._access_data.dict()
+
+    def _mint(self, token_cls: Type[TokenType], sub: str, exp: datetime,
+              extra_fields: Optional[dict] = None, extra_claims: Optional[dict] = None) -> TokenType:
+        jti = str(ObjectId())
+        claims = {
+            'jti': jti,
+            'token_kind': token_cls.__fields__['token_kind'].default,
+            'sub': sub,
+            'exp': timegm(exp.utctimetuple()),
+        }
+        if extra_claims:
+            claims.update(extra_claims)
+
+        token_obj = token_cls.construct(jti=jti, sub=sub, exp=exp, **(extra_fields or {}))
+        token_obj._set_token_cache(self._signer.sign(claims))
+
+        return token_obj
+
+    def _issue_pair(self, user_id: Any, family_id: Optional[Any], now: datetime,
+                    access_exp: datetime, refresh_exp: datetime) -> Tuple[AccessToken, RefreshToken]:
+        sub = str(user_id)
+        family_id = str(family_id or uuid.uuid4())
+
+        access_token = self._mint(
+            AccessToken, sub, access_exp,
+            extra_fields={'iat': now, 'family_id': family_id, 'data': self._access_data},
+            extra_claims={'iat': to_timestamp(now), 'family_id': family_id, 'data': self._access_data_claims}
+        )
+        refresh_token = self._mint(
+            RefreshToken, sub, refresh_exp,
+            extra_fields={'family_id': family_id}, extra_claims={'family_id': family_id}
+        )
+
+        return access_token, refresh_token
+
+    @staticmethod
+    def _get_issue_times() -> Tuple[datetime, datetime, datetime]:
+        now = datetime.now()
+        return (
+            now,
+            now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+            now + timedelta(minutes=REFRESH_TOKEN_EXPIRE_MINUTES)
+        )
+
+    def issue_pair(self, user_id: Any, family_id: Optional[Any] = None) -> Tuple[AccessToken, RefreshToken]:
+        """
+        Tokens of a new session family unless family_id of a refreshed session is given
+        """
+        return self._issue_pair(user_id, family_id, *self._get_issue_times())
+
+    def issue_pairs(self, user_ids: Iterable[Any]) -> List[Tuple[AccessToken, RefreshToken]]:
+        """
+        Bulk issuing for admin re-issue and load testing, all tokens share the same exp
+        """
+        issue_times = self._get_issue_times()
+        return [self._issue_pair(user_id, None, *issue_times) for user_id in user_ids]
+
+
+token_minter = TokenMinter()
@@ -1,3 +1,4 @@
+import time
 from dataclasses import dataclass
 from typing import Generic
 
@@ -9,6 +10,12 @@ from app.common_lib.executor import cpu_bound
 
 MAX_ENCODED_PASSWORD_LEN = 72  # bcrypt limit
 
+DEFAULT_BCRYPT_ROUNDS = 12
+MIN_BCRYPT_ROUNDS = 4
+MAX_BCRYPT_ROUNDS = 31  # bcrypt limit
+# calibration never goes below it, however slow the machine is
+MIN_CALIBRATED_BCRYPT_ROUNDS = 10
+
 
 class UserRegisterEvent:
     pass
@@ -26,21 +33,81 @@ class EmailIsAlreadyVerified(AppError):
     pass
 
 
+def get_bcrypt_rounds(hashed: bytes) -> int:
+    # hash format is $2b$<rounds>$<salt and hash>
+    return int(hashed.split(b'$', 3)[2])
+
+
 @dataclass
 class HashedPassword:
     value: bytes
+    rounds: int
+
+    @classmethod
+    def from_hash(cls, value: bytes) -> 'HashedPassword':
+        return cls(value=value, rounds=get_bcrypt_rounds(value))
 
 
 @cpu_bound
-def hash_password(password: bytes) -> HashedPassword:
-    return HashedPassword(value=bcrypt.hashpw(password, bcrypt.gensalt()))
+def hash_password(password: bytes, rounds: int = DEFAULT_BCRYPT_ROUNDS) -> HashedPassword:
+    return HashedPassword(value=bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds)), rounds=rounds)
 
 
+@cpu_bound
 def check_password(password: bytes, hashed: bytes):
     if not bcrypt.checkpw(password, hashed):
         raise WrongPassword()
 
 
+class PasswordHashingPolicy:
+    def __init__(self, rounds: int = DEFAULT_BCRYPT_ROUNDS):
+        self.rounds = rounds
+
+    @property
+    def rounds(self) -> int:
+        return self._rounds
+
+    @rounds.setter
+    def rounds(self, rounds: int):
+        # services share the policy, so a cost calibrated at startup is set on the existing instance
+        if not MIN_BCRYPT_ROUNDS <= rounds <= MAX_BCRYPT_ROUNDS:
+            raise ValueError(f'bcrypt rounds must be in [{MIN_BCRYPT_ROUNDS}, {MAX_BCRYPT_ROUNDS}], got {rounds}')
+        self._rounds = rounds
+
+    def needs_rehash(self, hashed: bytes) -> bool:
+        # only upgrades, workers with different costs would otherwise rehash the same user back and forth
+        return get_bcrypt_rounds(hashed) < self._rounds
+
+    @staticmethod
+    def _measure_hash_time(rounds: int) -> float:
+        started_at = time.perf_counter()
+        hash_password.sync(b'calibration-password', rounds)
+        return time.perf_counter() - started_at
+
+    @classmethod
+    def calibrate(
+            cls,
+            target_seconds: float,
+            min_rounds: int = MIN_BCRYPT_ROUNDS,
+            max_rounds: int = MAX_BCRYPT_ROUNDS
+    ) -> 'PasswordHashingPolicy':
+        """
+        Pick the highest cost whose hash time on this machine doesn't exceed target_seconds
+        """
+        rounds = min_rounds
+        elapsed = cls._measure_hash_time(rounds)
+
+        # every extra round doubles the hash time
+        while rounds < max_rounds and elapsed * 2 <= target_seconds:
+            rounds += 1
+            elapsed = cls._measure_hash_time(rounds)
+
+        if elapsed > target_seconds and rounds > min_rounds:
+            rounds -= 1
+
+        return cls(rounds=rounds)
+
+
 class UserAuth(IdModel, Generic[ID]):
     email: str
     hashed_password: bytes
@@ -63,11 +130,16 @@ class UserAuth(IdModel, Generic[ID]):
     def verify_email(self):
         self.is_email_verified = True
 
-    def check_password(self, password: bytes):
-        check_password(password, self.hashed_password)
+    def update_hashed_password(self, hashed_password: HashedPassword):
+        self.hashed_password = hashed_password.value
 
-    def check_can_user_login(self, password: bytes):
-        self.check_password(password)
+    def check_password(self, password: bytes):
+        check_password.sync(password, self.hashed_password)
 
+    def check_is_email_verified(self):
         if not self.is_email_verified:
             raise EmailIsNotVerified()
+
+    def check_can_user_login(self, password: bytes):
+        self.check_password(password)
+        self.check_is_email_verified()
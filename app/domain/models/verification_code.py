@@ -1,5 +1,6 @@
+import hmac
+import secrets
 from datetime import datetime, timedelta
-from random import randint
 
 from app.common_lib.domain.model import IdModel
 from app.common_lib.errors import AppError
@@ -8,6 +9,7 @@ from app.domain.models.user import UserAuth
 CODE_LEN = 6
 VERIFICATION_CODE_EXPIRE_MINUTES = 10
 VERIFICATION_CODE_RESEND_COOLDOWN_SECONDS = 60
+MAX_VERIFICATION_CODE_ATTEMPTS = 5
 
 
 class VerCodeCooldownIsNotOver(AppError):
@@ -22,14 +24,20 @@ class VerCodeIsExpired(AppError):
     pass
 
 
+class VerCodeIsLocked(AppError):
+    pass
+
+
 def _generate_six_digit_code() -> str:
-    return str(randint(99999, 999999))
+    return f'{secrets.randbelow(10 ** CODE_LEN):0{CODE_LEN}d}'
 
 
 class VerificationCode(IdModel):
     code: str
     issue_date: datetime
     exp_date: datetime
+    # incremented atomically by the repo before every check
+    attempts: int = 0
 
     @staticmethod
     def _generate_code() -> str:
@@ -38,24 +46,34 @@ class VerificationCode(IdModel):
     @classmethod
     def create(cls, user: UserAuth):
         issue_date = datetime.now()
-        return cls(
+        return cls.from_record(
             id=user.id,
             code=cls._generate_code(),
             issue_date=issue_date,
             exp_date=issue_date + timedelta(minutes=VERIFICATION_CODE_EXPIRE_MINUTES)
         )
 
-    def update_for_resend(self):
-        if self.issue_date + timedelta(seconds=VERIFICATION_CODE_RESEND_COOLDOWN_SECONDS) > datetime.now():
+    @property
+    def replaceable_issue_date(self) -> datetime:
+        """
+        Latest issue date of a previous code that this code is allowed to replace
+        """
+        return self.issue_date - timedelta(seconds=VERIFICATION_CODE_RESEND_COOLDOWN_SECONDS)
+
+    def check_can_replace(self, previous: 'VerificationCode'):
+        if previous.issue_date > self.replaceable_issue_date:
             raise VerCodeCooldownIsNotOver()
 
-        self.code = _generate_six_digit_code()
-        self.issue_date = datetime.now()
-        self.exp_date = self.issue_date + timedelta(minutes=VERIFICATION_CODE_EXPIRE_MINUTES)
+    @property
+    def is_locked(self) -> bool:
+        return self.attempts > MAX_VERIFICATION_CODE_ATTEMPTS
 
     def check_code(self, code: str):
+        if self.is_locked:
+            raise VerCodeIsLocked()
+
         if self.exp_date < datetime.now():
             raise VerCodeIsExpired()
 
-        if self.code != code:
+        if not hmac.compare_digest(self.code.encode('ascii'), code.encode('ascii', 'replace')):
             raise VerCodeIsNotCorrect()
@@ -1,7 +1,19 @@
+import uuid
 from abc import ABC, abstractmethod
-from typing import Optional
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Iterable, AsyncIterator, List, Any, Dict
 
-from app.domain.models.session import Session
+from app.domain.models.session import Session, SessionStatus
+from app.domain.models.tokens import RefreshToken
+
+
+@dataclass
+class SessionSweepCandidate:
+    id: Any
+    family_id: uuid.UUID
+    status: SessionStatus
+    expiration_time: datetime
 
 
 class ISessionRepo(ABC):
@@ -15,7 +27,52 @@ class ISessionRepo(ABC):
     async def find_session_by_id(self, _id: str, user_id: str) -> Optional[Session]: ...
 
     @abstractmethod
-    async def find_session_by_token(self, token: str) -> Optional[Session]: ...
+    async def find_session_by_token_digest(self, digest: bytes) -> Optional[Session]: ...
+
+    @abstractmethod
+    async def invalidate_session_family(self, session: Session): ...
+
+    @abstractmethod
+    async def invalidate_session_families(
+            self,
+            family_ids: Iterable[uuid.UUID],
+            status: SessionStatus = SessionStatus.COMPROMISED
+    ) -> int:
+        """
+        Set status of every session of the families, returns the number of changed sessions
+        """
+
+    @abstractmethod
+    async def invalidate_users_sessions(self, user_ids: Iterable[str]) -> int:
+        """
+        Log out every ACTIVE session of the users, returns the number of changed sessions
+        """
+
+    @abstractmethod
+    async def rotate_session(self, token_digest: bytes, refresh_token: RefreshToken) -> Session:
+        """
+        Atomically switch the ACTIVE session with token_digest to REFRESHED and insert its successor
+        for refresh_token, returns the successor.
+
+        Raises ReusingOfRefreshToken after the family was invalidated if the session is already REFRESHED,
+        SessionIsNotActive if it doesn't exist, is expired or has another status.
+        """
+
+    @abstractmethod
+    async def find_family_statuses(self, family_ids: Iterable[uuid.UUID]) -> Dict[uuid.UUID, SessionStatus]:
+        """
+        Status of the newest session of every family in one query,
+        unknown families and families whose newest session is ACTIVE but expired are left out
+        """
+
+    @abstractmethod
+    def iter_sweep_candidates(self, now: datetime, batch_size: int) -> AsyncIterator[List[SessionSweepCandidate]]:
+        """
+        Batches of sessions that are not ACTIVE or expired at now, ordered by family_id and newest first
+        """
 
     @abstractmethod
-    async def invalidate_session_family(self, session: Session): ...
\ No newline at end of file
+    async def delete_sessions(self, ids: List[Any], archive: bool = False) -> int:
+        """
+        Bulk delete, with archive the sessions are copied to the archive first
+        """
@@ -1,9 +1,14 @@
 from abc import ABC, abstractmethod
 from typing import Optional
 
+from app.common_lib.errors import AppError
 from app.domain.models.user import UserAuth
 
 
+class UserEmailIsTaken(AppError):
+    pass
+
+
 class IUserAuthRepo(ABC):
 
     @abstractmethod
@@ -16,7 +21,10 @@ class IUserAuthRepo(ABC):
     async def find_by_email(self, email: str) -> Optional[UserAuth]: ...
 
     @abstractmethod
-    async def insert(self, user: UserAuth) -> UserAuth: ...
+    async def insert(self, user: UserAuth) -> UserAuth:
+        """
+        Raises UserEmailIsTaken if another user has the email
+        """
 
     @abstractmethod
     async def update(self, user: UserAuth): ...
@@ -15,4 +15,18 @@ class IVerificationCodeRepo(ABC):
 
     @abstractmethod
     async def update(self, ver_code: VerificationCode):
-        ...
\ No newline at end of file
+        ...
+
+    @abstractmethod
+    async def upsert_for_resend(self, ver_code: VerificationCode) -> bool:
+        """
+        Store a freshly created code in place of the user code in one atomic operation,
+        raises VerCodeCooldownIsNotOver if the stored code was issued less than the cooldown before it.
+        Returns True if a previous code was replaced
+        """
+
+    @abstractmethod
+    async def register_attempt(self, user_id: str) -> Optional[VerificationCode]:
+        """
+        Atomically increment attempts of the user code and return the code with the new value
+        """
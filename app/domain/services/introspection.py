@@ -0,0 +1,95 @@
+import hmac
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Iterable
+
+from app.common_lib.errors import AppError
+from app.domain.models.session import SessionStatus, SessionIsNotActive
+from app.domain.models.tokens import AccessToken
+from app.domain.repos.session import ISessionRepo
+
+MAX_INTROSPECTION_BATCH = 1000
+
+
+class IntrospectionBatchIsTooLarge(AppError):
+    pass
+
+
+class IntrospectionCallerIsNotAuthorized(AppError):
+    pass
+
+
+@dataclass
+class IntrospectionResult:
+    active: bool
+    sub: Optional[str] = None
+    exp: Optional[datetime] = None
+    family_id: Optional[str] = None
+    # name of the AppError that made the token inactive
+    error: Optional[str] = None
+
+
+class TokenIntrospectionService:
+    """
+    Token status for resource servers that can't check sessions themselves.
+
+    Signatures are checked one by one with the shared verifier and its cache,
+    sessions of the whole batch are resolved with one repo query.
+    Only resource servers with one of api_keys may call it, to anyone else it would tell which stolen tokens
+    still work.
+    """
+
+    def __init__(
+            self,
+            session_repo: ISessionRepo,
+            api_keys: Iterable[str] = (),
+            max_batch_size: int = MAX_INTROSPECTION_BATCH
+    ):
+        self._session_repo = session_repo
+        self._api_keys = [api_key.encode('utf-8') for api_key in api_keys]
+        self._max_batch_size = max_batch_size
+
+    def check_caller(self, api_key: Optional[str]):
+        if api_key is None:
+            raise IntrospectionCallerIsNotAuthorized()
+
+        api_key = api_key.encode('utf-8')
+        # every key is compared, so the time doesn't tell which one is closer
+        matches = [hmac.compare_digest(api_key, allowed) for allowed in self._api_keys]
+        if not any(matches):
+            raise IntrospectionCallerIsNotAuthorized()
+
+    async def introspect(self, tokens: List[str]) -> List[IntrospectionResult]:
+        """
+        One result per token, in the order of tokens
+        """
+        if len(tokens) > self._max_batch_size:
+            raise IntrospectionBatchIsTooLarge(f'At most {self._max_batch_size} tokens per call')
+
+        results = []
+        family_ids = set()
+        for token in tokens:
+            try:
+                access_token = AccessToken.decode_and_validate(token)
+            except AppError as ex:
+                results.append(IntrospectionResult(active=False, error=type(ex).__name__))
+                continue
+
+            results.append(IntrospectionResult(
+                active=True, sub=access_token.sub, exp=access_token.exp, family_id=access_token.family_id
+            ))
+            if access_token.family_id:
+                family_ids.add(uuid.UUID(access_token.family_id))
+
+        if not family_ids:
+            return results
+
+        statuses = await self._session_repo.find_family_statuses(family_ids)
+        for result in results:
+            if result.active and result.family_id and \
+                    statuses.get(uuid.UUID(result.family_id)) is not SessionStatus.ACTIVE:
+                result.active = False
+                result.error = SessionIsNotActive.__name__
+
+        return results
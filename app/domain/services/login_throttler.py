@@ -0,0 +1,40 @@
+from typing import Optional
+
+from app.common_lib.errors import AppError
+from app.common_lib.rate_limit import IRateLimiter, InMemoryRateLimiter, TokenBucketRule
+
+# a user mistyping the password a few times is fine, a password spraying bot is not
+EMAIL_LOGIN_RULE = TokenBucketRule(capacity=10, refill_per_second=1 / 60)
+# NAT and proxies put many users behind one address
+ADDRESS_LOGIN_RULE = TokenBucketRule(capacity=100, refill_per_second=1)
+
+
+class TooManyLoginAttempts(AppError):
+    def __init__(self, retry_after: float):
+        super().__init__(f'Retry after {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+class LoginThrottler:
+    """
+    Checked before the user lookup and bcrypt, so a credential stuffing burst costs us two dict lookups per attempt
+    """
+
+    def __init__(
+            self,
+            email_limiter: Optional[IRateLimiter] = None,
+            address_limiter: Optional[IRateLimiter] = None
+    ):
+        self._email_limiter = email_limiter if email_limiter is not None else InMemoryRateLimiter(EMAIL_LOGIN_RULE)
+        self._address_limiter = address_limiter if address_limiter is not None \
+            else InMemoryRateLimiter(ADDRESS_LOGIN_RULE)
+
+    async def check(self, email: str, client_address: Optional[str] = None):
+        if client_address is not None:
+            retry_after = await self._address_limiter.acquire(client_address)
+            if retry_after:
+                raise TooManyLoginAttempts(retry_after)
+
+        retry_after = await self._email_limiter.acquire(email.lower())
+        if retry_after:
+            raise TooManyLoginAttempts(retry_after)
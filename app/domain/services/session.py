@@ -1,12 +1,17 @@
+import uuid
 from dataclasses import dataclass
-from typing import Tuple
+from typing import Tuple, Optional, Iterable
 
 from app.common_lib.errors import AppError
-from app.domain.models.session import Session, ReusingOfRefreshToken
+from app.common_lib.executor import IAsyncExecutor
+from app.domain.models.revocation import RevocationList
+from app.domain.models.session import Session, get_refresh_token_digest, ReusingOfRefreshToken, SessionIsNotActive
 from app.domain.repos.session import ISessionRepo
+from app.domain.services.login_throttler import LoginThrottler
 from app.domain.models.tokens import AccessToken, RefreshToken, \
-    RefreshTokenWithoutExpireValidation
-from app.domain.models.user import UserAuth
+    RefreshTokenWithoutExpireValidation, TokenMinter, token_minter as default_token_minter, \
+    revocation_list as default_revocation_list
+from app.domain.models.user import UserAuth, check_password, hash_password, PasswordHashingPolicy
 from app.domain.repos.user import IUserAuthRepo
 
 
@@ -18,12 +23,27 @@ class UserWithEmailDoesntExists(AppError):
 class LoginDTO:
     email: str
     password: bytes
+    client_address: Optional[str] = None
 
 
 class SessionService:
-    def __init__(self, user_repo: IUserAuthRepo, session_repo: ISessionRepo):
+    def __init__(
+            self,
+            user_repo: IUserAuthRepo,
+            session_repo: ISessionRepo,
+            executor: IAsyncExecutor,
+            password_policy: Optional[PasswordHashingPolicy] = None,
+            token_minter: Optional[TokenMinter] = None,
+            revocation_list: Optional[RevocationList] = None,
+            login_throttler: Optional[LoginThrottler] = None
+    ):
         self._user_repo = user_repo
         self._session_repo = session_repo
+        self._executor = executor
+        self._password_policy = password_policy or PasswordHashingPolicy()
+        self._token_minter = token_minter or default_token_minter
+        self._revocation_list = revocation_list or default_revocation_list
+        self._login_throttler = login_throttler or LoginThrottler()
 
     async def _find_user_by_email(self, email: str) -> UserAuth:
         user = await self._user_repo.find_by_email(email)
@@ -32,40 +52,90 @@ class SessionService:
 
         return user
 
+    async def _check_can_user_login(self, user: UserAuth, password: bytes):
+        # bcrypt takes hundreds of ms, so it must not run on the event loop
+        await check_password.run_in(self._executor, password, user.hashed_password)
+        user.check_is_email_verified()
+
+    async def _rehash_password_if_needed(self, user: UserAuth, password: bytes):
+        if not self._password_policy.needs_rehash(user.hashed_password):
+            return
+
+        hashed_password = await hash_password.run_in(self._executor, password, self._password_policy.rounds)
+        user.update_hashed_password(hashed_password)
+        await self._user_repo.update(user)
+
     async def login(self, dto: LoginDTO) -> Tuple[AccessToken, RefreshToken]:
+        await self._login_throttler.check(dto.email, dto.client_address)
         user = await self._find_user_by_email(dto.email)
-        user.check_can_user_login(dto.password)
+        await self._check_can_user_login(user, dto.password)
+        await self._rehash_password_if_needed(user, dto.password)
 
-        access_token, refresh_token = AccessToken.create(user), RefreshToken.create(user)
+        access_token, refresh_token = self._token_minter.issue_pair(user.id)
 
         session = Session.create(user, refresh_token)
         await self._session_repo.insert(session)
 
         return access_token, refresh_token
 
-    async def _invalidate_session_family(self, session: Session):
-        await self._session_repo.invalidate_session_family(session)
-
     async def refresh(self, refresh_token: RefreshTokenWithoutExpireValidation) -> Tuple[AccessToken, RefreshToken]:
-        session: Session = await self._session_repo.find_session_by_token(token=refresh_token.get_token())
+        # sub of a verified refresh token is the session user, so the user doesn't have to be loaded
+        new_access_token, new_refresh_token = self._token_minter.issue_pair(
+            refresh_token.sub, family_id=refresh_token.family_id
+        )
 
         try:
-            session.refresh()
+            await self._session_repo.rotate_session(
+                token_digest=get_refresh_token_digest(refresh_token.get_token()),
+                refresh_token=new_refresh_token
+            )
         except ReusingOfRefreshToken as ex:
-            await self._invalidate_session_family(session)
+            # the repo has invalidated the family, access tokens issued for it have to go too
+            if refresh_token.family_id:
+                self._revocation_list.revoke_families([refresh_token.family_id])
             raise ex
 
-        user: UserAuth = await self._user_repo.find_by_id(session.user_id)
-
-        new_access_token, new_refresh_token = AccessToken.create(user=user), RefreshToken.create(user=user)
-        new_session = Session.create_from_refreshed(refreshed_session=session, refresh_token=new_refresh_token)
-
-        await self._session_repo.update(session)
-        await self._session_repo.insert(new_session)
-
         return new_access_token, new_refresh_token
 
     async def logout(self, access_token: AccessToken, session_id: str):
         session = await self._session_repo.find_session_by_id(_id=session_id, user_id=access_token.sub)
         session.logout()
         await self._session_repo.update(session)
+
+        self._revocation_list.revoke_families([session.family_id])
+
+    async def logout_by_refresh_token(self, access_token: AccessToken, refresh_token: RefreshTokenWithoutExpireValidation):
+        """
+        Logout for clients that hold the token pair, but not the session id
+        """
+        if refresh_token.sub != access_token.sub:
+            raise SessionIsNotActive()
+
+        session = await self._session_repo.find_session_by_token_digest(get_refresh_token_digest(refresh_token.get_token()))
+        if session is None:
+            raise SessionIsNotActive()
+
+        session.logout()
+        await self._session_repo.update(session)
+
+        self._revocation_list.revoke_families([session.family_id])
+
+    async def revoke_session_families(self, family_ids: Iterable[uuid.UUID]) -> int:
+        """
+        Mark the families COMPROMISED, e.g. after an incident
+        """
+        family_ids = list(family_ids)
+        invalidated = await self._session_repo.invalidate_session_families(family_ids)
+        self._revocation_list.revoke_families(family_ids)
+
+        return invalidated
+
+    async def revoke_users_sessions(self, user_ids: Iterable[str]) -> int:
+        user_ids = list(user_ids)
+        invalidated = await self._session_repo.invalidate_users_sessions(user_ids)
+        self._revocation_list.revoke_users(user_ids)
+
+        return invalidated
+
+    async def logout_everywhere(self, access_token: AccessToken) -> int:
+        return await self.revoke_users_sessions([access_token.sub])
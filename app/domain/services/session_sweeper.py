@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, List, Any, Tuple, IO
+
+from app.common_lib.file_lock import try_lock_file
+
+from app.domain.models.session import SessionStatus
+from app.domain.repos.session import ISessionRepo, SessionSweepCandidate
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH_SIZE = 1000
+SWEEP_MAX_DELETES_PER_SECOND = 5000
+SWEEP_INTERVAL_SECONDS = 5 * 60
+
+
+@dataclass
+class SweepStats:
+    scanned: int = 0
+    deleted: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def deleted_per_second(self) -> float:
+        return self.deleted / self.elapsed if self.elapsed else 0.0
+
+
+class SessionSweeper:
+    """
+    Background removal of expired and finished sessions.
+
+    The newest unexpired REFRESHED session of every family is kept, it is the one a stolen
+    refresh token would be replayed with, so reuse detection still needs it.
+    With lock_path, workers sharing the repo sweep only while holding the lock, so one of them does it at a time
+    and another one takes over when it exits.
+    """
+
+    def __init__(
+            self,
+            session_repo: ISessionRepo,
+            batch_size: int = SWEEP_BATCH_SIZE,
+            max_deletes_per_second: Optional[float] = SWEEP_MAX_DELETES_PER_SECOND,
+            interval_seconds: float = SWEEP_INTERVAL_SECONDS,
+            archive: bool = False,
+            lock_path: Optional[str] = None
+    ):
+        self._session_repo = session_repo
+        self._batch_size = batch_size
+        self._max_deletes_per_second = max_deletes_per_second
+        self._interval_seconds = interval_seconds
+        self._archive = archive
+        self._lock_path = lock_path
+        self._lock_file: Optional[IO] = None
+        self._task: Optional[asyncio.Task] = None
+        self.last_stats: Optional[SweepStats] = None
+
+    @staticmethod
+    def _select_for_deletion(
+            candidates: List[SessionSweepCandidate],
+            now: datetime,
+            family_with_kept_link: Optional[uuid.UUID]
+    ) -> Tuple[List[Any], Optional[uuid.UUID]]:
+        ids = []
+        for candidate in candidates:
+            if candidate.expiration_time > now and candidate.status is SessionStatus.REFRESHED \
+                    and candidate.family_id != family_with_kept_link:
+                # candidates of a family go newest first, so this is its latest refreshed link
+                family_with_kept_link = candidate.family_id
+                continue
+
+            if candidate.expiration_time > now and candidate.status is SessionStatus.ACTIVE:
+                continue
+
+            ids.append(candidate.id)
+
+        return ids, family_with_kept_link
+
+    async def _throttle(self, deleted: int, batch_started_at: float):
+        if not self._max_deletes_per_second or not deleted:
+            return
+
+        delay = deleted / self._max_deletes_per_second - (time.monotonic() - batch_started_at)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def sweep(self) -> SweepStats:
+        stats = SweepStats()
+        started_at = time.monotonic()
+        now = datetime.now()
+        family_with_kept_link = None
+
+        async for candidates in self._session_repo.iter_sweep_candidates(now=now, batch_size=self._batch_size):
+            batch_started_at = time.monotonic()
+            ids, family_with_kept_link = self._select_for_deletion(candidates, now, family_with_kept_link)
+            deleted = await self._session_repo.delete_sessions(ids, archive=self._archive)
+
+            stats.scanned += len(candidates)
+            stats.deleted += deleted
+            stats.batches += 1
+
+            await self._throttle(deleted, batch_started_at)
+
+        stats.elapsed = time.monotonic() - started_at
+        self.last_stats = stats
+
+        return stats
+
+    def _holds_lock(self) -> bool:
+        if self._lock_path is None:
+            return True
+        if self._lock_file is None:
+            self._lock_file = try_lock_file(self._lock_path)
+        return self._lock_file is not None
+
+    async def _run(self):
+        while True:
+            if not self._holds_lock():
+                await asyncio.sleep(self._interval_seconds)
+                continue
+
+            try:
+                stats = await self.sweep()
+                logger.info(
+                    'Session sweep: scanned %s, deleted %s in %.1fs (%.0f/s)',
+                    stats.scanned, stats.deleted, stats.elapsed, stats.deleted_per_second
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Session sweep failed')
+
+            await asyncio.sleep(self._interval_seconds)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
@@ -1,11 +1,16 @@
 from dataclasses import dataclass
+from typing import Optional
 
+from app.common_lib.cache import TTLCache
 from app.common_lib.errors import AppError, InternalError
 from app.common_lib.executor import IAsyncExecutor
+from app.common_lib.invalidation import IInvalidationBus
+from app.common_lib.mail import IEmailQueue, OutgoingEmail
 from app.domain.models.tokens import RegistrationToken
-from app.domain.models.user import UserAuth, hash_password
-from app.domain.repos.user import IUserAuthRepo
-from app.domain.models.verification_code import VerificationCode
+from app.domain.models.user import UserAuth, hash_password, PasswordHashingPolicy
+from app.domain.repos.user import IUserAuthRepo, UserEmailIsTaken
+from app.domain.models.verification_code import VerificationCode, VERIFICATION_CODE_EXPIRE_MINUTES, \
+    VerCodeIsLocked, VerCodeIsNotCorrect
 from app.domain.repos.verification_code import IVerificationCodeRepo
 
 
@@ -28,27 +33,43 @@ class VerifyEmailDTO:
     code: str
 
 
+LOCKED_VER_CODES_CACHE_SIZE = 100_000
+VER_CODE_RESENT_TOPIC = 'ver_code_resent'
+
+
 class UserService:
     def __init__(
             self,
             user_repo: IUserAuthRepo,
             ver_code_repo: IVerificationCodeRepo,
             executor: IAsyncExecutor,
-            email_service
+            email_queue: IEmailQueue,
+            password_policy: Optional[PasswordHashingPolicy] = None,
+            bus: Optional[IInvalidationBus] = None
     ):
         self._user_repo = user_repo
         self._ver_code_repo = ver_code_repo
         self._executor = executor
-        self._email_service = email_service
+        self._email_queue = email_queue
+        self._password_policy = password_policy or PasswordHashingPolicy()
+        # user id -> True till the code expiration, locked codes are rejected without db calls
+        self._locked_ver_codes: TTLCache[str, bool] = TTLCache(max_size=LOCKED_VER_CODES_CACHE_SIZE)
+        self._bus = bus
+        if bus is not None:
+            bus.subscribe(VER_CODE_RESENT_TOPIC, lambda payload: self._locked_ver_codes.invalidate(payload['user_id']))
 
     async def register(self, dto: RegisterDTO) -> RegistrationToken:
         if await self._user_repo.does_user_exists(email=dto.email):
             raise UserAlreadyExists()
 
-        hashed_password = await self._executor(lambda: hash_password(dto.password))
+        hashed_password = await hash_password.run_in(self._executor, dto.password, self._password_policy.rounds)
 
         user = UserAuth.create(email=dto.email, hashed_password=hashed_password)
-        user = await self._user_repo.insert(user)
+        try:
+            user = await self._user_repo.insert(user)
+        except UserEmailIsTaken:
+            # registered concurrently after the check
+            raise UserAlreadyExists()
 
         return RegistrationToken.create(user)
 
@@ -59,28 +80,49 @@ class UserService:
 
         return user
 
+    @staticmethod
+    def _build_verification_email(user: UserAuth, ver_code: VerificationCode) -> OutgoingEmail:
+        return OutgoingEmail(
+            to=user.email,
+            subject='Email verification code',
+            body=f'Your verification code is {ver_code.code}, '
+                 f'it expires in {VERIFICATION_CODE_EXPIRE_MINUTES} minutes.'
+        )
+
     async def send_user_verification_email(self, token: RegistrationToken):
         user = await self._find_existing_user_by_id(user_id=token.sub)
         user.check_is_email_not_verified()
 
-        ver_code = await self._ver_code_repo.find_by_user_id(user.id)
+        ver_code = VerificationCode.create(user)
+        if await self._ver_code_repo.upsert_for_resend(ver_code):
+            self._locked_ver_codes.invalidate(token.sub)
+            if self._bus is not None:
+                self._bus.publish(VER_CODE_RESENT_TOPIC, {'user_id': token.sub})
+
+        # sent by the queue worker, the request doesn't wait on smtp
+        self._email_queue.enqueue(self._build_verification_email(user, ver_code))
 
-        if ver_code:
-            ver_code.update_for_resend()
-            await self._ver_code_repo.update(ver_code)
-        else:
-            ver_code = VerificationCode.create(user)
-            await self._ver_code_repo.insert(ver_code)
+    async def _check_ver_code(self, user_id: str, code: str):
+        if user_id in self._locked_ver_codes:
+            raise VerCodeIsLocked()
 
-        # TODO send email
+        # the attempt is counted before the comparison, so parallel guesses can't exceed the limit
+        ver_code = await self._ver_code_repo.register_attempt(user_id)
+        if ver_code is None:
+            raise VerCodeIsNotCorrect()
+
+        try:
+            ver_code.check_code(code=code)
+        except VerCodeIsLocked:
+            self._locked_ver_codes.set(user_id, True, expires_at=ver_code.exp_date.timestamp())
+            raise
 
     async def verify_email(self, token: RegistrationToken, dto: VerifyEmailDTO):
-        user = await self._find_existing_user_by_id(user_id=token.sub)
+        # the user is loaded only for a correct code, wrong guesses cost one db call
+        await self._check_ver_code(user_id=token.sub, code=dto.code)
 
+        user = await self._find_existing_user_by_id(user_id=token.sub)
         user.check_is_email_not_verified()
 
-        ver_code = await self._ver_code_repo.find_by_user_id(user.id)
-        ver_code.check_code(code=dto.code)
-
         user.verify_email()
         await self._user_repo.update(user)
@@ -0,0 +1,75 @@
+from typing import Optional, Dict, List
+
+from pydantic import BaseSettings
+
+from app.db.odm.client import MongoSettings
+from app.domain.models.user import DEFAULT_BCRYPT_ROUNDS
+
+
+class Settings(BaseSettings):
+    mongo_uri: str = 'mongodb://localhost:27017'
+    mongo_database: str = 'auth'
+    mongo_max_pool_size: int = 100
+    # refresh rotation in a transaction, requires a replica set. Without it a failed rotation is reverted
+    # by a compensating update, which is not atomic, but never leaves a session refreshed without a successor
+    mongo_use_transactions: bool = False
+    # single worker deployments without mongo: a directory for the log and snapshots of the embedded store
+    embedded_store_dir: Optional[str] = None
+    embedded_store_sync_interval: float = 0.002
+
+    # EdDSA or ES256 private key tokens are signed with, a PEM or a path to one. Every worker and restart has to
+    # use the same key, a generated one is only good for development and tests.
+    # To rotate, move the previous key to token_verification_keys until the tokens it signed expire
+    token_signing_key: Optional[str] = None
+    # defaults to the jwk thumbprint of the key
+    token_signing_key_id: Optional[str] = None
+    # kid -> PEM or path of a private or public key
+    token_verification_keys: Dict[str, str] = {}
+
+    # process pool for bcrypt, defaults to the number of cpus
+    executor_max_workers: Optional[int] = None
+    executor_max_queue_size: int = 64
+    executor_queue_timeout: float = 0.5
+    # bcrypt cost of new hashes, set the same on every worker and host. Logins rehash only the cheaper hashes.
+    # python -m app.calibrate prints the cost that hashes in about bcrypt_target_latency on the machine it runs on
+    bcrypt_rounds: int = DEFAULT_BCRYPT_ROUNDS
+    # calibrate the cost of this worker on startup instead, for single worker deployments
+    bcrypt_calibrate_on_start: bool = False
+    bcrypt_target_latency: float = 0.25
+
+    smtp_host: str = 'localhost'
+    smtp_port: int = 25
+    smtp_username: Optional[str] = None
+    smtp_password: Optional[str] = None
+    smtp_use_tls: bool = False
+    email_from_address: str = 'noreply@localhost'
+
+    # addresses or networks of the load balancers in front of the service. The login limit per client address
+    # takes the address from their X-Forwarded-For, otherwise every client behind them shares one bucket.
+    # Leave it empty when uvicorn runs with --proxy-headers and --forwarded-allow-ips, it rewrites the address itself
+    trusted_proxies: List[str] = []
+
+    # one worker of a node sweeps at a time, with several hosts on one database enable it on one of them
+    # bearer tokens of the resource servers allowed to call /auth/introspect, it isn't served without them
+    introspection_api_keys: List[str] = []
+
+    run_session_sweeper: bool = True
+    # with several workers on a node: a directory for their invalidation sockets
+    invalidation_socket_dir: Optional[str] = None
+    # /metrics and /debug/loop-stacks, they have no auth and show internals like file paths,
+    # so enable them only where the port isn't reachable from outside
+    internal_endpoints_enabled: bool = False
+    # timings and error counts of services, repos and the executor, exported on /metrics
+    metrics_enabled: bool = False
+    # blocked event loop detection, stacks are served on /debug/loop-stacks
+    loop_monitor_enabled: bool = False
+    loop_monitor_threshold: float = 0.1
+    loop_monitor_sample_interval: float = 0.01
+    shutdown_timeout: float = 10.0
+
+    class Config:
+        env_prefix = 'AUTH_'
+
+    @property
+    def mongo(self) -> MongoSettings:
+        return MongoSettings(uri=self.mongo_uri, database=self.mongo_database, max_pool_size=self.mongo_max_pool_size)
@@ -0,0 +1,133 @@
+"""
+Write throughput with group commit and recovery time of the embedded store
+
+    python -m benchmarks.embedded_store_bench --sessions 10000000
+    python -m benchmarks.embedded_store_bench --sessions 100000 --writes 20000 --no-fsync
+
+The store is filled to --sessions without logging, checkpointed, and then gets --tail-writes logged inserts,
+so the recovery loads a snapshot of --sessions and replays a log tail. 10M sessions take about 10 GB of memory.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+from bson import ObjectId
+
+from app.db.memory.session import SessionRecord
+from app.db.memory.store import EmbeddedStore
+from app.domain.models.session import Session, SessionStatus
+from app.domain.models.tokens import RefreshToken
+from app.domain.models.user import UserAuth, HashedPassword
+from benchmarks.report import BenchResult, make_result, print_results, add_baseline_arguments, \
+    handle_baseline_arguments
+
+USER = UserAuth.from_record(
+    id=ObjectId(), email='bench@domain.com', hashed_password=b'$2b$04$' + b'a' * 53, is_admin=False,
+    is_email_verified=True
+)
+
+
+def create_session() -> Session:
+    return Session.create(USER, RefreshToken.create(USER))
+
+
+async def measure_writes(store: EmbeddedStore, writes: int, writers: int) -> BenchResult:
+    latencies: List[float] = []
+    perf_counter = time.perf_counter
+
+    async def writer(count: int):
+        for _ in range(count):
+            started_at = perf_counter()
+            await store.session_repo.insert(create_session())
+            latencies.append(perf_counter() - started_at)
+
+    started_at = perf_counter()
+    await asyncio.gather(*(writer(writes // writers) for _ in range(writers)))
+    return make_result(f'embedded.insert.{writers}_writers', latencies, perf_counter() - started_at)
+
+
+def fill(store: EmbeddedStore, sessions: int):
+    expiration_time = datetime.now() + timedelta(days=30)
+    for _ in range(sessions):
+        store.session_repo.apply_put(SessionRecord(
+            ObjectId(), USER.id, uuid.uuid4(), os.urandom(32), expiration_time, SessionStatus.ACTIVE
+        ))
+
+
+def single_op_result(name: str, records: int, seconds: float) -> BenchResult:
+    # one op over all records, ops/sec is records per second
+    return BenchResult(name=name, ops=records, ops_per_sec=records / seconds if seconds else 0.0,
+                       p50_ms=seconds * 1000, p95_ms=seconds * 1000, p99_ms=seconds * 1000)
+
+
+async def run(args, directory: str) -> List[BenchResult]:
+    store = EmbeddedStore(directory, sync_interval=args.sync_interval, fsync=not args.no_fsync,
+                          checkpoint_log_size=sys.maxsize)
+    await store.open()
+    results = [await measure_writes(store, args.writes, writers) for writers in (1, args.writers)]
+    print(f'average group commit size {store.wal.metrics.group_size.avg:.1f} records, '
+          f'sync {store.wal.metrics.sync_latency.avg * 1000:.3f} ms')
+
+    started_at = time.perf_counter()
+    fill(store, args.sessions - len(store.session_repo))
+    print(f'filled {len(store.session_repo):,} sessions in {time.perf_counter() - started_at:.1f}s')
+
+    started_at = time.perf_counter()
+    await store.checkpoint()
+    results.append(single_op_result('embedded.checkpoint', len(store.session_repo), time.perf_counter() - started_at))
+
+    await asyncio.gather(*(store.session_repo.insert(create_session()) for _ in range(args.tail_writes)))
+    await store.close()
+    del store
+
+    sizes = {name: os.path.getsize(os.path.join(directory, name)) for name in sorted(os.listdir(directory))}
+    for name, size in sizes.items():
+        print(f'{name} {size / 1024 / 1024:,.1f} MB')
+
+    store = EmbeddedStore(directory, checkpoint_log_size=sys.maxsize)
+    started_at = time.perf_counter()
+    await store.open()
+    elapsed = time.perf_counter() - started_at
+    stats = store.recovery_stats
+    await store.close()
+
+    results += [
+        single_op_result('embedded.recovery.snapshot', stats.snapshot_records, stats.snapshot_seconds),
+        single_op_result('embedded.recovery.log', stats.log_records, stats.log_seconds),
+        single_op_result('embedded.recovery.total', stats.snapshot_records + stats.log_records, elapsed),
+    ]
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=10_000_000, help='sessions in the recovered snapshot')
+    parser.add_argument('--writes', type=int, default=100_000, help='logged inserts per write benchmark')
+    parser.add_argument('--writers', type=int, default=256, help='concurrent writers of the group commit benchmark')
+    parser.add_argument('--tail-writes', type=int, default=100_000, help='logged inserts after the checkpoint')
+    parser.add_argument('--sync-interval', type=float, default=0.002)
+    parser.add_argument('--no-fsync', action='store_true')
+    parser.add_argument('--directory', help='store directory, a temporary one by default')
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    directory = args.directory or tempfile.mkdtemp(prefix='embedded-store-bench-')
+    try:
+        results = asyncio.run(run(args, directory))
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory)
+
+    print_results(results)
+    return handle_baseline_arguments(args, results)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+In-process load generator, virtual users drive UserService and SessionService over the in-memory repos
+
+    python -m benchmarks.load --users 200 --concurrency 50 --refreshes 5
+    python -m benchmarks.load --baseline benchmarks/baselines/load.json
+"""
+import argparse
+import asyncio
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from app.common_lib.executor import ThreadPoolAsyncExecutor
+from app.common_lib.mail import EmailQueue, IEmailSender, OutgoingEmail
+from app.common_lib.rate_limit import IRateLimiter
+from app.db.memory.session import InMemorySessionRepo
+from app.db.memory.user import InMemoryUserAuthRepo
+from app.db.memory.verification_code import InMemoryVerificationCodeRepo
+from app.domain.models.tokens import RefreshTokenWithoutExpireValidation, revocation_list
+from app.domain.models.user import PasswordHashingPolicy
+from app.domain.services.login_throttler import LoginThrottler
+from app.domain.services.session import SessionService, LoginDTO
+from app.domain.services.user import UserService, RegisterDTO, VerifyEmailDTO
+from benchmarks.report import make_result, print_results, AllocationTracker, add_baseline_arguments, \
+    handle_baseline_arguments
+
+
+class Unlimited(IRateLimiter):
+    async def acquire(self, key: str, cost: float = 1.0) -> float:
+        return 0.0
+
+
+class NullEmailSender(IEmailSender):
+    async def send(self, emails: List[OutgoingEmail]) -> List[Optional[Exception]]:
+        return [None] * len(emails)
+
+
+class LoadGenerator:
+    def __init__(self, bcrypt_rounds: int, workers: int):
+        self.user_repo = InMemoryUserAuthRepo()
+        self.ver_code_repo = InMemoryVerificationCodeRepo()
+        self.session_repo = InMemorySessionRepo()
+        self.executor = ThreadPoolAsyncExecutor(max_workers=workers, max_queue_size=100_000)
+        self.email_queue = EmailQueue(NullEmailSender(), max_size=1_000_000)
+        password_policy = PasswordHashingPolicy(rounds=bcrypt_rounds)
+
+        self.user_service = UserService(
+            self.user_repo, self.ver_code_repo, self.executor, self.email_queue, password_policy
+        )
+        self.session_service = SessionService(
+            self.user_repo, self.session_repo, self.executor, password_policy,
+            # every virtual user logs in from the same address
+            login_throttler=LoginThrottler(address_limiter=Unlimited())
+        )
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+
+    async def _timed(self, name: str, coro):
+        started_at = time.perf_counter()
+        result = await coro
+        self.latencies[name].append(time.perf_counter() - started_at)
+        return result
+
+    async def virtual_user(self, i: int, refreshes: int):
+        email = f'load{i}@domain.com'
+        password = b'qwerty123'
+
+        registration_token = await self._timed('register', self.user_service.register(
+            RegisterDTO(email=email, password=password)
+        ))
+        await self._timed('send_verification_email', self.user_service.send_user_verification_email(
+            registration_token
+        ))
+        ver_code = await self.ver_code_repo.find_by_user_id(registration_token.sub)
+        await self._timed('verify_email', self.user_service.verify_email(
+            registration_token, VerifyEmailDTO(code=ver_code.code)
+        ))
+
+        access_token, refresh_token = await self._timed('login', self.session_service.login(
+            LoginDTO(email=email, password=password, client_address='127.0.0.1')
+        ))
+        for _ in range(refreshes):
+            access_token, refresh_token = await self._timed('refresh', self.session_service.refresh(
+                RefreshTokenWithoutExpireValidation.decode_and_validate(refresh_token.get_token())
+            ))
+
+        await self._timed('logout', self.session_service.logout_by_refresh_token(
+            access_token, RefreshTokenWithoutExpireValidation.decode_and_validate(refresh_token.get_token())
+        ))
+
+    async def run(self, users: int, concurrency: int, refreshes: int) -> float:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(i: int):
+            async with semaphore:
+                await self.virtual_user(i, refreshes)
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(limited(i) for i in range(users)))
+        elapsed = time.perf_counter() - started_at
+
+        self.executor.shutdown()
+        revocation_list.clear()
+
+        return elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--refreshes', type=int, default=5, help='refreshes per virtual user')
+    parser.add_argument('--bcrypt-rounds', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=4, help='executor threads for bcrypt')
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    generator = LoadGenerator(bcrypt_rounds=args.bcrypt_rounds, workers=args.workers)
+    with AllocationTracker(args.trace_allocations) as tracker:
+        elapsed = asyncio.run(generator.run(args.users, args.concurrency, args.refreshes))
+
+    # completed ops of the kind per second of the whole run
+    results = [
+        make_result(f'load.{name}', latencies, elapsed) for name, latencies in generator.latencies.items()
+    ]
+    results.append(make_result(
+        'load.total', [latency for latencies in generator.latencies.values() for latency in latencies],
+        elapsed, tracker.allocated
+    ))
+    print_results(results)
+
+    return handle_baseline_arguments(args, results)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
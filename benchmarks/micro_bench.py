@@ -0,0 +1,108 @@
+"""
+Microbenchmarks of the auth hot paths, with an optional json baseline for regression checks
+
+    python -m benchmarks.micro_bench --trace-allocations --save-baseline benchmarks/baselines/micro.json
+    python -m benchmarks.micro_bench --baseline benchmarks/baselines/micro.json
+"""
+import argparse
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, List, Tuple
+
+from bson import ObjectId
+
+from app.domain.models.session import Session, SessionStatus
+from app.domain.models.tokens import AccessToken, RefreshToken, TokenMinter
+from app.domain.models.user import UserAuth, hash_password, check_password
+from benchmarks.report import BenchResult, make_result, print_results, AllocationTracker, \
+    add_baseline_arguments, handle_baseline_arguments
+
+
+ALLOCATION_OPS = 1000
+
+
+def measure_retained_bytes(func: Callable[[], object], ops: int) -> int:
+    # results are kept, so this is the memory held by what the op returns
+    results = [None] * ops
+    with AllocationTracker(True) as tracker:
+        for i in range(ops):
+            results[i] = func()
+    return tracker.allocated
+
+
+def run(name: str, func: Callable[[], object], ops: int, trace_allocations: bool) -> BenchResult:
+    latencies = []
+    perf_counter = time.perf_counter
+    started_at = perf_counter()
+    for _ in range(ops):
+        op_started_at = perf_counter()
+        func()
+        latencies.append(perf_counter() - op_started_at)
+    elapsed = perf_counter() - started_at
+
+    allocation_ops = min(ops, ALLOCATION_OPS)
+    allocated = measure_retained_bytes(func, allocation_ops) * ops // allocation_ops if trace_allocations else None
+
+    return make_result(name, latencies, elapsed, allocated)
+
+
+def get_cases(bcrypt_rounds: int) -> List[Tuple[str, Callable[[], object], float]]:
+    """
+    (name, func, share of --ops), bcrypt is too slow to run as many times as the rest
+    """
+    user_id = ObjectId()
+    minter = TokenMinter()
+    access_token, refresh_token = minter.issue_pair(user_id)
+    encoded_access_token = access_token.get_token()
+    encoded_refresh_token = refresh_token.get_token()
+    hashed_password = hash_password.sync(b'qwerty123', bcrypt_rounds).value
+
+    session_fields = dict(
+        id=ObjectId(), user_id=user_id, family_id=uuid.uuid4(), refresh_token_digest=b'd' * 32,
+        expiration_time=datetime.now() + timedelta(days=1), status=SessionStatus.ACTIVE
+    )
+
+    def refresh_session():
+        session = Session.from_record(**session_fields)
+        session.refresh()
+        return Session.create_from_refreshed(session, refresh_token)
+
+    return [
+        ('tokens.issue_pair', lambda: minter.issue_pair(user_id), 1),
+        ('tokens.access_decode.uncached',
+         lambda: AccessToken._fast_decode_and_validate(encoded_access_token, use_cache=False), 1),
+        ('tokens.access_decode.cached', lambda: AccessToken.decode_and_validate(encoded_access_token), 1),
+        ('tokens.refresh_decode.uncached',
+         lambda: RefreshToken._fast_decode_and_validate(encoded_refresh_token, use_cache=False), 1),
+        ('user.hash_password', lambda: hash_password.sync(b'qwerty123', bcrypt_rounds), 0.01),
+        ('user.check_password', lambda: check_password.sync(b'qwerty123', hashed_password), 0.01),
+        ('session.refresh', refresh_session, 1),
+        ('model.user_from_record', lambda: UserAuth.from_record(
+            id=user_id, email='bench@domain.com', hashed_password=hashed_password
+        ), 1),
+        ('model.session_from_record', lambda: Session.from_record(**session_fields), 1),
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ops', type=int, default=20000)
+    parser.add_argument('--bcrypt-rounds', type=int, default=4)
+    parser.add_argument('--filter', default='', help='run benchmarks whose name contains it')
+    add_baseline_arguments(parser)
+    args = parser.parse_args()
+
+    results = [
+        run(name, func, max(int(args.ops * share), 1), args.trace_allocations)
+        for name, func, share in get_cases(args.bcrypt_rounds)
+        if args.filter in name
+    ]
+    print_results(results)
+
+    return handle_baseline_arguments(args, results)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Domain model construction: validated constructor vs from_record, objects/sec and bytes per object
+
+    python -m benchmarks.models_bench
+"""
+import argparse
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, List, Tuple
+
+from bson import ObjectId
+
+from app.domain.models.session import Session, SessionStatus
+from app.domain.models.tokens import AccessToken, RefreshToken, TokenMinter
+from app.domain.models.user import UserAuth
+from app.domain.models.verification_code import VerificationCode
+
+
+def measure_speed(build: Callable[[], object], count: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(count):
+        build()
+    return count / (time.perf_counter() - started_at)
+
+
+def measure_size(build: Callable[[], object], count: int) -> float:
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    objects = [build() for _ in range(count)]
+    snapshot_after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    allocated = sum(stat.size_diff for stat in snapshot_after.compare_to(snapshot_before, 'filename'))
+    # the list itself is not part of the objects
+    allocated -= objects.__sizeof__()
+    return allocated / count
+
+
+def get_cases() -> List[Tuple[str, Callable[[], object]]]:
+    now = datetime.now()
+    user_fields = dict(id=ObjectId(), email='bench@domain.com', hashed_password=b'$2b$04$' + b'a' * 53)
+    session_fields = dict(
+        id=ObjectId(), user_id=ObjectId(), family_id=uuid.uuid4(), refresh_token_digest=b'd' * 32,
+        expiration_time=now + timedelta(days=1), status=SessionStatus.ACTIVE
+    )
+    ver_code_fields = dict(id=ObjectId(), code='123456', issue_date=now, exp_date=now + timedelta(minutes=10))
+
+    user = UserAuth(**user_fields)
+    minter = TokenMinter()
+    access_token, refresh_token = minter.issue_pair(user.id)
+    access_token_fields = access_token.dict()
+    refresh_token_fields = refresh_token.dict()
+
+    return [
+        ('UserAuth', lambda: UserAuth(**user_fields)),
+        ('UserAuth.from_record', lambda: UserAuth.from_record(**user_fields)),
+        ('Session', lambda: Session(**session_fields)),
+        ('Session.from_record', lambda: Session.from_record(**session_fields)),
+        ('VerificationCode', lambda: VerificationCode(**ver_code_fields)),
+        ('VerificationCode.from_record', lambda: VerificationCode.from_record(**ver_code_fields)),
+        ('AccessToken', lambda: AccessToken(**access_token_fields)),
+        ('AccessToken.construct', lambda: AccessToken.construct(**access_token_fields)),
+        ('RefreshToken', lambda: RefreshToken(**refresh_token_fields)),
+        ('RefreshToken.construct', lambda: RefreshToken.construct(**refresh_token_fields)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=50000)
+    args = parser.parse_args()
+
+    print(f'{"model":<32} {"objects/sec":>14} {"bytes/object":>14}')
+    for name, build in get_cases():
+        speed = measure_speed(build, args.count)
+        size = measure_size(build, args.count)
+        print(f'{name:<32} {speed:>14,.0f} {size:>14,.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import json
+import math
+import tracemalloc
+from dataclasses import dataclass, asdict
+from typing import List, Dict, Optional, Sequence
+
+
+@dataclass
+class BenchResult:
+    name: str
+    ops: int
+    ops_per_sec: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    # memory still held after the ops, divided by ops, None when allocations weren't traced
+    alloc_bytes_per_op: Optional[float] = None
+
+
+def percentile(sorted_values: Sequence[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(max(math.ceil(q / 100 * len(sorted_values)) - 1, 0), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def make_result(name: str, latencies: List[float], elapsed: float,
+                alloc_bytes: Optional[int] = None) -> BenchResult:
+    latencies = sorted(latencies)
+    ops = len(latencies)
+    return BenchResult(
+        name=name,
+        ops=ops,
+        ops_per_sec=ops / elapsed if elapsed else 0.0,
+        p50_ms=percentile(latencies, 50) * 1000,
+        p95_ms=percentile(latencies, 95) * 1000,
+        p99_ms=percentile(latencies, 99) * 1000,
+        alloc_bytes_per_op=alloc_bytes / ops if alloc_bytes is not None and ops else None
+    )
+
+
+class AllocationTracker:
+    """
+    Net allocated bytes while the block runs, a no-op when disabled since tracemalloc slows everything down
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.allocated: Optional[int] = None
+
+    def __enter__(self) -> 'AllocationTracker':
+        if self.enabled:
+            tracemalloc.start()
+            self._started_with = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.enabled:
+            self.allocated = tracemalloc.get_traced_memory()[0] - self._started_with
+            tracemalloc.stop()
+
+
+def print_results(results: List[BenchResult]):
+    print(f'{"benchmark":<36} {"ops/sec":>12} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"B/op":>9}')
+    for result in results:
+        alloc = f'{result.alloc_bytes_per_op:,.0f}' if result.alloc_bytes_per_op is not None else '-'
+        print(f'{result.name:<36} {result.ops_per_sec:>12,.0f} {result.p50_ms:>9.3f} '
+              f'{result.p95_ms:>9.3f} {result.p99_ms:>9.3f} {alloc:>9}')
+
+
+def save_baseline(path: str, results: List[BenchResult]):
+    with open(path, 'w') as f:
+        json.dump({result.name: asdict(result) for result in results}, f, indent=2, sort_keys=True)
+
+
+def compare_with_baseline(path: str, results: List[BenchResult], tolerance: float) -> List[str]:
+    """
+    Benchmarks whose throughput dropped or p99 grew by more than tolerance (0.1 = 10%)
+    """
+    with open(path) as f:
+        baseline: Dict[str, dict] = json.load(f)
+
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+
+        if result.ops_per_sec < base['ops_per_sec'] * (1 - tolerance):
+            regressions.append(
+                f'{result.name}: {result.ops_per_sec:,.0f} ops/sec, baseline {base["ops_per_sec"]:,.0f}'
+            )
+        if result.p99_ms > base['p99_ms'] * (1 + tolerance):
+            regressions.append(f'{result.name}: p99 {result.p99_ms:.3f} ms, baseline {base["p99_ms"]:.3f} ms')
+
+    return regressions
+
+
+def add_baseline_arguments(parser):
+    parser.add_argument('--save-baseline', metavar='PATH', help='write results as the json baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='compare with the json baseline, exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    parser.add_argument('--trace-allocations', action='store_true')
+
+
+def handle_baseline_arguments(args, results: List[BenchResult]) -> int:
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+
+    if args.baseline:
+        regressions = compare_with_baseline(args.baseline, results, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        return 1 if regressions else 0
+
+    return 0
@@ -0,0 +1,51 @@
+"""
+Access/refresh pair issuing throughput: Token.create vs TokenMinter
+
+    python -m benchmarks.token_minting_bench
+"""
+import argparse
+import time
+from typing import Callable
+
+from bson import ObjectId
+
+from app.domain.models.tokens import AccessToken, RefreshToken, TokenMinter
+from app.domain.models.user import UserAuth
+
+
+def measure(name: str, func: Callable[[], int]):
+    started_at = time.perf_counter()
+    issued = func()
+    elapsed = time.perf_counter() - started_at
+
+    print(f'{name:<32} {issued / elapsed:>12,.0f} pairs/sec')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=5000)
+    args = parser.parse_args()
+
+    users = [UserAuth(id=ObjectId(), email=f'bench{i}@domain.com', hashed_password=b'') for i in range(args.users)]
+    minter = TokenMinter()
+
+    def create_path() -> int:
+        for user in users:
+            AccessToken.create(user), RefreshToken.create(user)
+        return len(users)
+
+    def minter_path() -> int:
+        for user in users:
+            minter.issue_pair(user.id)
+        return len(users)
+
+    def minter_bulk_path() -> int:
+        return len(minter.issue_pairs(user.id for user in users))
+
+    measure('Token.create', create_path)
+    measure('TokenMinter.issue_pair', minter_path)
+    measure('TokenMinter.issue_pairs', minter_bulk_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Access token verification throughput: the python-jose + pydantic decoding this service used to do
+vs the verifier, both with an HS256 key, plus the default EdDSA key
+
+    python -m benchmarks.tokens_bench
+
+The baseline needs python-jose, which the service no longer depends on: pip install python-jose
+"""
+import argparse
+import time
+from typing import Callable, List
+
+from bson import ObjectId
+
+from app.common_lib.keyring import HS256Key, EdDSAKey
+from app.domain.models.tokens import AccessToken, key_ring, verified_tokens_cache
+from app.domain.models.user import UserAuth
+
+try:
+    from jose import jwt
+except ImportError:
+    jwt = None
+
+SECRET = b'benchmark-secret'
+
+
+def measure(name: str, func: Callable[[str], object], tokens: List[str], repeat: int):
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        for token in tokens:
+            func(token)
+    elapsed = time.perf_counter() - started_at
+
+    total = len(tokens) * repeat
+    print(f'{name:<36} {total / elapsed:>12,.0f} tokens/sec')
+
+
+def baseline_decode(token: str) -> AccessToken:
+    # the decoding of the original Token._decode_and_validate
+    claims = jwt.decode(token, SECRET.decode('ascii'), algorithms='HS256')
+    return AccessToken(_token_cache=token, **claims)
+
+
+def no_cache_decode(token: str) -> AccessToken:
+    return AccessToken._fast_decode_and_validate(token, use_cache=False)
+
+
+def issue_tokens(user: UserAuth, count: int) -> List[str]:
+    return [AccessToken.create(user).get_token() for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tokens', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    user = UserAuth(id=ObjectId(), email='bench@domain.com', hashed_password=b'')
+
+    key_ring.load(HS256Key(SECRET, kid='bench'))
+    tokens = issue_tokens(user, args.tokens)
+    if jwt is not None:
+        measure('HS256 python-jose + pydantic', baseline_decode, tokens, args.repeat)
+    else:
+        print('HS256 python-jose + pydantic         skipped, python-jose is not installed')
+    measure('HS256 verifier, no cache', no_cache_decode, tokens, args.repeat)
+
+    key_ring.load(EdDSAKey.generate())
+    tokens = issue_tokens(user, args.tokens)
+    measure('EdDSA verifier, no cache', no_cache_decode, tokens, args.repeat)
+
+    # hits only, the first verification of every token is measured above
+    verified_tokens_cache.clear()
+    for token in tokens:
+        AccessToken.decode_and_validate(token)
+    measure('EdDSA verifier, cached', AccessToken.decode_and_validate, tokens, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from fastapi.testclient import TestClient
+
+from app.api.app import create_app
+from app.api.container import Container, load_signing_keys, build_container
+from app.common_lib.errors import InternalError
+from app.common_lib.executor import ThreadPoolAsyncExecutor
+from app.common_lib.keyring import KeyRing
+from app.common_lib.mail import EmailQueue
+from app.domain.models.tokens import revocation_list
+from app.domain.models.user import PasswordHashingPolicy
+from app.domain.services.introspection import TokenIntrospectionService
+from app.domain.services.session import SessionService
+from app.domain.services.user import UserService
+from app.settings import Settings
+from tests.unit.common_lib.keyring_test import private_pem
+from tests.unit.conftest import TUserRepo, TSessionRepo, TVerCodeRepo, TEmailSender
+
+
+INTROSPECTION_API_KEY = 'resource-server-key'
+
+
+def make_container(
+        user_repo: TUserRepo,
+        session_repo: TSessionRepo,
+        ver_code_repo: TVerCodeRepo,
+        email_sender: TEmailSender,
+        **kwargs
+) -> Container:
+    executor = ThreadPoolAsyncExecutor(max_workers=2)
+    email_queue = EmailQueue(email_sender, batch_linger=0.001)
+    password_policy = PasswordHashingPolicy(rounds=4)
+    return Container(
+        executor=executor,
+        email_queue=email_queue,
+        user_service=UserService(user_repo, ver_code_repo, executor, email_queue, password_policy),
+        session_service=SessionService(user_repo, session_repo, executor, password_policy),
+        introspection_service=TokenIntrospectionService(session_repo, api_keys=[INTROSPECTION_API_KEY]),
+        password_policy=password_policy,
+        shutdown_timeout=1,
+        **kwargs
+    )
+
+
+@pytest.fixture(scope='function')
+def client(
+        user_repo: TUserRepo,
+        session_repo: TSessionRepo,
+        ver_code_repo: TVerCodeRepo,
+        email_sender: TEmailSender
+) -> TestClient:
+    container = make_container(user_repo, session_repo, ver_code_repo, email_sender)
+    with TestClient(create_app(container=container)) as client:
+        yield client
+
+    revocation_list.clear()
+
+
+credentials = {'email': 'test@domain.com', 'password': 'qwerty123'}
+
+
+def auth_header(token: str) -> dict:
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_auth_flow(client: TestClient, ver_code_repo: TVerCodeRepo):
+    response = client.post('/auth/register', json=credentials)
+    assert response.status_code == 201
+    registration_token = response.json()['token']
+
+    assert client.post('/auth/register', json=credentials).status_code == 409
+    assert client.post('/auth/login', json=credentials).status_code == 403
+
+    assert client.post('/auth/verification-email', headers=auth_header(registration_token)).status_code == 202
+    code = next(iter(ver_code_repo._user_id_to_ver_code.values())).code
+    response = client.post('/auth/verify', json={'code': code}, headers=auth_header(registration_token))
+    assert response.status_code == 204
+
+    assert client.post('/auth/login', json={**credentials, 'password': 'wrong-password'}).status_code == 401
+    assert client.post('/auth/login', json={**credentials, 'email': 'other@domain.com'}).json() == \
+           {'error': 'WrongPassword'}
+
+    response = client.post('/auth/login', json=credentials)
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/json'
+    tokens = response.json()
+
+    response = client.post('/auth/refresh', json={'refresh_token': tokens['refresh_token']})
+    assert response.status_code == 200
+    new_tokens = response.json()
+
+    # reuse of the rotated refresh token
+    assert client.post('/auth/refresh', json={'refresh_token': tokens['refresh_token']}).status_code == 401
+    assert client.post(
+        '/auth/logout', json={'refresh_token': new_tokens['refresh_token']}, headers=auth_header(new_tokens['access_token'])
+    ).status_code == 401
+
+    tokens = client.post('/auth/login', json=credentials).json()
+    response = client.post(
+        '/auth/logout', json={'refresh_token': tokens['refresh_token']}, headers=auth_header(tokens['access_token'])
+    )
+    assert response.status_code == 204
+    assert client.post('/auth/refresh', json={'refresh_token': tokens['refresh_token']}).status_code == 401
+
+    active_tokens = client.post('/auth/login', json=credentials).json()
+    body = {'tokens': [active_tokens['access_token'], tokens['access_token']]}
+    assert client.post('/auth/introspect', json=body).status_code == 401
+    # a user token isn't a service credential
+    assert client.post(
+        '/auth/introspect', json=body, headers=auth_header(active_tokens['access_token'])
+    ).status_code == 401
+
+    response = client.post('/auth/introspect', json=body, headers=auth_header(INTROSPECTION_API_KEY))
+    assert response.status_code == 200
+    results = response.json()['results']
+    assert results[0]['active'] and results[0]['exp'] and results[0]['error'] is None
+    assert results[1] == {'active': False, 'sub': None, 'exp': None, 'family_id': None, 'error': 'TokenIsRevoked'}
+
+
+def test_request_validation(client: TestClient):
+    assert client.post('/auth/register', json={'email': 'not-an-email', 'password': 'qwerty123'}).status_code == 422
+    assert client.post('/auth/register', json={**credentials, 'password': 'short'}).status_code == 422
+    assert client.post('/auth/verify', json={'code': '123456'}).status_code == 401
+    assert client.get('/.well-known/jwks.json').json()['keys']
+
+
+def test_password_policy_calibration_on_start(
+        user_repo: TUserRepo,
+        session_repo: TSessionRepo,
+        ver_code_repo: TVerCodeRepo,
+        email_sender: TEmailSender,
+        monkeypatch
+):
+    # 1ms at 10 rounds, doubling with every round
+    monkeypatch.setattr(
+        PasswordHashingPolicy, '_measure_hash_time', staticmethod(lambda rounds: 0.001 * 2 ** (rounds - 10))
+    )
+    container = make_container(user_repo, session_repo, ver_code_repo, email_sender, bcrypt_target_latency=0.01)
+
+    with TestClient(create_app(container=container)):
+        assert container.password_policy.rounds == 13
+
+
+def test_load_signing_keys(tmp_path):
+    key_path = tmp_path / 'signing-key.pem'
+    key_path.write_bytes(private_pem(ed25519.Ed25519PrivateKey.generate()))
+    retired_pem = private_pem(ec.generate_private_key(ec.SECP256R1())).decode('ascii')
+    settings = Settings(
+        token_signing_key=str(key_path),
+        token_signing_key_id='current',
+        token_verification_keys={'retired': retired_pem}
+    )
+
+    key_ring = KeyRing()
+    assert load_signing_keys(settings, key_ring)
+    assert key_ring.get_signing_key().kid == 'current'
+    assert {key.kid for key in key_ring.keys()} == {'current', 'retired'}
+
+    assert not load_signing_keys(Settings(), KeyRing())
+
+
+def test_internal_endpoints_are_disabled_by_default(
+        user_repo: TUserRepo,
+        session_repo: TSessionRepo,
+        ver_code_repo: TVerCodeRepo,
+        email_sender: TEmailSender
+):
+    for settings, status_code in ((Settings(), 404), (Settings(internal_endpoints_enabled=True), 200)):
+        container = make_container(user_repo, session_repo, ver_code_repo, email_sender)
+        with TestClient(create_app(settings, container=container)) as client:
+            assert client.get('/metrics').status_code == status_code
+
+
+def test_workers_require_a_configured_signing_key(tmp_path):
+    with pytest.raises(InternalError):
+        build_container(Settings(invalidation_socket_dir=str(tmp_path)))
@@ -0,0 +1,14 @@
+from app.api.client_address import ClientAddressResolver
+
+
+def test_client_address_resolver():
+    resolver = ClientAddressResolver(['10.0.0.0/8', '192.168.1.1'])
+
+    assert resolver.resolve('10.0.0.5', '203.0.113.7') == '203.0.113.7'
+    # the client can prepend anything, only the part added by trusted proxies counts
+    assert resolver.resolve('10.0.0.5', '1.1.1.1, 203.0.113.7, 192.168.1.1') == '203.0.113.7'
+    assert resolver.resolve('10.0.0.5', '10.0.0.7') == '10.0.0.7'
+    assert resolver.resolve('10.0.0.5', None) == '10.0.0.5'
+    # the header of an untrusted peer is ignored
+    assert resolver.resolve('203.0.113.7', '1.1.1.1') == '203.0.113.7'
+    assert ClientAddressResolver().resolve('10.0.0.5', '1.1.1.1') == '10.0.0.5'
@@ -0,0 +1,73 @@
+import asyncio
+import functools
+import time
+
+import pytest
+
+from app.common_lib.executor import ProcessPoolAsyncExecutor, ExecutorIsOverloaded, ThreadPoolAsyncExecutor, \
+    bind_executor, cpu_bound
+from app.domain.models.user import hash_password, check_password, WrongPassword
+
+
+@pytest.fixture(scope='function')
+def process_executor() -> ProcessPoolAsyncExecutor:
+    executor = ProcessPoolAsyncExecutor(max_workers=1, max_queue_size=0)
+    yield executor
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_process_pool_executor(process_executor: ProcessPoolAsyncExecutor):
+    hashed_password = await hash_password.run_in(process_executor, b'qwerty123')
+
+    await check_password.run_in(process_executor, b'qwerty123', hashed_password.value)
+
+    with pytest.raises(WrongPassword):
+        await check_password.run_in(process_executor, b'wrong_password', hashed_password.value)
+
+    assert process_executor.metrics.submitted == 3
+    assert process_executor.metrics.failed == 1
+    assert process_executor.metrics.run_time.count == 2
+    assert process_executor.metrics.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_process_pool_executor_rejects_when_saturated(process_executor: ProcessPoolAsyncExecutor):
+    slow_call = asyncio.create_task(process_executor(functools.partial(time.sleep, 0.5)))
+    await asyncio.sleep(0)
+
+    with pytest.raises(ExecutorIsOverloaded):
+        await process_executor(functools.partial(time.sleep, 0))
+
+    await slow_call
+
+    assert process_executor.metrics.rejected == 1
+    await process_executor(functools.partial(time.sleep, 0))
+
+
+calls = []
+
+
+@cpu_bound
+def record_call(value: int) -> int:
+    calls.append(value)
+    return value * 2
+
+
+@pytest.mark.asyncio
+async def test_cpu_bound():
+    executor = ThreadPoolAsyncExecutor(max_workers=1)
+    bind_executor(executor)
+    try:
+        assert await record_call(21) == 42
+    finally:
+        bind_executor(None)
+        executor.shutdown()
+
+    assert calls == [21]
+    assert record_call.stats.cpu_time.count == 1
+    assert record_call.stats.queue_wait.count == 1
+    assert executor.metrics.submitted == 1
+
+    assert record_call.sync(1) == 2
+    assert calls == [21, 1]
@@ -0,0 +1,74 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from app.common_lib.invalidation import UnixSocketInvalidationBus
+from app.db.repositories.cached_user import CachingUserAuthRepo
+from app.domain.models.revocation import RevocationList
+from app.domain.models.user import UserAuth, HashedPassword
+from tests.unit.conftest import TUserRepo
+
+
+async def wait_for(condition, timeout: float = 1.0):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.001)
+    await asyncio.wait_for(poll(), timeout)
+
+
+@pytest.mark.asyncio
+async def test_unix_socket_bus(tmp_path):
+    buses = [UnixSocketInvalidationBus(str(tmp_path), name=f'worker{i}', peers_refresh_interval=0) for i in range(3)]
+    received = {i: [] for i in range(3)}
+    for i, bus in enumerate(buses):
+        bus.subscribe('topic', received[i].append)
+        bus.start()
+
+    try:
+        buses[0].publish('topic', {'id': 1})
+        await wait_for(lambda: received[1] and received[2])
+        assert received == {0: [], 1: [{'id': 1}], 2: [{'id': 1}]}
+
+        # a dead worker is forgotten
+        buses[2].stop()
+        buses[0].publish('topic', {'id': 2})
+        await wait_for(lambda: len(received[1]) == 2)
+        assert len(list(tmp_path.iterdir())) == 2
+    finally:
+        for bus in buses:
+            bus.stop()
+
+
+@pytest.mark.asyncio
+async def test_revocations_and_user_updates_reach_other_workers(tmp_path):
+    workers = []
+    user_repo = TUserRepo()
+    for i in range(2):
+        bus = UnixSocketInvalidationBus(str(tmp_path), name=f'worker{i}', peers_refresh_interval=0)
+        revocation_list = RevocationList(ttl=timedelta(minutes=5))
+        revocation_list.attach_bus(bus)
+        bus.start()
+        workers.append((bus, revocation_list, CachingUserAuthRepo(user_repo, bus=bus)))
+
+    try:
+        (_, revocation_list, user_cache), (_, other_revocation_list, other_user_cache) = workers
+
+        revocation_list.revoke_families(['family'])
+        revocation_list.revoke_users(['user'])
+        await wait_for(lambda: len(other_revocation_list) == 2)
+        assert other_revocation_list.is_revoked('sub', 'family', None)
+        assert other_revocation_list.is_revoked('user', None, None)
+
+        user = await user_cache.insert(
+            UserAuth.create(email='test@domain.com', hashed_password=HashedPassword.from_hash(b'$2b$04$' + b'a' * 53))
+        )
+        assert not (await other_user_cache.find_by_id(str(user.id))).is_email_verified
+
+        user.verify_email()
+        await user_cache.update(user)
+        await wait_for(lambda: str(user.id) not in other_user_cache._by_id)
+        assert (await other_user_cache.find_by_id(str(user.id))).is_email_verified
+    finally:
+        for bus, _, _ in workers:
+            bus.stop()
@@ -0,0 +1,90 @@
+import time
+from datetime import timedelta
+
+import pytest
+
+from app.common_lib.jws import JWSSigner, JWSVerifier, JWSVerificationFailed, JWTExpired, UnknownSigningKey
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+from app.common_lib.keyring import KeyRing, ES256Key, EdDSAKey, HS256Key, key_from_pem
+
+claims = {'sub': 'user', 'exp': int(time.time()) + 60}
+
+
+@pytest.mark.parametrize('key_factory', [ES256Key.generate, EdDSAKey.generate, lambda: HS256Key(b'secret', kid='hs')])
+def test_sign_and_verify(key_factory):
+    key_ring = KeyRing(key_factory=key_factory)
+    token = JWSSigner(key_ring).sign(claims)
+
+    assert JWSVerifier(key_ring).verify(token) == claims
+
+    with pytest.raises(JWTExpired):
+        JWSVerifier(key_ring).verify(JWSSigner(key_ring).sign({**claims, 'exp': int(time.time()) - 60}))
+
+    with pytest.raises(JWSVerificationFailed):
+        JWSVerifier(KeyRing(key_factory=key_factory)).verify(token)
+
+
+def test_rotation():
+    key_ring = KeyRing(key_factory=EdDSAKey.generate, retention=timedelta(seconds=60))
+    signer, verifier = JWSSigner(key_ring), JWSVerifier(key_ring)
+
+    old_token = signer.sign(claims)
+    old_key = key_ring.get_signing_key()
+
+    new_key = key_ring.rotate()
+    new_token = signer.sign(claims)
+
+    assert old_key.kid != new_key.kid
+    assert verifier.verify(old_token) == verifier.verify(new_token) == claims
+    assert {jwk['kid'] for jwk in key_ring.jwks()['keys']} == {old_key.kid, new_key.kid}
+
+    key_ring._retention = 0
+    key_ring.rotate()
+
+    with pytest.raises(JWSVerificationFailed):
+        verifier.verify(new_token)
+
+
+def test_verification_with_exported_jwks():
+    key_ring = KeyRing(key_factory=ES256Key.generate)
+    token = JWSSigner(key_ring).sign(claims)
+
+    downstream_key_ring = KeyRing()
+    downstream_key_ring.add_jwks(key_ring.jwks())
+
+    assert JWSVerifier(downstream_key_ring).verify(token) == claims
+    assert all('d' not in jwk for jwk in key_ring.jwks()['keys'])
+
+
+def private_pem(private_key) -> bytes:
+    return private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+
+
+def public_pem(private_key) -> bytes:
+    return private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+
+def test_load_configured_keys():
+    old_private_key = ec.generate_private_key(ec.SECP256R1())
+    old_key_ring = KeyRing()
+    old_key_ring.load(key_from_pem(private_pem(old_private_key), kid='old'))
+    old_token = JWSSigner(old_key_ring).sign(claims)
+
+    private_key = ed25519.Ed25519PrivateKey.generate()
+    key_ring = KeyRing(key_factory=EdDSAKey.generate, rotation_interval=timedelta(seconds=0))
+    key_ring.load(key_from_pem(private_pem(private_key), kid='new'), [key_from_pem(public_pem(old_private_key), 'old')])
+
+    # every process with the same config signs with the same key, no matter the rotation interval
+    token = JWSSigner(key_ring).sign(claims)
+    assert key_ring.get_signing_key().kid == 'new'
+    assert JWSVerifier(key_ring).verify(old_token) == JWSVerifier(key_ring).verify(token) == claims
+    assert {jwk['kid'] for jwk in key_ring.jwks()['keys']} == {'old', 'new'}
+
+    with pytest.raises(UnknownSigningKey):
+        key_ring.load(key_from_pem(public_pem(private_key)))
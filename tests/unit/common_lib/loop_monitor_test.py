@@ -0,0 +1,36 @@
+import asyncio
+import time
+
+import pytest
+
+from app.common_lib.loop_monitor import LoopMonitor
+from app.common_lib.metrics import MetricsRegistry
+
+
+def blocking_call():
+    time.sleep(0.3)
+
+
+@pytest.mark.asyncio
+async def test_loop_monitor():
+    registry = MetricsRegistry()
+    monitor = LoopMonitor(threshold=0.05, heartbeat_interval=0.01, sample_interval=0.005, registry=registry)
+    monitor.start()
+
+    await asyncio.sleep(0.05)
+    assert monitor.collapsed_stacks() == ''
+
+    blocking_call()
+    await asyncio.sleep(0.05)
+    await monitor.stop()
+
+    lines = monitor.collapsed_stacks().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(' ', 1)
+    assert int(count) > 10
+    caller, leaf = stack.rsplit(';', 2)[-2:]
+    assert ':test_loop_monitor:' in caller and ':blocking_call:' in leaf
+
+    exported = registry.export_prometheus()
+    assert 'auth_event_loop_blocked_total 1' in exported
+    assert registry.histogram('auth_event_loop_lag_seconds', '').labels().percentile(100) >= 0.25
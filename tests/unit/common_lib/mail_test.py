@@ -0,0 +1,108 @@
+import asyncio
+import socket
+
+import pytest
+
+from app.common_lib.mail import EmailQueue, OutgoingEmail, EmailQueueIsFull, SMTPEmailSender
+from tests.unit.conftest import TEmailSender
+
+
+def create_emails(count: int):
+    return [OutgoingEmail(to=f'user{i}@domain.com', subject='subject', body='body') for i in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_batching_and_retries():
+    email_sender = TEmailSender(failures=2)
+    email_queue = EmailQueue(email_sender, batch_size=3, batch_linger=0.001, base_backoff=0.001)
+    emails = create_emails(5)
+    for email in emails:
+        email_queue.enqueue(email)
+    assert email_queue.depth == 5
+
+    email_queue.start()
+    await asyncio.wait_for(email_queue.join(), 1)
+    await email_queue.stop()
+
+    assert sorted(email.to for email in email_sender.sent) == sorted(email.to for email in emails)
+    assert email_queue.metrics.sent == 5
+    assert email_queue.metrics.failed_batches == 2
+    assert email_queue.metrics.send_latency.count == email_queue.metrics.batches
+    assert email_queue.metrics.delivery_latency.count == 5
+    assert not email_queue.dead_letters
+
+
+@pytest.mark.asyncio
+async def test_dead_letters_and_bounded_size():
+    email_queue = EmailQueue(
+        TEmailSender(failures=100), max_size=2, batch_linger=0.001, max_attempts=3, base_backoff=0.001
+    )
+    emails = create_emails(3)
+    email_queue.enqueue(emails[0])
+    email_queue.enqueue(emails[1])
+    with pytest.raises(EmailQueueIsFull):
+        email_queue.enqueue(emails[2])
+
+    email_queue.start()
+    await asyncio.wait_for(email_queue.join(), 1)
+    await email_queue.stop()
+
+    assert list(email_queue.dead_letters) == emails[:2]
+    assert all(email.attempts == 3 and 'smtp is down' in email.last_error for email in email_queue.dead_letters)
+
+
+@pytest.mark.asyncio
+async def test_only_failed_emails_are_retried():
+    emails = create_emails(3)
+    email_sender = TEmailSender(rejected=[emails[1].to])
+    email_queue = EmailQueue(email_sender, batch_linger=0.001, max_attempts=3, base_backoff=0.001)
+    for email in emails:
+        email_queue.enqueue(email)
+
+    email_queue.start()
+    await asyncio.wait_for(email_queue.join(), 1)
+    await email_queue.stop()
+
+    assert email_sender.sent == [emails[0], emails[2]]
+    assert list(email_queue.dead_letters) == [emails[1]]
+    assert email_queue.metrics.failed == 3 and email_queue.metrics.failed_batches == 0
+
+
+@pytest.mark.asyncio
+async def test_smtp_sender():
+    controller_module = pytest.importorskip('aiosmtpd.controller')
+    from aiosmtpd.handlers import Sink
+
+    class Handler(Sink):
+        def __init__(self):
+            self.envelopes = []
+
+        async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+            if address == 'rejected@domain.com':
+                return '550 No such user'
+            envelope.rcpt_tos.append(address)
+            return '250 OK'
+
+        async def handle_DATA(self, server, session, envelope):
+            self.envelopes.append(envelope)
+            return '250 OK'
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+
+    handler = Handler()
+    controller = controller_module.Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    try:
+        sender = SMTPEmailSender(host='127.0.0.1', port=port,
+                                 from_address='noreply@domain.com')
+        emails = create_emails(3)
+        # refused by the server, the rest of the batch still goes out
+        emails[1].to = 'rejected@domain.com'
+        errors = await sender.send(emails)
+    finally:
+        controller.stop()
+
+    assert errors[0] is None and errors[2] is None and errors[1] is not None
+    assert [envelope.rcpt_tos for envelope in handler.envelopes] == [['user0@domain.com'], ['user2@domain.com']]
@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+from app.common_lib.executor import ProcessPoolAsyncExecutor
+from app.common_lib.instrumentation import instrument, CALL_SECONDS, CALL_ERRORS, EXECUTOR_QUEUE_WAIT_SECONDS, \
+    EXECUTOR_RUN_SECONDS, EXECUTOR_ERRORS
+from app.common_lib.metrics import Histogram, MetricsRegistry, bucket_index, bucket_upper_bound
+from app.domain.models.user import WrongPassword, check_password, hash_password
+from tests.unit.conftest import AsyncExecutor
+
+
+def test_histogram_buckets():
+    for micros in range(0, 100_000, 7):
+        index = bucket_index(micros)
+        assert bucket_upper_bound(index) >= micros
+        assert index == 0 or bucket_upper_bound(index - 1) < micros
+        # log-linear buckets keep the relative error bounded
+        assert bucket_upper_bound(index) <= micros * 1.07 + 1
+
+
+def test_histogram_percentiles_across_threads():
+    histogram = Histogram()
+
+    def record(offset: int):
+        for i in range(offset, 1000, 4):
+            histogram.record((i + 1) / 1000)
+
+    threads = [threading.Thread(target=record, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert histogram.count == 1000
+    assert histogram.percentile(50) == pytest.approx(0.5, rel=0.05)
+    assert histogram.percentile(99) == pytest.approx(0.99, rel=0.05)
+
+
+class Service:
+    hashed_password = hash_password.sync(b'right-password', 4).value
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.calls = 0
+
+    async def login(self, password: bytes):
+        self.calls += 1
+        await check_password.run_in(self.executor, password, self.hashed_password)
+
+
+@pytest.mark.asyncio
+async def test_instrument():
+    registry = MetricsRegistry(enabled=False)
+    service = Service(AsyncExecutor())
+    assert instrument(service, 'service', registry) is service
+
+    registry.enabled = True
+    instrumented = instrument(Service(instrument(AsyncExecutor(), 'executor', registry)), 'service', registry)
+    for _ in range(3):
+        with pytest.raises(WrongPassword):
+            await instrumented.login(b'qwerty123')
+    assert instrumented.calls == 3
+
+    registry.enabled = False
+    with pytest.raises(WrongPassword):
+        await instrumented.login(b'qwerty123')
+
+    assert registry.histogram(CALL_SECONDS, '').labels('service', 'login').count == 3
+    assert registry.histogram(EXECUTOR_QUEUE_WAIT_SECONDS, '').labels().count == 3
+
+    exported = registry.export_prometheus()
+    assert 'auth_call_seconds_count{component="service",method="login"} 3' in exported
+    assert 'auth_call_seconds_bucket{component="service",method="login",le="+Inf"} 3' in exported
+    assert f'{CALL_ERRORS}{{component="service",method="login",error="WrongPassword"}} 3' in exported
+
+
+@pytest.mark.asyncio
+async def test_instrumented_executor_failures():
+    registry = MetricsRegistry(enabled=True)
+    executor = ProcessPoolAsyncExecutor(max_workers=1)
+    instrumented = instrument(executor, 'executor', registry)
+    try:
+        with pytest.raises(WrongPassword):
+            await check_password.run_in(instrumented, b'qwerty123', Service.hashed_password)
+        await check_password.run_in(instrumented, b'right-password', Service.hashed_password)
+    finally:
+        executor.shutdown()
+
+    # the failure goes through the wrapped executor, and its timings are recorded anyway
+    assert executor.metrics.failed == 1
+    assert registry.histogram(EXECUTOR_RUN_SECONDS, '').labels().count == 2
+    assert f'{EXECUTOR_ERRORS}{{error="WrongPassword"}} 1' in registry.export_prometheus()
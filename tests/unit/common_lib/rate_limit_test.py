@@ -0,0 +1,30 @@
+from app.common_lib.rate_limit import InMemoryRateLimiter, TokenBucketRule
+
+
+def test_token_bucket():
+    limiter = InMemoryRateLimiter(TokenBucketRule(capacity=3, refill_per_second=1))
+
+    assert [limiter.try_acquire('key', now=0.0) for _ in range(3)] == [0.0] * 3
+    assert limiter.try_acquire('key', now=0.0) == 1.0
+    assert limiter.try_acquire('other', now=0.0) == 0.0
+
+    assert limiter.try_acquire('key', now=0.5) == 0.5
+    assert limiter.try_acquire('key', now=1.0) == 0.0
+    assert limiter.try_acquire('key', cost=5, now=1.0) == 5.0
+
+
+def test_idle_and_memory_bound_eviction():
+    limiter = InMemoryRateLimiter(TokenBucketRule(capacity=2, refill_per_second=1), shards=1, max_buckets=10)
+
+    for i in range(100):
+        limiter.try_acquire(f'key{i}', now=0.0)
+    assert len(limiter) == 10
+
+    # buckets idle for longer than seconds_to_full are evicted by later checks
+    for i in range(5):
+        limiter.try_acquire(f'new{i}', now=10.0)
+    assert len(limiter) == 5
+
+    # a full bucket is recreated as full, so eviction doesn't let anyone through early
+    assert limiter.try_acquire('new0', now=10.0) == 0.0
+    assert limiter.try_acquire('new0', now=10.0) == 1.0
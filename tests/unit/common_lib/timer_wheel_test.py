@@ -0,0 +1,45 @@
+import random
+
+from app.common_lib.timer_wheel import TimerWheel
+
+
+def test_timer_wheel():
+    wheel = TimerWheel(now=0.0, resolution=1.0, slots_per_level=4, levels=2)
+    wheel.schedule('soon', 2.5)
+    wheel.schedule('later', 9.0)
+    # past the last level
+    wheel.schedule('far', 100.0)
+    wheel.schedule('cancelled', 3.0)
+    wheel.schedule('moved', 1.0)
+    wheel.cancel('cancelled')
+    wheel.schedule('moved', 50.0)
+
+    assert wheel.advance(2.9) == []
+    assert wheel.advance(3.0) == ['soon']
+    assert wheel.advance(49.0) == ['later']
+    assert wheel.advance(50.0) == ['moved']
+    assert len(wheel) == 1
+    assert wheel.advance(1000.0) == ['far']
+    assert len(wheel) == 0
+
+
+def test_timer_wheel_matches_sorted_deadlines():
+    rnd = random.Random(42)
+    wheel = TimerWheel(now=0.0, resolution=0.5, slots_per_level=4, levels=3)
+    deadlines = {}
+    for key in range(2000):
+        deadlines[key] = rnd.uniform(0, 150)
+        wheel.schedule(key, deadlines[key])
+    for key in range(0, 2000, 7):
+        wheel.cancel(key)
+        del deadlines[key]
+
+    now = 0.0
+    while deadlines:
+        now += rnd.uniform(0, 2)
+        expired = set(wheel.advance(now))
+        # never early, at most one tick late
+        assert all(deadlines[key] <= now for key in expired)
+        assert {key for key, deadline in deadlines.items() if deadline <= now - 0.5} <= expired
+        for key in expired:
+            del deadlines[key]
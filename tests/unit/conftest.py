@@ -1,20 +1,27 @@
 import asyncio
-from typing import Optional, Callable, Any, TypeVar, Dict
+import os
+import uuid
+from datetime import datetime
+from typing import Optional, Callable, Any, TypeVar, Dict, Iterable, AsyncIterator, List
 
 import pytest
+import pytest_asyncio
 from bson import ObjectId
-from pydantic import BaseModel
 
-from app.common_lib.domain.model import ID
+from app.common_lib.domain.model import ID, IdModel
 from app.common_lib.executor import IAsyncExecutor
-from app.domain.models.session import Session
-from app.domain.repos.session import ISessionRepo
+from app.common_lib.mail import IEmailSender, OutgoingEmail
+from app.db.odm.client import MongoSettings, get_database, close_clients
+from app.db.odm.indexes import ensure_indexes
+from app.domain.models.session import Session, SessionIsNotActive, ReusingOfRefreshToken, SessionStatus
+from app.domain.models.tokens import RefreshToken
+from app.domain.repos.session import ISessionRepo, SessionSweepCandidate
 from app.domain.models.user import UserAuth
 from app.domain.models.verification_code import VerificationCode
 from app.domain.repos.verification_code import IVerificationCodeRepo
-from app.domain.repos.user import IUserAuthRepo
+from app.domain.repos.user import IUserAuthRepo, UserEmailIsTaken
 
-ObjType = TypeVar('ObjType', bound=BaseModel)
+ObjType = TypeVar('ObjType', bound=IdModel)
 
 
 class TRepo:
@@ -22,7 +29,7 @@ class TRepo:
     def _get_object_from_store(cls, store: Dict[Any, ObjType], key: Any) -> Optional[ObjType]:
         obj = store.get(key)
         if obj:
-            return obj.copy(deep=True)
+            return obj.clone()
         return None
 
 
@@ -46,6 +53,9 @@ class TUserRepo(IUserAuthRepo, TRepo):
         return self._get_object_from_store(self._email_to_user, email)
 
     async def insert(self, user: UserAuth) -> UserAuth:
+        if user.email in self._email_to_user:
+            raise UserEmailIsTaken()
+
         user.id = ObjectId()
         self._update_store(user)
 
@@ -76,6 +86,22 @@ class TVerCodeRepo(IVerificationCodeRepo, TRepo):
     async def update(self, ver_code: VerificationCode):
         self._update_store(ver_code)
 
+    async def upsert_for_resend(self, ver_code: VerificationCode) -> bool:
+        previous = self._user_id_to_ver_code.get(ver_code.id)
+        if previous is not None:
+            ver_code.check_can_replace(previous)
+        self._update_store(ver_code.clone())
+
+        return previous is not None
+
+    async def register_attempt(self, user_id: str) -> Optional[VerificationCode]:
+        ver_code = self._user_id_to_ver_code.get(ObjectId(user_id))
+        if ver_code is None:
+            return None
+
+        ver_code.attempts += 1
+        return ver_code.clone()
+
 
 @pytest.fixture(scope='function')
 def ver_code_repo() -> TVerCodeRepo:
@@ -89,7 +115,7 @@ class TSessionRepo(ISessionRepo, TRepo):
 
     def _update_store(self, session: Session):
         self._id_to_session[session.id] = session
-        self._token_to_session[session.refresh_token] = session
+        self._token_to_session[session.refresh_token_digest] = session
 
     async def insert(self, session: Session) -> Session:
         session.id = ObjectId()
@@ -103,11 +129,97 @@ class TSessionRepo(ISessionRepo, TRepo):
     async def find_session_by_id(self, _id: str) -> Optional[Session]:
         return self._get_object_from_store(self._id_to_session, ObjectId(_id))
 
-    async def find_session_by_token(self, token: str) -> Optional[Session]:
-        return self._get_object_from_store(self._token_to_session, token)
+    async def find_session_by_token_digest(self, digest: bytes) -> Optional[Session]:
+        return self._get_object_from_store(self._token_to_session, digest)
 
     async def invalidate_session_family(self, session: Session):
-        pass
+        await self.invalidate_session_families([session.family_id])
+
+    async def invalidate_session_families(
+            self,
+            family_ids: Iterable[uuid.UUID],
+            status: SessionStatus = SessionStatus.COMPROMISED
+    ) -> int:
+        family_ids = set(family_ids)
+        sessions = [session for session in self._id_to_session.values() if session.family_id in family_ids]
+        for session in sessions:
+            session.status = status
+
+        return len(sessions)
+
+    async def invalidate_users_sessions(self, user_ids: Iterable[str]) -> int:
+        user_ids = {ObjectId(user_id) for user_id in user_ids}
+        sessions = [
+            session for session in self._id_to_session.values()
+            if session.user_id in user_ids and session.status is SessionStatus.ACTIVE
+        ]
+        for session in sessions:
+            session.status = SessionStatus.LOGOUT
+
+        return len(sessions)
+
+    async def rotate_session(self, token_digest: bytes, refresh_token: RefreshToken) -> Session:
+        session = self._get_object_from_store(self._token_to_session, token_digest)
+        if not session:
+            raise SessionIsNotActive()
+
+        try:
+            session.refresh()
+        except ReusingOfRefreshToken as ex:
+            await self.invalidate_session_family(session)
+            raise ex
+
+        new_session = Session.create_from_refreshed(refreshed_session=session, refresh_token=refresh_token)
+
+        await self.update(session)
+        return await self.insert(new_session)
+
+    async def find_family_statuses(self, family_ids: Iterable[uuid.UUID]) -> Dict[uuid.UUID, SessionStatus]:
+        family_ids = set(family_ids)
+        newest = {}
+        for session in self._id_to_session.values():
+            if session.family_id in family_ids and (
+                    session.family_id not in newest or session.id.binary > newest[session.family_id].id.binary
+            ):
+                newest[session.family_id] = session
+
+        now = datetime.now()
+        return {
+            family_id: session.status for family_id, session in newest.items()
+            if session.status is not SessionStatus.ACTIVE or session.expiration_time > now
+        }
+
+    async def iter_sweep_candidates(self, now: datetime, batch_size: int) -> AsyncIterator[List[SessionSweepCandidate]]:
+        sessions = sorted(
+            (
+                session for session in self._id_to_session.values()
+                if session.status is not SessionStatus.ACTIVE or session.expiration_time <= now
+            ),
+            key=lambda session: (session.family_id, session.id.binary),
+            reverse=True
+        )
+        sessions.sort(key=lambda session: session.family_id)
+
+        for i in range(0, len(sessions), batch_size):
+            yield [
+                SessionSweepCandidate(
+                    id=session.id,
+                    family_id=session.family_id,
+                    status=session.status,
+                    expiration_time=session.expiration_time
+                )
+                for session in sessions[i:i + batch_size]
+            ]
+
+    async def delete_sessions(self, ids: List[Any], archive: bool = False) -> int:
+        deleted = 0
+        for _id in ids:
+            session = self._id_to_session.pop(_id, None)
+            if session:
+                self._token_to_session.pop(session.refresh_token_digest, None)
+                deleted += 1
+
+        return deleted
 
 
 @pytest.fixture(scope='function')
@@ -120,3 +232,53 @@ class AsyncExecutor(IAsyncExecutor):
     async def __call__(self, func: Callable) -> Any:
         loop = asyncio.get_event_loop()
         return await loop.run_in_executor(None, func)
+
+
+class TEmailSender(IEmailSender):
+    def __init__(self, failures: int = 0, rejected: Iterable[str] = ()):
+        self.sent: List[OutgoingEmail] = []
+        self.failures = failures
+        # addresses that always fail
+        self.rejected = set(rejected)
+
+    async def send(self, emails: List[OutgoingEmail]) -> List[Optional[Exception]]:
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('smtp is down')
+
+        errors = []
+        for email in emails:
+            if email.to in self.rejected:
+                errors.append(ValueError(f'{email.to} is rejected'))
+            else:
+                self.sent.append(email)
+                errors.append(None)
+        return errors
+
+
+@pytest.fixture(scope='function')
+def email_sender() -> TEmailSender:
+    return TEmailSender()
+
+
+MONGO_URI_ENV = 'AUTH_TEST_MONGO_URI'
+
+
+@pytest_asyncio.fixture(scope='function')
+async def mongo_db():
+    """
+    Real mongod when AUTH_TEST_MONGO_URI is set, mongomock otherwise
+    """
+    uri = os.environ.get(MONGO_URI_ENV)
+    if uri:
+        settings = MongoSettings(uri=uri, database=f'auth_test_{ObjectId()}')
+        db = get_database(settings)
+        await ensure_indexes(db)
+        yield db
+        await db.client.drop_database(settings.database)
+        close_clients()
+    else:
+        mongomock_motor = pytest.importorskip('mongomock_motor')
+        db = mongomock_motor.AsyncMongoMockClient(uuidRepresentation='standard')['auth_test']
+        await ensure_indexes(db)
+        yield db
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from app.db.repositories.cached_user import CachingUserAuthRepo
+from app.domain.models.user import UserAuth, HashedPassword
+from tests.unit.conftest import TUserRepo
+
+
+@pytest.mark.asyncio
+async def test_caching_user_repo(user_repo: TUserRepo):
+    cached_user_repo = CachingUserAuthRepo(user_repo)
+    email = 'test@domain.com'
+
+    assert not await cached_user_repo.does_user_exists(email)
+    assert not await cached_user_repo.does_user_exists(email)
+    assert cached_user_repo.stats()['exists'] == {'hits': 1, 'misses': 1, 'size': 1}
+
+    user = await cached_user_repo.insert(
+        UserAuth.create(email=email, hashed_password=HashedPassword.from_hash(b'$2b$04$' + b'a' * 53))
+    )
+    assert await cached_user_repo.does_user_exists(email)
+
+    found_user = await cached_user_repo.find_by_id(str(user.id))
+    found_user.verify_email()
+    assert not (await cached_user_repo.find_by_email(email)).is_email_verified
+    assert cached_user_repo.stats()['by_email']['hits'] == 1
+
+    await cached_user_repo.update(found_user)
+    assert (await cached_user_repo.find_by_id(str(user.id))).is_email_verified
+    assert (await cached_user_repo.find_by_email(email)).is_email_verified
+    assert cached_user_repo.stats()['by_id'] == {'hits': 0, 'misses': 2, 'size': 1}
+
+
+@pytest.mark.asyncio
+async def test_read_during_update_is_not_cached(user_repo: TUserRepo, monkeypatch):
+    cached_user_repo = CachingUserAuthRepo(user_repo)
+    user = await cached_user_repo.insert(
+        UserAuth.create(email='test@domain.com', hashed_password=HashedPassword.from_hash(b'$2b$04$' + b'a' * 53))
+    )
+
+    write_started, write_can_finish = asyncio.Event(), asyncio.Event()
+    update = user_repo.update
+
+    async def slow_update(updated_user: UserAuth):
+        write_started.set()
+        await write_can_finish.wait()
+        await update(updated_user)
+
+    monkeypatch.setattr(user_repo, 'update', slow_update)
+
+    # the test repo keeps the inserted object
+    user = user.clone()
+    user.verify_email()
+    update_task = asyncio.create_task(cached_user_repo.update(user))
+    await write_started.wait()
+    assert not (await cached_user_repo.find_by_id(str(user.id))).is_email_verified
+    assert not (await cached_user_repo.find_by_email(user.email)).is_email_verified
+
+    write_can_finish.set()
+    await update_task
+    assert (await cached_user_repo.find_by_id(str(user.id))).is_email_verified
+    assert (await cached_user_repo.find_by_email(user.email)).is_email_verified
@@ -0,0 +1,15 @@
+import time
+
+import pytest
+
+
+@pytest.fixture(scope='function')
+def west_of_utc(monkeypatch):
+    """
+    Local time 5 hours behind utc, where ttl dates stored in local time expire too early
+    """
+    monkeypatch.setenv('TZ', 'EST5')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
@@ -0,0 +1,131 @@
+import asyncio
+import os
+
+import pytest
+from bson import ObjectId
+
+from app.db.memory.store import EmbeddedStore, LOG_FILE, LOCK_FILE, StoreIsLocked
+from app.domain.models.session import Session, SessionStatus
+from app.domain.models.tokens import RefreshToken
+from app.domain.models.user import UserAuth, HashedPassword
+from app.domain.models.verification_code import VerificationCode
+
+
+def create_user(email: str) -> UserAuth:
+    return UserAuth.create(email=email, hashed_password=HashedPassword.from_hash(b'$2b$04$' + b'a' * 53))
+
+
+async def fill(store: EmbeddedStore, users: int):
+    sessions = []
+    for i in range(users):
+        user = await store.user_repo.insert(create_user(f'user{i}@domain.com'))
+        await store.ver_code_repo.upsert_for_resend(VerificationCode.create(user))
+        sessions.append(await store.session_repo.insert(Session.create(user, RefreshToken.create(user))))
+    return sessions
+
+
+async def reopen(store: EmbeddedStore, directory) -> EmbeddedStore:
+    await store.close()
+    store = EmbeddedStore(str(directory))
+    await store.open()
+    return store
+
+
+@pytest.mark.asyncio
+async def test_recovery_from_log_and_snapshot(tmp_path):
+    store = EmbeddedStore(str(tmp_path))
+    await store.open()
+    sessions = await fill(store, 3)
+    user = await store.user_repo.find_by_email('user0@domain.com')
+    user.verify_email()
+    await store.user_repo.update(user)
+
+    await store.checkpoint()
+    await store.session_repo.rotate_session(sessions[0].refresh_token_digest, RefreshToken.create(user))
+    await store.session_repo.invalidate_session_families([sessions[1].family_id])
+    await store.session_repo.delete_sessions([sessions[2].id])
+    await store.ver_code_repo.register_attempt(str(user.id))
+
+    store = await reopen(store, tmp_path)
+    stats = store.recovery_stats
+    assert stats.snapshot_records == 9
+    assert stats.log_records == 5
+
+    assert (await store.user_repo.find_by_email('user0@domain.com')).is_email_verified
+    assert (await store.ver_code_repo.find_by_user_id(str(user.id))).attempts == 1
+    assert await store.session_repo.find_family_statuses([session.family_id for session in sessions]) == {
+        sessions[0].family_id: SessionStatus.ACTIVE,
+        sessions[1].family_id: SessionStatus.COMPROMISED,
+    }
+    assert len(store.session_repo) == 3
+
+    # older generations are removed by the checkpoint, the log of every start is kept until the next one
+    await store.checkpoint()
+    assert sorted(os.listdir(tmp_path)) == [LOCK_FILE, 'snapshot-0000000000000004.snap', 'wal-0000000000000004.log']
+    store = await reopen(store, tmp_path)
+    assert (store.recovery_stats.snapshot_records, store.recovery_stats.log_records) == (9, 0)
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_torn_log_tail(tmp_path):
+    store = EmbeddedStore(str(tmp_path))
+    await store.open()
+    await fill(store, 2)
+    await store.close()
+
+    path = tmp_path / LOG_FILE.format(1)
+    with open(path, 'ab') as file:
+        file.write(b'\x10\x00\x00\x00garbage')
+
+    store = EmbeddedStore(str(tmp_path))
+    await store.open()
+    assert store.recovery_stats.truncated_bytes == 11
+    assert len(store.user_repo) == 2 and len(store.session_repo) == 2
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_group_commit(tmp_path):
+    store = EmbeddedStore(str(tmp_path), sync_interval=0.01)
+    await store.open()
+    user = create_user('test@domain.com')
+    user.id = ObjectId()
+
+    await asyncio.gather(*(
+        store.session_repo.insert(Session.create(user, RefreshToken.create(user))) for _ in range(100)
+    ))
+
+    assert store.wal.metrics.records == 100
+    assert store.wal.metrics.sync_latency.count < 10
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_directory_lock(tmp_path):
+    store = EmbeddedStore(str(tmp_path))
+    await store.open()
+
+    with pytest.raises(StoreIsLocked):
+        await EmbeddedStore(str(tmp_path)).open()
+
+    await store.close()
+    store = EmbeddedStore(str(tmp_path))
+    await store.open()
+    await store.close()
+
+
+@pytest.mark.asyncio
+async def test_restarts_compact_the_logs(tmp_path):
+    store = EmbeddedStore(str(tmp_path))
+    await store.open()
+    await fill(store, 2)
+
+    for _ in range(3):
+        store = await reopen(store, tmp_path)
+        # only the log of the previous start is replayed
+        assert store.recovery_stats.log_files == 1
+        assert len(store.user_repo) == 2
+
+    assert sorted(os.listdir(tmp_path)) == [LOCK_FILE, 'snapshot-0000000000000004.snap', 'wal-0000000000000004.log']
+    await store.close()
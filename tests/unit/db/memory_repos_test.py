@@ -0,0 +1,145 @@
+from datetime import timedelta, datetime
+
+import pytest
+from bson import ObjectId
+
+from app.db.memory.session import InMemorySessionRepo
+from app.db.memory.user import InMemoryUserAuthRepo
+from app.db.memory.verification_code import InMemoryVerificationCodeRepo
+from app.domain.models.session import Session, SessionStatus, ReusingOfRefreshToken, SessionIsNotActive
+from app.domain.models.tokens import RefreshToken
+from app.domain.models.user import UserAuth, HashedPassword
+from app.domain.models.verification_code import VerificationCode, VerCodeCooldownIsNotOver, \
+    VERIFICATION_CODE_RESEND_COOLDOWN_SECONDS
+from app.domain.repos.user import UserEmailIsTaken
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def create_user(email: str = 'test@domain.com') -> UserAuth:
+    user = UserAuth.create(email=email, hashed_password=HashedPassword.from_hash(b'$2b$04$' + b'a' * 53))
+    user.id = ObjectId()
+    return user
+
+
+@pytest.mark.asyncio
+async def test_user_repo_email_is_unique():
+    user_repo = InMemoryUserAuthRepo()
+    await user_repo.insert(create_user())
+
+    with pytest.raises(UserEmailIsTaken):
+        await user_repo.insert(create_user())
+    assert len(user_repo) == 1
+
+
+@pytest.mark.asyncio
+async def test_verification_code_repo():
+    user = create_user()
+    ver_code = VerificationCode.create(user)
+    clock = Clock(ver_code.issue_date.timestamp())
+    ver_code_repo = InMemoryVerificationCodeRepo(clock=clock)
+
+    assert await ver_code_repo.upsert_for_resend(ver_code) is False
+    assert (await ver_code_repo.register_attempt(str(user.id))).attempts == 1
+    # returned codes are copies
+    (await ver_code_repo.find_by_user_id(str(user.id))).attempts = 10
+    assert (await ver_code_repo.find_by_user_id(str(user.id))).attempts == 1
+
+    with pytest.raises(VerCodeCooldownIsNotOver):
+        await ver_code_repo.upsert_for_resend(VerificationCode.create(user))
+
+    resent_ver_code = VerificationCode.create(user)
+    resent_ver_code.issue_date += timedelta(seconds=VERIFICATION_CODE_RESEND_COOLDOWN_SECONDS)
+    resent_ver_code.exp_date += timedelta(seconds=VERIFICATION_CODE_RESEND_COOLDOWN_SECONDS)
+    assert await ver_code_repo.upsert_for_resend(resent_ver_code) is True
+    assert (await ver_code_repo.find_by_user_id(str(user.id))).attempts == 0
+
+    clock.now = ver_code.exp_date.timestamp() + 1
+    assert await ver_code_repo.find_by_user_id(str(user.id)) is not None
+
+    clock.now = resent_ver_code.exp_date.timestamp() + 1
+    assert await ver_code_repo.find_by_user_id(str(user.id)) is None
+    assert len(ver_code_repo) == 0
+
+
+@pytest.mark.asyncio
+async def test_session_repo():
+    session_repo = InMemorySessionRepo()
+    user = create_user()
+
+    session = await session_repo.insert(Session.create(user, RefreshToken.create(user)))
+    assert session.id is not None
+
+    stored_session = await session_repo.find_session_by_id(str(session.id), str(user.id))
+    assert stored_session == session
+    assert await session_repo.find_session_by_id(str(session.id), str(ObjectId())) is None
+
+    # reads are independent of the store
+    stored_session.logout()
+    digest = session.refresh_token_digest
+    assert (await session_repo.find_session_by_token_digest(digest)).status is SessionStatus.ACTIVE
+    await session_repo.update(stored_session)
+    assert (await session_repo.find_session_by_token_digest(digest)).status is SessionStatus.LOGOUT
+
+
+@pytest.mark.asyncio
+async def test_session_repo_rotate_and_invalidate():
+    session_repo = InMemorySessionRepo()
+    users = [create_user(f'user{i}@domain.com') for i in range(2)]
+    session = await session_repo.insert(Session.create(users[0], RefreshToken.create(users[0])))
+    other = await session_repo.insert(Session.create(users[1], RefreshToken.create(users[1])))
+
+    new_session = await session_repo.rotate_session(session.refresh_token_digest, RefreshToken.create(users[0]))
+    assert new_session.family_id == session.family_id
+    assert await session_repo.find_family_statuses([session.family_id, other.family_id]) == \
+           {session.family_id: SessionStatus.ACTIVE, other.family_id: SessionStatus.ACTIVE}
+
+    with pytest.raises(ReusingOfRefreshToken):
+        await session_repo.rotate_session(session.refresh_token_digest, RefreshToken.create(users[0]))
+    with pytest.raises(SessionIsNotActive):
+        await session_repo.rotate_session(new_session.refresh_token_digest, RefreshToken.create(users[0]))
+    with pytest.raises(SessionIsNotActive):
+        await session_repo.rotate_session(b'unknown', RefreshToken.create(users[0]))
+
+    assert await session_repo.find_family_statuses([session.family_id]) == \
+           {session.family_id: SessionStatus.COMPROMISED}
+    assert await session_repo.invalidate_users_sessions([str(user.id) for user in users]) == 1
+    assert await session_repo.invalidate_session_families([other.family_id]) == 1
+    assert await session_repo.invalidate_session_families([other.family_id]) == 0
+
+
+@pytest.mark.asyncio
+async def test_session_repo_expiry_and_sweep():
+    user = create_user()
+    now = datetime.now()
+    clock = Clock(now.timestamp())
+    session_repo = InMemorySessionRepo(clock=clock)
+
+    sessions = []
+    for expiration_time in (now + timedelta(minutes=1), now + timedelta(minutes=2), now + timedelta(days=1)):
+        session = Session.create(user, RefreshToken.create(user))
+        session.expiration_time = expiration_time
+        if sessions:
+            session.family_id = sessions[0].family_id
+            session.status = SessionStatus.REFRESHED
+        sessions.append(await session_repo.insert(session))
+
+    batches = [batch async for batch in session_repo.iter_sweep_candidates(now, batch_size=1)]
+    assert [[candidate.id for candidate in batch] for batch in batches] == [[sessions[2].id], [sessions[1].id]]
+
+    clock.now = (now + timedelta(minutes=1, seconds=2)).timestamp()
+    assert await session_repo.find_session_by_token_digest(sessions[0].refresh_token_digest) is None
+    assert len(session_repo) == 2
+
+    assert await session_repo.delete_sessions([sessions[1].id, sessions[0].id]) == 1
+    assert [record.id for record in session_repo.records()] == [sessions[2].id]
+    batches = [batch async for batch in session_repo.iter_sweep_candidates(datetime.now(), batch_size=10)]
+    assert [[candidate.id for candidate in batch] for batch in batches] == [[sessions[2].id]]
+    assert await session_repo.find_family_statuses([sessions[0].family_id]) == \
+           {sessions[0].family_id: SessionStatus.REFRESHED}
@@ -0,0 +1,312 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId, Binary
+
+from app.db.migrations.refresh_token_digest import migrate_refresh_tokens_to_digest
+from app.db.odm.indexes import SESSIONS_COLLECTION, SESSIONS_ARCHIVE_COLLECTION, RATE_LIMITS_COLLECTION, \
+    VERIFICATION_CODES_COLLECTION
+from app.common_lib.rate_limit import TokenBucketRule
+from app.db.repositories.rate_limit import MongoRateLimiter
+from app.db.repositories.session import MongoSessionRepo
+from app.db.repositories.user import MongoUserAuthRepo
+from app.db.repositories.verification_code import MongoVerificationCodeRepo
+from app.domain.models.session import Session, SessionStatus, get_refresh_token_digest, ReusingOfRefreshToken, \
+    SessionIsNotActive
+from app.domain.models.tokens import RefreshToken
+from app.domain.models.user import UserAuth, HashedPassword
+from app.domain.repos.user import UserEmailIsTaken
+from app.domain.models.verification_code import VerificationCode, VerCodeCooldownIsNotOver, \
+    VERIFICATION_CODE_RESEND_COOLDOWN_SECONDS
+
+
+def create_user(email: str = 'test@domain.com') -> UserAuth:
+    return UserAuth.create(email=email, hashed_password=HashedPassword.from_hash(b'$2b$04$' + b'a' * 53))
+
+
+def assert_utc_ttl_date(stored: datetime, local: datetime):
+    # mongo keeps datetimes with millisecond precision
+    expected = datetime.utcfromtimestamp(local.timestamp())
+    assert abs(stored - expected) < timedelta(milliseconds=1)
+
+
+@pytest.mark.asyncio
+async def test_user_repo(mongo_db):
+    user_repo = MongoUserAuthRepo(mongo_db)
+
+    assert not await user_repo.does_user_exists('test@domain.com')
+
+    user = await user_repo.insert(create_user())
+    assert await user_repo.does_user_exists('test@domain.com')
+    assert await user_repo.find_by_id(str(user.id)) == user
+    assert await user_repo.find_by_email('test@domain.com') == user
+
+    user.verify_email()
+    await user_repo.update(user)
+    assert (await user_repo.find_by_id(str(user.id))).is_email_verified
+
+    with pytest.raises(UserEmailIsTaken):
+        await user_repo.insert(create_user())
+
+
+@pytest.mark.asyncio
+async def test_session_repo(mongo_db):
+    session_repo = MongoSessionRepo(mongo_db)
+    user = create_user()
+    user.id = ObjectId()
+
+    session = await session_repo.insert(Session.create(user, RefreshToken.create(user)))
+
+    # mongo keeps datetimes with millisecond precision
+    session_fields = session.dict(exclude={'expiration_time'})
+    assert (await session_repo.find_session_by_token_digest(session.refresh_token_digest)).dict(exclude={'expiration_time'}) \
+           == session_fields
+    assert (await session_repo.find_session_by_id(str(session.id), str(user.id))).dict(exclude={'expiration_time'}) \
+           == session_fields
+    assert await session_repo.find_session_by_id(str(session.id), str(ObjectId())) is None
+
+    session.refresh()
+    await session_repo.update(session)
+    new_session = await session_repo.insert(Session.create_from_refreshed(session, RefreshToken.create(user)))
+
+    await session_repo.invalidate_session_family(session)
+
+    for _id in (session.id, new_session.id):
+        stored_session = await session_repo.find_session_by_id(str(_id), str(user.id))
+        assert stored_session.status is SessionStatus.COMPROMISED
+        assert stored_session.family_id == session.family_id
+
+
+@pytest.mark.asyncio
+async def test_session_repo_ttl_date(mongo_db, west_of_utc):
+    session_repo = MongoSessionRepo(mongo_db)
+    user = create_user()
+    user.id = ObjectId()
+
+    session = await session_repo.insert(Session.create(user, RefreshToken.create(user)))
+
+    document = await mongo_db[SESSIONS_COLLECTION].find_one({'_id': session.id})
+    assert_utc_ttl_date(document['expires_at'], session.expiration_time)
+    assert 'expiration_time_ttl' not in await mongo_db[SESSIONS_COLLECTION].index_information()
+
+
+@pytest.mark.asyncio
+async def test_session_repo_rotate_session(mongo_db):
+    session_repo = MongoSessionRepo(mongo_db)
+    user = create_user()
+    user.id = ObjectId()
+
+    session = await session_repo.insert(Session.create(user, RefreshToken.create(user)))
+
+    new_session = await session_repo.rotate_session(session.refresh_token_digest, RefreshToken.create(user))
+    assert new_session.family_id == session.family_id
+    assert new_session.status is SessionStatus.ACTIVE
+    assert (await session_repo.find_session_by_id(str(session.id), str(user.id))).status is SessionStatus.REFRESHED
+
+    with pytest.raises(ReusingOfRefreshToken):
+        await session_repo.rotate_session(session.refresh_token_digest, RefreshToken.create(user))
+
+    new_session = await session_repo.find_session_by_id(str(new_session.id), str(user.id))
+    assert new_session.status is SessionStatus.COMPROMISED
+
+    with pytest.raises(SessionIsNotActive):
+        await session_repo.rotate_session(new_session.refresh_token_digest, RefreshToken.create(user))
+
+    with pytest.raises(SessionIsNotActive):
+        await session_repo.rotate_session(b'unknown', RefreshToken.create(user))
+
+
+@pytest.mark.asyncio
+async def test_session_repo_rotate_session_reverts_failed_insert(mongo_db, monkeypatch):
+    session_repo = MongoSessionRepo(mongo_db)
+    user = create_user()
+    user.id = ObjectId()
+    session = await session_repo.insert(Session.create(user, RefreshToken.create(user)))
+
+    async def failing_insert_one(*args, **kwargs):
+        raise ConnectionError()
+
+    with monkeypatch.context() as patch:
+        patch.setattr(session_repo._collection, 'insert_one', failing_insert_one)
+        with pytest.raises(ConnectionError):
+            await session_repo.rotate_session(session.refresh_token_digest, RefreshToken.create(user))
+
+    assert (await session_repo.find_session_by_id(str(session.id), str(user.id))).status is SessionStatus.ACTIVE
+    # the retry of the client is a normal rotation, not a reuse
+    new_session = await session_repo.rotate_session(session.refresh_token_digest, RefreshToken.create(user))
+    assert new_session.family_id == session.family_id
+
+
+@pytest.mark.asyncio
+async def test_session_repo_bulk_invalidation(mongo_db):
+    session_repo = MongoSessionRepo(mongo_db)
+    users = [create_user(f'user{i}@domain.com') for i in range(3)]
+    sessions = []
+    for user in users:
+        user.id = ObjectId()
+        sessions += [await session_repo.insert(Session.create(user, RefreshToken.create(user))) for _ in range(2)]
+
+    assert await session_repo.invalidate_users_sessions([str(users[0].id), str(users[1].id)]) == 4
+    assert await session_repo.invalidate_users_sessions([str(users[0].id)]) == 0
+    assert await session_repo.invalidate_session_families([sessions[4].family_id]) == 1
+
+    statuses = [
+        (await session_repo.find_session_by_id(str(session.id), str(session.user_id))).status for session in sessions
+    ]
+    assert statuses == [SessionStatus.LOGOUT] * 4 + [SessionStatus.COMPROMISED, SessionStatus.ACTIVE]
+
+
+@pytest.mark.asyncio
+async def test_session_repo_find_family_statuses(mongo_db):
+    session_repo = MongoSessionRepo(mongo_db)
+    user = create_user()
+    user.id = ObjectId()
+    rotated = await session_repo.insert(Session.create(user, RefreshToken.create(user)))
+    await session_repo.rotate_session(rotated.refresh_token_digest, RefreshToken.create(user))
+    logged_out = await session_repo.insert(Session.create(user, RefreshToken.create(user)))
+    await session_repo.invalidate_session_families([logged_out.family_id], status=SessionStatus.LOGOUT)
+    expired = Session.create(user, RefreshToken.create(user))
+    expired.expiration_time = datetime.now() - timedelta(seconds=1)
+    await session_repo.insert(expired)
+
+    statuses = await session_repo.find_family_statuses(
+        [rotated.family_id, logged_out.family_id, expired.family_id, uuid.uuid4()]
+    )
+
+    assert statuses == {rotated.family_id: SessionStatus.ACTIVE, logged_out.family_id: SessionStatus.LOGOUT}
+
+
+@pytest.mark.asyncio
+async def test_session_repo_sweep_candidates(mongo_db):
+    session_repo = MongoSessionRepo(mongo_db)
+    user = create_user()
+    user.id = ObjectId()
+
+    session = await session_repo.insert(Session.create(user, RefreshToken.create(user)))
+    rotated = [session]
+    for _ in range(3):
+        rotated.append(await session_repo.rotate_session(rotated[-1].refresh_token_digest, RefreshToken.create(user)))
+    other = await session_repo.insert(Session.create(user, RefreshToken.create(user)))
+    await session_repo.invalidate_session_families([other.family_id], status=SessionStatus.LOGOUT)
+
+    batches = [batch async for batch in session_repo.iter_sweep_candidates(datetime.now(), batch_size=2)]
+    assert [len(batch) for batch in batches] == [2, 2]
+
+    candidates = [candidate for batch in batches for candidate in batch]
+    families = [candidate.family_id for candidate in candidates]
+    assert families == sorted(families)
+    rotated_ids = [candidate.id for candidate in candidates if candidate.family_id == session.family_id]
+    assert rotated_ids == [s.id for s in reversed(rotated[:3])]
+
+    ids = [candidate.id for candidate in candidates]
+    assert await session_repo.delete_sessions(ids, archive=True) == 4
+    assert await session_repo.delete_sessions(ids, archive=True) == 0
+    assert await mongo_db[SESSIONS_COLLECTION].count_documents({}) == 1
+    assert await mongo_db[SESSIONS_ARCHIVE_COLLECTION].count_documents({}) == 4
+
+
+@pytest.mark.asyncio
+async def test_verification_code_repo(mongo_db):
+    ver_code_repo = MongoVerificationCodeRepo(mongo_db)
+    user = create_user()
+    user.id = ObjectId()
+
+    assert await ver_code_repo.find_by_user_id(str(user.id)) is None
+
+    ver_code = VerificationCode.create(user)
+    await ver_code_repo.insert(ver_code)
+    assert (await ver_code_repo.find_by_user_id(str(user.id))).code == ver_code.code
+
+    ver_code.code = VerificationCode.create(user).code
+    await ver_code_repo.update(ver_code)
+    assert (await ver_code_repo.find_by_user_id(str(user.id))).code == ver_code.code
+
+    assert (await ver_code_repo.register_attempt(str(user.id))).attempts == 1
+    assert (await ver_code_repo.register_attempt(str(user.id))).attempts == 2
+    assert await ver_code_repo.register_attempt(str(ObjectId())) is None
+
+
+@pytest.mark.asyncio
+async def test_verification_code_repo_ttl_date(mongo_db, west_of_utc):
+    ver_code_repo = MongoVerificationCodeRepo(mongo_db)
+    user = create_user()
+    user.id = ObjectId()
+
+    ver_code = VerificationCode.create(user)
+    await ver_code_repo.upsert_for_resend(ver_code)
+
+    document = await mongo_db[VERIFICATION_CODES_COLLECTION].find_one({'_id': user.id})
+    assert_utc_ttl_date(document['expires_at'], ver_code.exp_date)
+    assert 'exp_date_ttl' not in await mongo_db[VERIFICATION_CODES_COLLECTION].index_information()
+
+
+@pytest.mark.asyncio
+async def test_verification_code_repo_upsert_for_resend(mongo_db):
+    ver_code_repo = MongoVerificationCodeRepo(mongo_db)
+    user = create_user()
+    user.id = ObjectId()
+
+    ver_code = VerificationCode.create(user)
+    assert await ver_code_repo.upsert_for_resend(ver_code) is False
+    await ver_code_repo.register_attempt(str(user.id))
+
+    with pytest.raises(VerCodeCooldownIsNotOver):
+        await ver_code_repo.upsert_for_resend(VerificationCode.create(user))
+    assert (await ver_code_repo.find_by_user_id(str(user.id))).code == ver_code.code
+
+    resent_ver_code = VerificationCode.create(user)
+    resent_ver_code.issue_date += timedelta(seconds=VERIFICATION_CODE_RESEND_COOLDOWN_SECONDS)
+    assert await ver_code_repo.upsert_for_resend(resent_ver_code) is True
+
+    stored_ver_code = await ver_code_repo.find_by_user_id(str(user.id))
+    assert (stored_ver_code.code, stored_ver_code.attempts) == (resent_ver_code.code, 0)
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_digest_migration(mongo_db):
+    session_repo = MongoSessionRepo(mongo_db)
+    user = create_user()
+    user.id = ObjectId()
+
+    refresh_tokens = [RefreshToken.create(user) for _ in range(3)]
+    for refresh_token in refresh_tokens:
+        session = Session.create(user, refresh_token)
+        document = session.dict(exclude={'id', 'refresh_token_digest'})
+        document.update(
+            status=session.status.value,
+            family_id=Binary.from_uuid(session.family_id),
+            refresh_token=refresh_token.get_token()
+        )
+        await mongo_db[SESSIONS_COLLECTION].insert_one(document)
+
+    assert await migrate_refresh_tokens_to_digest(mongo_db, batch_size=2) == 3
+
+    for refresh_token in refresh_tokens:
+        session = await session_repo.find_session_by_token_digest(get_refresh_token_digest(refresh_token.get_token()))
+        assert session.user_id == user.id
+
+    assert await mongo_db[SESSIONS_COLLECTION].count_documents({'refresh_token': {'$exists': True}}) == 0
+
+
+@pytest.mark.asyncio
+async def test_mongo_rate_limiter(mongo_db):
+    rule = TokenBucketRule(capacity=2, refill_per_second=1 / 3600)
+    limiter = MongoRateLimiter(mongo_db, rule, prefix='login')
+    other_worker_limiter = MongoRateLimiter(mongo_db, rule, prefix='login')
+
+    assert await limiter.acquire('key') == 0.0
+    assert await other_worker_limiter.acquire('key') == 0.0
+    # fixed windows of seconds_to_full
+    assert 0 < await limiter.acquire('key') <= rule.seconds_to_full
+    assert await limiter.acquire('other') == 0.0
+
+
+@pytest.mark.asyncio
+async def test_mongo_rate_limiter_ttl_date(mongo_db, west_of_utc):
+    rule = TokenBucketRule(capacity=2, refill_per_second=1 / 60)
+    await MongoRateLimiter(mongo_db, rule, prefix='login').acquire('key')
+
+    document = await mongo_db[RATE_LIMITS_COLLECTION].find_one()
+    window_end = (int(document['_id'].rsplit(':', 1)[1]) + 1) * rule.seconds_to_full
+    assert_utc_ttl_date(document['expires_at'], datetime.fromtimestamp(window_end))
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.domain.models.tokens import AccessToken, RefreshToken, RefreshTokenWithoutExpireValidation, \
+    TokenVerificationFailed, WrongTokenFormat, verified_tokens_cache, TokenMinter
+from app.domain.models.user import UserAuth
+
+user = UserAuth(id=ObjectId(), email='test@domain.com', hashed_password=b'')
+
+
+@pytest.fixture(autouse=True)
+def clear_verified_tokens_cache():
+    verified_tokens_cache.clear()
+
+
+@pytest.mark.parametrize('token_cls', [AccessToken, RefreshToken])
+def test_fast_decode_matches_generic_decode(token_cls):
+    token = token_cls.create(user)
+
+    hits = verified_tokens_cache.hits
+    fast = token_cls.decode_and_validate(token.get_token())
+    generic = token_cls._decode_and_validate(token.get_token())
+
+    assert fast == generic
+    assert fast.get_token() == token.get_token()
+    assert token_cls.decode_and_validate(token.get_token()) is fast
+    assert verified_tokens_cache.hits == hits + 1
+
+
+def test_fast_decode_rejects_invalid_tokens():
+    access_token = AccessToken.create(user)
+    header, payload, signature = access_token.get_token().split('.')
+    _, other_payload, _ = AccessToken.create(user).get_token().split('.')
+
+    with pytest.raises(TokenVerificationFailed):
+        AccessToken.decode_and_validate(f'{header}.{other_payload}.{signature}')
+
+    with pytest.raises(TokenVerificationFailed):
+        AccessToken.decode_and_validate('not-a-token')
+
+    with pytest.raises(TokenVerificationFailed):
+        AccessToken.decode_and_validate(f'{header}.{payload[:-1]}é.{signature}')
+
+    with pytest.raises(WrongTokenFormat):
+        RefreshToken.decode_and_validate(access_token.get_token())
+
+
+def test_fast_decode_expiration():
+    expired_token = RefreshToken(sub=str(user.id), exp=datetime.now() - timedelta(days=1))
+
+    with pytest.raises(TokenVerificationFailed):
+        RefreshToken.decode_and_validate(expired_token.get_token())
+
+    token = RefreshTokenWithoutExpireValidation.decode_and_validate(expired_token.get_token())
+    assert token.jti == expired_token.jti
+    assert len(verified_tokens_cache) == 0
+
+
+def test_token_minter():
+    minter = TokenMinter()
+    access_token, refresh_token = minter.issue_pair(user.id)
+
+    assert AccessToken._decode_and_validate(access_token.get_token()).jti == access_token.jti
+    assert RefreshToken._decode_and_validate(refresh_token.get_token()).jti == refresh_token.jti
+    assert access_token.sub == refresh_token.sub == str(user.id)
+
+    pairs = minter.issue_pairs([ObjectId() for _ in range(3)])
+    assert len({access_token.get_token() for access_token, _ in pairs}) == 3
+    for access_token, refresh_token in pairs:
+        assert AccessToken.decode_and_validate(access_token.get_token()).sub == access_token.sub
+        assert RefreshToken.decode_and_validate(refresh_token.get_token()).sub == refresh_token.sub
@@ -0,0 +1,67 @@
+import pytest
+from bson import ObjectId
+
+from app.domain.models.session import Session, SessionStatus
+from app.domain.models.tokens import token_minter, revocation_list, AccessToken
+from app.domain.models.user import UserAuth, HashedPassword
+from app.domain.services.introspection import TokenIntrospectionService, IntrospectionBatchIsTooLarge
+from tests.unit.conftest import TSessionRepo
+
+
+class CountingSessionRepo(TSessionRepo):
+    def __init__(self):
+        super().__init__()
+        self.queries = 0
+
+    async def find_family_statuses(self, family_ids):
+        self.queries += 1
+        return await super().find_family_statuses(family_ids)
+
+
+@pytest.fixture(autouse=True)
+def clear_revocation_list():
+    yield
+    revocation_list.clear()
+
+
+async def login(session_repo: TSessionRepo, status: SessionStatus = SessionStatus.ACTIVE) -> AccessToken:
+    user = UserAuth.create(email='test@domain.com', hashed_password=HashedPassword.from_hash(b'$2b$04$' + b'a' * 53))
+    user.id = ObjectId()
+    access_token, refresh_token = token_minter.issue_pair(user.id)
+    session = Session.create(user, refresh_token)
+    session.status = status
+    await session_repo.insert(session)
+    return access_token
+
+
+@pytest.mark.asyncio
+async def test_introspect():
+    session_repo = CountingSessionRepo()
+    service = TokenIntrospectionService(session_repo, max_batch_size=10)
+
+    active = await login(session_repo)
+    logged_out = await login(session_repo, SessionStatus.LOGOUT)
+    revoked = await login(session_repo)
+    revocation_list.revoke_families([revoked.family_id])
+    without_session, _ = token_minter.issue_pair(ObjectId())
+
+    results = await service.introspect([
+        token.get_token() for token in (active, logged_out, revoked, without_session, active)
+    ] + ['garbage'])
+
+    assert [(result.active, result.error) for result in results] == [
+        (True, None),
+        (False, 'SessionIsNotActive'),
+        (False, 'TokenIsRevoked'),
+        (False, 'SessionIsNotActive'),
+        (True, None),
+        (False, 'TokenVerificationFailed'),
+    ]
+    assert (results[0].sub, results[0].family_id) == (active.sub, active.family_id)
+    assert session_repo.queries == 1
+
+    assert await service.introspect(['garbage']) == results[-1:]
+    assert session_repo.queries == 1
+
+    with pytest.raises(IntrospectionBatchIsTooLarge):
+        await service.introspect([active.get_token()] * 11)
@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import time
 from typing import Tuple
@@ -6,22 +7,35 @@ import pytest
 import pytest_asyncio
 from testfixtures import Replace, test_datetime
 
-from app.domain.models.session import ReusingOfRefreshToken, SessionStatus, SessionIsNotActive
+from app.domain.models.session import ReusingOfRefreshToken, SessionStatus, SessionIsNotActive, \
+    get_refresh_token_digest
 from app.domain.models.tokens import AccessToken, RefreshToken, RefreshTokenWithoutExpireValidation, \
-    REFRESH_TOKEN_EXPIRE_MINUTES
-from app.domain.models.user import UserAuth, hash_password, EmailIsNotVerified, WrongPassword
+    REFRESH_TOKEN_EXPIRE_MINUTES, TokenIsRevoked, revocation_list
+from app.domain.models.user import UserAuth, hash_password, EmailIsNotVerified, WrongPassword, \
+    PasswordHashingPolicy, get_bcrypt_rounds
+from app.common_lib.rate_limit import InMemoryRateLimiter, TokenBucketRule
+from app.db.odm.indexes import SESSIONS_COLLECTION
+from app.db.repositories.session import MongoSessionRepo
+from app.domain.services.login_throttler import LoginThrottler, TooManyLoginAttempts
 from app.domain.services.session import SessionService, LoginDTO, UserWithEmailDoesntExists
-from tests.unit.conftest import TUserRepo, TSessionRepo
+from tests.unit.conftest import TUserRepo, TSessionRepo, AsyncExecutor
 
 
 @pytest.fixture(scope='function')
 def session_service(user_repo: TUserRepo, session_repo: TSessionRepo) -> SessionService:
     return SessionService(
         user_repo=user_repo,
-        session_repo=session_repo
+        session_repo=session_repo,
+        executor=AsyncExecutor()
     )
 
 
+@pytest.fixture(autouse=True)
+def clear_revocation_list():
+    yield
+    revocation_list.clear()
+
+
 login_dto = LoginDTO(
     email='test@domain.com',
     password=b'qwerty123'
@@ -30,7 +44,7 @@ login_dto = LoginDTO(
 
 @pytest_asyncio.fixture(scope='function')
 async def inserted_user(user_repo: TUserRepo) -> UserAuth:
-    user = UserAuth.create(email=login_dto.email, hashed_password=hash_password(login_dto.password))
+    user = UserAuth.create(email=login_dto.email, hashed_password=hash_password.sync(login_dto.password))
     user = await user_repo.insert(user)
 
     return user
@@ -71,10 +85,47 @@ async def test_login(
 
     access_token, refresh_token = await session_service.login(dto=login_dto)
 
-    session = await session_repo.find_session_by_token(token=refresh_token.get_token())
+    session = await session_repo.find_session_by_token_digest(get_refresh_token_digest(refresh_token.get_token()))
     assert session.user_id == inserted_user.id
 
 
+@pytest.mark.asyncio
+async def test_login_rehashes_password(user_repo: TUserRepo, session_repo: TSessionRepo):
+    user = UserAuth.create(email=login_dto.email, hashed_password=hash_password.sync(login_dto.password, 4))
+    user.verify_email()
+    user = await user_repo.insert(user)
+
+    session_service = SessionService(
+        user_repo=user_repo,
+        session_repo=session_repo,
+        executor=AsyncExecutor(),
+        password_policy=PasswordHashingPolicy(rounds=5)
+    )
+    await session_service.login(dto=login_dto)
+
+    user = await user_repo.find_by_id(str(user.id))
+    assert get_bcrypt_rounds(user.hashed_password) == 5
+    user.check_password(login_dto.password)
+
+
+@pytest.mark.asyncio
+async def test_login_keeps_stronger_password_hash(user_repo: TUserRepo, session_repo: TSessionRepo):
+    user = UserAuth.create(email=login_dto.email, hashed_password=hash_password.sync(login_dto.password, 5))
+    user.verify_email()
+    user = await user_repo.insert(user)
+    hashed_password = user.hashed_password
+
+    session_service = SessionService(
+        user_repo=user_repo,
+        session_repo=session_repo,
+        executor=AsyncExecutor(),
+        password_policy=PasswordHashingPolicy(rounds=4)
+    )
+    await session_service.login(dto=login_dto)
+
+    assert (await user_repo.find_by_id(str(user.id))).hashed_password == hashed_password
+
+
 @pytest.mark.asyncio
 async def test_refresh(
         session_repo: TSessionRepo,
@@ -97,9 +148,126 @@ async def test_refresh(
     #     with pytest.raises(SessionIsNotActive):
     #         await session_service.refresh(refresh_token)
 
-    session = await session_repo.find_session_by_token(refresh_token.get_token())
+    session = await session_repo.find_session_by_token_digest(get_refresh_token_digest(refresh_token.get_token()))
     session.status = SessionStatus.LOGOUT
     await session_repo.update(session)
 
     with pytest.raises(SessionIsNotActive):
         await session_service.refresh(refresh_token)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_refresh(
+        session_service: SessionService,
+        access_and_refresh_token: Tuple[AccessToken, RefreshToken]
+):
+    _, refresh_token = access_and_refresh_token
+
+    results = await asyncio.gather(
+        session_service.refresh(refresh_token), session_service.refresh(refresh_token), return_exceptions=True
+    )
+
+    assert len([result for result in results if isinstance(result, ReusingOfRefreshToken)]) == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_refresh_with_mongo_repo(
+        mongo_db,
+        user_repo: TUserRepo,
+        inserted_user: UserAuth,
+        monkeypatch
+):
+    session_repo = MongoSessionRepo(mongo_db)
+    # mongomock never suspends, every call yields to the loop like a round trip to mongod does
+    for name in ('find_one', 'find_one_and_update', 'insert_one', 'update_one', 'update_many'):
+        async def yielding(*args, _method=getattr(session_repo._collection, name), **kwargs):
+            await asyncio.sleep(0)
+            return await _method(*args, **kwargs)
+        monkeypatch.setattr(session_repo._collection, name, yielding)
+
+    session_service = SessionService(user_repo=user_repo, session_repo=session_repo, executor=AsyncExecutor())
+    inserted_user.verify_email()
+    await user_repo.update(inserted_user)
+    _, refresh_token = await session_service.login(login_dto)
+
+    results = await asyncio.gather(
+        session_service.refresh(refresh_token), session_service.refresh(refresh_token), return_exceptions=True
+    )
+
+    assert len([result for result in results if isinstance(result, ReusingOfRefreshToken)]) == 1
+    assert await mongo_db[SESSIONS_COLLECTION].count_documents({'status': SessionStatus.COMPROMISED.value}) == 2
+
+
+@pytest.mark.asyncio
+async def test_logout_everywhere(
+        session_service: SessionService,
+        access_and_refresh_token: Tuple[AccessToken, RefreshToken]
+):
+    access_token, refresh_token = access_and_refresh_token
+    other_access_token, other_refresh_token = await session_service.login(login_dto)
+
+    assert AccessToken.decode_and_validate(access_token.get_token()).jti == access_token.jti
+
+    assert await session_service.logout_everywhere(access_token) == 2
+
+    for token in (access_token, other_access_token):
+        with pytest.raises(TokenIsRevoked):
+            AccessToken.decode_and_validate(token.get_token())
+
+    for token in (refresh_token, other_refresh_token):
+        with pytest.raises(SessionIsNotActive):
+            await session_service.refresh(token)
+
+    new_access_token, _ = await session_service.login(login_dto)
+    AccessToken.decode_and_validate(new_access_token.get_token())
+
+
+@pytest.mark.asyncio
+async def test_reusing_of_refresh_token_revokes_family(
+        session_service: SessionService,
+        access_and_refresh_token: Tuple[AccessToken, RefreshToken]
+):
+    access_token, refresh_token = access_and_refresh_token
+    new_access_token, new_refresh_token = await session_service.refresh(refresh_token)
+    assert new_access_token.family_id == access_token.family_id
+
+    with pytest.raises(ReusingOfRefreshToken):
+        await session_service.refresh(refresh_token)
+
+    with pytest.raises(TokenIsRevoked):
+        AccessToken.decode_and_validate(new_access_token.get_token())
+
+    with pytest.raises(SessionIsNotActive):
+        await session_service.refresh(new_refresh_token)
+
+
+@pytest.mark.asyncio
+async def test_login_throttling(user_repo: TUserRepo, session_repo: TSessionRepo, inserted_user: UserAuth):
+    session_service = SessionService(
+        user_repo=user_repo,
+        session_repo=session_repo,
+        executor=AsyncExecutor(),
+        login_throttler=LoginThrottler(
+            email_limiter=InMemoryRateLimiter(TokenBucketRule(capacity=2, refill_per_second=0.001)),
+            address_limiter=InMemoryRateLimiter(TokenBucketRule(capacity=3, refill_per_second=0.001))
+        )
+    )
+    wrong_password = LoginDTO(email=login_dto.email, password=b'wrong', client_address='10.0.0.1')
+
+    for _ in range(2):
+        with pytest.raises(WrongPassword):
+            await session_service.login(wrong_password)
+
+    # the limit is checked before bcrypt
+    with Replace('app.domain.services.session.check_password', None):
+        with pytest.raises(TooManyLoginAttempts):
+            await session_service.login(LoginDTO(email=login_dto.email.upper(), password=b'wrong'))
+
+        with pytest.raises(UserWithEmailDoesntExists):
+            await session_service.login(
+                LoginDTO(email='other@domain.com', password=b'wrong', client_address='10.0.0.1')
+            )
+        with pytest.raises(TooManyLoginAttempts):
+            await session_service.login(
+                LoginDTO(email='another@domain.com', password=b'wrong', client_address='10.0.0.1')
+            )
@@ -0,0 +1,72 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.domain.models.session import Session, SessionStatus
+from app.domain.models.tokens import RefreshToken
+from app.domain.models.user import UserAuth, HashedPassword
+from app.domain.services.session_sweeper import SessionSweeper
+from tests.unit.conftest import TSessionRepo
+
+
+async def insert_family(session_repo: TSessionRepo, statuses, expired=False):
+    user = UserAuth.create(email='test@domain.com', hashed_password=HashedPassword.from_hash(b'$2b$04$' + b'a' * 53))
+    user.id = ObjectId()
+
+    sessions = []
+    for status in statuses:
+        session = Session.create(user, RefreshToken.create(user))
+        if sessions:
+            session.family_id = sessions[0].family_id
+        session.status = status
+        if expired:
+            session.expiration_time = datetime.now() - timedelta(minutes=1)
+        sessions.append(await session_repo.insert(session))
+
+    return sessions
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('batch_size', [1, 2, 100])
+async def test_sweep(session_repo: TSessionRepo, batch_size: int):
+    # oldest first
+    rotated = await insert_family(
+        session_repo, [SessionStatus.REFRESHED, SessionStatus.REFRESHED, SessionStatus.REFRESHED, SessionStatus.ACTIVE]
+    )
+    logged_out = await insert_family(session_repo, [SessionStatus.REFRESHED, SessionStatus.LOGOUT])
+    compromised = await insert_family(session_repo, [SessionStatus.COMPROMISED, SessionStatus.COMPROMISED])
+    expired = await insert_family(session_repo, [SessionStatus.REFRESHED, SessionStatus.ACTIVE], expired=True)
+
+    sweeper = SessionSweeper(session_repo, batch_size=batch_size, max_deletes_per_second=None)
+    stats = await sweeper.sweep()
+
+    kept = {rotated[2].id, rotated[3].id, logged_out[0].id}
+    assert set(session_repo._id_to_session) == kept
+    assert stats.scanned == 9
+    assert stats.deleted == len(rotated + logged_out + compromised + expired) - len(kept)
+    assert stats.batches == -(-stats.scanned // batch_size)
+
+    assert (await sweeper.sweep()).deleted == 0
+
+
+@pytest.mark.asyncio
+async def test_one_sweeper_holds_the_lock(session_repo: TSessionRepo, tmp_path):
+    lock_path = str(tmp_path / 'sweeper.lock')
+    first, second = (
+        SessionSweeper(session_repo, max_deletes_per_second=None, interval_seconds=0.01, lock_path=lock_path)
+        for _ in range(2)
+    )
+
+    first.start()
+    await asyncio.sleep(0.05)
+    second.start()
+    await asyncio.sleep(0.05)
+    assert first.last_stats is not None and second.last_stats is None
+
+    # the lock is released with the worker, the other one takes over
+    await first.stop()
+    await asyncio.sleep(0.05)
+    assert second.last_stats is not None
+    await second.stop()
@@ -1,22 +1,33 @@
+import asyncio
 import datetime
 
 import pytest
+import pytest_asyncio
 from testfixtures import Replace, test_datetime
 
+from app.common_lib.mail import EmailQueue
 from app.domain.models.user import WrongPassword, EmailIsNotVerified, EmailIsAlreadyVerified
 from app.domain.models.verification_code import VerCodeCooldownIsNotOver, VERIFICATION_CODE_RESEND_COOLDOWN_SECONDS, \
     _generate_six_digit_code, \
-    VerCodeIsNotCorrect, VerCodeIsExpired
+    VerCodeIsNotCorrect, VerCodeIsExpired, VerCodeIsLocked, MAX_VERIFICATION_CODE_ATTEMPTS
 from app.domain.services.user import UserService, RegisterDTO, UserAlreadyExists, VerifyEmailDTO
-from tests.unit.conftest import TUserRepo, TVerCodeRepo, AsyncExecutor
+from tests.unit.conftest import TUserRepo, TVerCodeRepo, AsyncExecutor, TEmailSender
+
+
+@pytest_asyncio.fixture(scope='function')
+async def email_queue(email_sender: TEmailSender) -> EmailQueue:
+    email_queue = EmailQueue(sender=email_sender, batch_linger=0.001)
+    email_queue.start()
+    yield email_queue
+    await email_queue.stop()
 
 
 @pytest.fixture(scope='function')
-def user_service(user_repo: TUserRepo, ver_code_repo: TVerCodeRepo) -> UserService:
+def user_service(user_repo: TUserRepo, ver_code_repo: TVerCodeRepo, email_queue: EmailQueue) -> UserService:
     return UserService(
         user_repo=user_repo,
         ver_code_repo=ver_code_repo,
-        email_service=None,
+        email_queue=email_queue,
         executor=AsyncExecutor()
     )
 
@@ -45,11 +56,23 @@ async def test_register(user_service: UserService, user_repo: TUserRepo):
         await user_service.register(register_dto)
 
 
+@pytest.mark.asyncio
+async def test_concurrent_register(user_service: UserService):
+    # both pass the existence check before either inserts
+    results = await asyncio.gather(
+        user_service.register(register_dto), user_service.register(register_dto), return_exceptions=True
+    )
+
+    assert sum(isinstance(result, UserAlreadyExists) for result in results) == 1
+
+
 @pytest.mark.asyncio
 async def test_send_user_verification_email(
         user_service: UserService,
         ver_code_repo: TVerCodeRepo,
-        user_repo: TUserRepo
+        user_repo: TUserRepo,
+        email_queue: EmailQueue,
+        email_sender: TEmailSender
 ):
     token = await user_service.register(register_dto)
 
@@ -70,6 +93,11 @@ async def test_send_user_verification_email(
     assert ver_code.issue_date != resented_ver_code.issue_date
     assert ver_code.exp_date != resented_ver_code.exp_date
 
+    await email_queue.join()
+    assert [email.to for email in email_sender.sent] == [register_dto.email] * 2
+    assert ver_code.code in email_sender.sent[0].body
+    assert resented_ver_code.code in email_sender.sent[1].body
+
     user = await user_repo.find_by_id(_id=token.sub)
     user.is_email_verified = True
     await user_repo.update(user)
@@ -113,3 +141,35 @@ async def test_verify_email(
 
     with pytest.raises(EmailIsAlreadyVerified):
         await user_service.verify_email(token, VerifyEmailDTO(code=ver_code.code))
+
+
+@pytest.mark.asyncio
+async def test_verify_email_attempts_limit(user_service: UserService, ver_code_repo: TVerCodeRepo):
+    token = await user_service.register(register_dto)
+    await user_service.send_user_verification_email(token)
+    ver_code = await ver_code_repo.find_by_user_id(token.sub)
+
+    for _ in range(MAX_VERIFICATION_CODE_ATTEMPTS):
+        with pytest.raises(VerCodeIsNotCorrect):
+            await user_service.verify_email(token, VerifyEmailDTO(code=generate_wrong_code(ver_code.code)))
+
+    with pytest.raises(VerCodeIsLocked):
+        await user_service.verify_email(token, VerifyEmailDTO(code=ver_code.code))
+
+    # rejected by the service without db calls
+    with Replace('tests.unit.conftest.TVerCodeRepo.register_attempt', None):
+        with pytest.raises(VerCodeIsLocked):
+            await user_service.verify_email(token, VerifyEmailDTO(code=ver_code.code))
+
+    # a resent code starts over
+    with Replace('app.domain.models.verification_code.datetime', test_datetime(
+            ver_code.issue_date + datetime.timedelta(seconds=VERIFICATION_CODE_RESEND_COOLDOWN_SECONDS + 1)
+    )):
+        await user_service.send_user_verification_email(token)
+    ver_code = await ver_code_repo.find_by_user_id(token.sub)
+    await user_service.verify_email(token, VerifyEmailDTO(code=ver_code.code))
+
+
+def test_generate_six_digit_code():
+    codes = {_generate_six_digit_code() for _ in range(1000)}
+    assert all(len(code) == 6 and code.isdigit() for code in codes)